@@ -1,4 +1,9 @@
+import mimetypes
+import os
 from django.contrib import admin
+from django.http import FileResponse, Http404
+from django.shortcuts import render
+from apps.formulario.middleware import listar_perfiles, ruta_perfil
 from apps.formulario.models import TipoAutorizacion, UsuarioAutorizacion, Autorizacion, HistorialAcciones, HistorialAutorizacion
 
 @admin.register(TipoAutorizacion)
@@ -68,6 +73,7 @@ class AutorizacionAdmin(admin.ModelAdmin):
         'fecha_descarga_pdf'
     )
     raw_id_fields = ('usuario', 'creado_por')
+    list_select_related = ('usuario', 'tipo_autorizacion')
     
     fieldsets = (
         ('Información del Vehículo', {
@@ -101,6 +107,7 @@ class HistorialAccionesAdmin(admin.ModelAdmin):
     list_filter = ('accion', 'fecha_accion')
     search_fields = ('autorizacion__placa', 'creado_por__email', 'accion')
     readonly_fields = ('fecha_creacion', 'fecha_actualizacion', 'fecha_accion')
+    list_select_related = ('autorizacion', 'autorizacion__usuario', 'creado_por')
 
 @admin.register(HistorialAutorizacion)
 class HistorialAutorizacionAdmin(admin.ModelAdmin):
@@ -130,6 +137,12 @@ class HistorialAutorizacionAdmin(admin.ModelAdmin):
         'fecha_actualizacion'
     )
     date_hierarchy = 'fecha_creacion'
+    list_select_related = (
+        'autorizacion',
+        'autorizacion__usuario',
+        'autorizacion__tipo_autorizacion',
+        'creado_por'
+    )
     
     def get_placa(self, obj):
         return obj.autorizacion.placa
@@ -157,4 +170,27 @@ class HistorialAutorizacionAdmin(admin.ModelAdmin):
     
     def has_change_permission(self, request, obj=None):
         # No permitir editar desde el admin
-        return False
\ No newline at end of file
+        return False
+
+
+# ============================================================================
+# PERFILES DE REQUESTS (PerfilamientoMiddleware)
+# ============================================================================
+
+def perfiles_index(request):
+    """Índice de perfiles guardados en PERFILAMIENTO_DIR"""
+    context = {
+        **admin.site.each_context(request),
+        'title': 'Perfiles de requests',
+        'perfiles': listar_perfiles(),
+    }
+    return render(request, 'admin/perfiles.html', context)
+
+
+def perfil_archivo(request, nombre):
+    """Sirve un archivo de perfil (.html, .txt, .json en línea; .prof como descarga)"""
+    ruta = ruta_perfil(nombre)
+    if ruta is None or not os.path.exists(ruta):
+        raise Http404('Perfil no encontrado')
+    tipo = mimetypes.guess_type(ruta)[0] or 'application/octet-stream'
+    return FileResponse(open(ruta, 'rb'), content_type=tipo, as_attachment=nombre.endswith('.prof'))
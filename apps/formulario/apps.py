@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class FormularioConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.formulario'
+
+    def ready(self):
+        from apps.formulario.consultas_lentas import instalar_registro
+        from apps.formulario.middleware import instalar_observador
+        from apps.formulario import verificacion  # noqa: F401 (invalidación de la caché)
+        from apps.formulario import escaneos  # noqa: F401 (vaciado del buffer de escaneos)
+        connection_created.connect(instalar_registro, dispatch_uid='formulario_consultas_lentas')
+        connection_created.connect(instalar_observador, dispatch_uid='formulario_observador_consultas')
@@ -0,0 +1,143 @@
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import re
+import time
+from contextvars import ContextVar
+from datetime import datetime
+from django.conf import settings
+from django.db import transaction
+from apps.formulario.middleware import MiddlewareHibrido
+
+logger = logging.getLogger('apps.formulario.consultas_lentas')
+
+# Vista que originó las consultas del request en curso
+_vista_actual = ContextVar('vista_actual', default=None)
+# Evita registrar (y volver a explicar) las consultas EXPLAIN propias
+_explicando = ContextVar('explicando', default=False)
+
+# ============================================================================
+# HUELLA DE SQL
+# ============================================================================
+
+_LITERAL_TEXTO = re.compile(r"'(?:[^']|'')*'")
+_LITERAL_NUMERO = re.compile(r'\b\d+(?:\.\d+)?\b')
+_LISTA_IN = re.compile(r'\bIN\s*\((?:\s*\?\s*,?)+\)', re.I)
+_ESPACIOS = re.compile(r'\s+')
+
+
+def normalizar_sql(sql):
+    """Reemplaza literales y parámetros por ? y colapsa listas IN y espacios"""
+    sql = _LITERAL_TEXTO.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _LITERAL_NUMERO.sub('?', sql)
+    sql = _LISTA_IN.sub('IN (...)', sql)
+    return _ESPACIOS.sub(' ', sql).strip()
+
+
+def huella_sql(sql):
+    """Identificador corto de la forma de una consulta, independiente de sus valores"""
+    return hashlib.md5(normalizar_sql(sql).encode()).hexdigest()[:12]
+
+
+# ============================================================================
+# REGISTRO DE CONSULTAS LENTAS
+# ============================================================================
+
+def _sentencia_explain(vendor):
+    if vendor == 'postgresql':
+        return 'EXPLAIN (ANALYZE, BUFFERS) '
+    if vendor == 'sqlite':
+        return 'EXPLAIN QUERY PLAN '
+    return 'EXPLAIN '
+
+
+def explicar(connection, sql, params):
+    """Plan de ejecución de una consulta SELECT (con ANALYZE en PostgreSQL)"""
+    token = _explicando.set(True)
+    try:
+        # En un savepoint: en PostgreSQL un EXPLAIN fallido abortaría la
+        # transacción del request y todas sus consultas siguientes
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(_sentencia_explain(connection.vendor) + sql, params)
+            return '\n'.join(' '.join(str(v) for v in fila) for fila in cursor.fetchall())
+    except Exception as e:  # el plan es informativo: nunca debe romper el request
+        return f'EXPLAIN falló: {e}'
+    finally:
+        _explicando.reset(token)
+
+
+class RegistroConsultasLentas:
+    """execute_wrapper que registra las consultas que superan CONSULTAS_LENTAS_UMBRAL_MS"""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __call__(self, execute, sql, params, many, context):
+        if _explicando.get():
+            return execute(sql, params, many, context)
+
+        inicio = time.perf_counter()
+        resultado = execute(sql, params, many, context)
+        duracion = (time.perf_counter() - inicio) * 1000
+
+        if duracion >= settings.CONSULTAS_LENTAS_UMBRAL_MS:
+            plan = None
+            if (settings.CONSULTAS_LENTAS_EXPLAIN and not many
+                    and sql.lstrip()[:6].upper() == 'SELECT'
+                    and not self.connection.needs_rollback):
+                plan = explicar(self.connection, sql, params)
+            logger.warning(json.dumps({
+                'fecha': datetime.now().isoformat(timespec='seconds'),
+                'ms': round(duracion, 2),
+                'vista': _vista_actual.get(),
+                'alias': self.connection.alias,
+                'huella': huella_sql(sql),
+                'sql': sql,
+                'plan': plan,
+            }))
+        return resultado
+
+
+class ArchivoConsultasLentas(logging.handlers.WatchedFileHandler):
+    """Handler del registro (LOGGING): crea el directorio al escribir la primera entrada"""
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+
+def instalar_registro(sender, connection, **kwargs):
+    """Receptor de connection_created: agrega el registro a cada conexión nueva"""
+    if settings.CONSULTAS_LENTAS_UMBRAL_MS and not any(
+        isinstance(w, RegistroConsultasLentas) for w in connection.execute_wrappers
+    ):
+        # Al principio de la lista: la conexión puede abrirse dentro de un
+        # execute_wrapper() activo, que al salir quita el último elemento
+        connection.execute_wrappers.insert(0, RegistroConsultasLentas(connection))
+
+
+class ConsultasLentasMiddleware(MiddlewareHibrido):
+    """Asocia las consultas del request con el nombre de la vista que las originó"""
+
+    def __call__(self, request):
+        if self.asincrono:
+            return self.__acall__(request)
+        token = _vista_actual.set(request.path)
+        try:
+            return self.get_response(request)
+        finally:
+            _vista_actual.reset(token)
+
+    async def __acall__(self, request):
+        token = _vista_actual.set(request.path)
+        try:
+            return await self.get_response(request)
+        finally:
+            _vista_actual.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.resolver_match:
+            _vista_actual.set(request.resolver_match.view_name)
@@ -0,0 +1,136 @@
+import atexit
+import ipaddress
+import logging
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import DatabaseError, connection
+from django.dispatch import receiver
+from django.utils import timezone
+from apps.formulario.limites import ip_cliente
+from apps.formulario.models import EventoEscaneo
+from apps.formulario.utils import validar_autorizacion_caducada
+from apps.formulario.verificacion import qr_completo
+
+logger = logging.getLogger(__name__)
+
+# El request en curso registró un escaneo (ver vaciar_buffer)
+_registro = ContextVar('registro_escaneo', default=False)
+
+# ============================================================================
+# EVENTOS DE ESCANEO (buffer por proceso, escritura por lotes)
+# ============================================================================
+
+class BufferEscaneos:
+    """
+    Buffer circular de eventos de escaneo del proceso. verificar_qr solo agrega
+    a memoria; el lote se inserta con bulk_create al terminar un request de
+    verificación (request_finished, con la respuesta ya enviada) cuando junta ESCANEOS_LOTE
+    eventos o pasaron ESCANEOS_INTERVALO segundos. Si la BD no da abasto el
+    buffer descarta los más antiguos en vez de crecer.
+    """
+
+    def __init__(self, tamano, lote, intervalo):
+        self.eventos = deque(maxlen=tamano)
+        self.lote = lote
+        self.intervalo = intervalo
+        self.descartados = 0
+        self._lock = threading.Lock()
+        self._ultimo_vaciado = time.monotonic()
+
+    def registrar(self, resultado, autorizacion_id=None, tipo_autorizacion_id=None, ip=None):
+        evento = (timezone.now(), autorizacion_id, tipo_autorizacion_id, resultado, ip)
+        with self._lock:
+            if len(self.eventos) == self.eventos.maxlen:
+                self.descartados += 1
+            self.eventos.append(evento)
+
+    def pendiente(self):
+        return len(self.eventos) >= self.lote or bool(
+            self.eventos and time.monotonic() - self._ultimo_vaciado >= self.intervalo
+        )
+
+    def descartar(self):
+        """Vacía el buffer sin escribir (tests)"""
+        with self._lock:
+            self.eventos.clear()
+            self.descartados = 0
+            self._ultimo_vaciado = time.monotonic()
+
+    def vaciar(self):
+        """Inserta los eventos acumulados; retorna cuántos se guardaron"""
+        with self._lock:
+            eventos = list(self.eventos)
+            self.eventos.clear()
+            descartados, self.descartados = self.descartados, 0
+            self._ultimo_vaciado = time.monotonic()
+
+        if descartados:
+            logger.warning('Buffer de escaneos lleno: %s eventos descartados', descartados)
+        if not eventos:
+            return 0
+        try:
+            EventoEscaneo.objects.bulk_create([
+                EventoEscaneo(fecha=fecha, autorizacion_id=autorizacion_id, tipo_autorizacion_id=tipo_id,
+                              resultado=resultado, ip=ip)
+                for fecha, autorizacion_id, tipo_id, resultado, ip in eventos
+            ], batch_size=1000)
+        except DatabaseError as e:  # las analíticas nunca deben romper un request
+            logger.error('No se pudieron guardar %s eventos de escaneo: %s', len(eventos), e)
+            return 0
+        return len(eventos)
+
+
+buffer = BufferEscaneos(settings.ESCANEOS_BUFFER, settings.ESCANEOS_LOTE, settings.ESCANEOS_INTERVALO)
+
+
+def _ip_valida(ip):
+    try:
+        return str(ipaddress.ip_address(ip))
+    except ValueError:
+        return None
+
+
+def registrar_escaneo(request, qr, datos, error):
+    """Agrega al buffer el resultado de una verificación (sin tocar la BD)"""
+    if not settings.ESCANEOS_ACTIVO:
+        return
+    if error is not None:
+        resultado = 'error'
+    elif not qr_completo(qr):
+        resultado = 'incompleta'
+    elif not datos:
+        resultado = 'no_encontrada'
+    else:
+        resultado = 'caducada' if validar_autorizacion_caducada(datos['vigencia']) else 'vigente'
+    _registro.set(True)
+    buffer.registrar(
+        resultado,
+        datos.get('id') if datos else None,
+        datos.get('tipo_autorizacion_id') if datos else None,
+        _ip_valida(ip_cliente(request)),
+    )
+
+
+@receiver(request_finished, dispatch_uid='escaneos_vaciar_buffer')
+def vaciar_buffer(sender, **kwargs):
+    # Solo los requests que registraron un escaneo pagan la escritura
+    if _registro.get():
+        _registro.set(False)
+        if buffer.pendiente():
+            buffer.vaciar()
+
+
+@atexit.register
+def _vaciar_al_salir():
+    if not buffer.eventos:
+        return
+    try:
+        # Sin la tabla (BD de tests ya destruida, migraciones pendientes) no hay dónde escribir
+        if EventoEscaneo._meta.db_table in connection.introspection.table_names():
+            buffer.vaciar()
+    except Exception:  # el intérprete puede estar cerrándose sin BD disponible
+        pass
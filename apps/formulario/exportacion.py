@@ -0,0 +1,82 @@
+import csv
+import io
+from itertools import islice
+from django.conf import settings
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow es opcional: sin él solo se exporta xlsx y csv
+    pa = pq = None
+
+# ============================================================================
+# FORMATOS DE EXPORTACIÓN DEL HISTORIAL
+# ============================================================================
+
+# Columnas de la proyección de filas (ver proyectar_historial): nombre en los
+# formatos columnares y encabezado en CSV/Excel
+COLUMNAS = [
+    ('fecha_emision', 'Fecha de Emisión'),
+    ('vigencia', 'Fecha de Vigencia'),
+    ('tipo_autorizacion', 'Tipo de Autorización'),
+    ('placa', 'Placa'),
+    ('usuario', 'Usuario Autorizado'),
+    ('numero_autorizacion', 'Número de Autorización'),
+    ('estado', 'Estado'),
+]
+
+FORMATOS_COLUMNARES = {
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'arrow': ('arrow', 'application/vnd.apache.arrow.file'),
+}
+
+
+def _filas_csv(filas):
+    for fecha, vigencia, *resto in filas:
+        yield fecha.date().isoformat(), fecha.time().isoformat('seconds'), vigencia.isoformat(), *resto
+
+
+def csv_por_partes(filas, filas_por_parte=1000):
+    """
+    Genera el CSV en partes de `filas_por_parte` filas para StreamingHttpResponse:
+    memoria constante y el primer byte sale antes de leer todo el historial.
+    La fecha de emisión se separa en fecha y hora (ISO) como en el Excel.
+    """
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    # BOM: Excel abre el archivo como UTF-8 (tildes y ñ)
+    buffer.write('\ufeff')
+    escritor.writerow(['Fecha de Emisión', 'Hora', *(encabezado for _, encabezado in COLUMNAS[1:])])
+    filas = _filas_csv(filas)
+    while True:
+        escritor.writerows(islice(filas, filas_por_parte))
+        parte = buffer.getvalue()
+        if not parte:
+            return
+        yield parte
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def esquema_arrow():
+    return pa.schema([
+        ('fecha_emision', pa.timestamp('us', tz=settings.TIME_ZONE)),
+        ('vigencia', pa.date32()),
+        *((nombre, pa.string()) for nombre, _ in COLUMNAS[2:]),
+    ])
+
+
+def escribir_columnar(filas, formato, archivo, filas_por_lote=50000):
+    """
+    Escribe las filas en `archivo` como Parquet o Arrow IPC, por lotes de
+    `filas_por_lote`: la memoria depende del lote, no del total de filas.
+    """
+    esquema = esquema_arrow()
+    if formato == 'parquet':
+        escritor = pq.ParquetWriter(archivo, esquema)
+    else:
+        escritor = pa.ipc.new_file(archivo, esquema)
+    with escritor:
+        filas = iter(filas)
+        while lote := list(islice(filas, filas_por_lote)):
+            escritor.write_table(pa.Table.from_arrays([list(columna) for columna in zip(*lote)], schema=esquema))
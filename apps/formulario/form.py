@@ -418,7 +418,7 @@ class FormularioCompletoQRForm(forms.Form):
         vigencia = self.cleaned_data.get('vigencia')
         if vigencia:
             from django.utils import timezone
-            hoy = timezone.now().date()
+            hoy = timezone.localdate()
             if vigencia < hoy:
                 raise forms.ValidationError('La fecha de vigencia no puede ser anterior a la fecha actual.')
         return vigencia
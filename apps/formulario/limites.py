@@ -0,0 +1,71 @@
+import math
+import time
+from django.conf import settings
+from django.core.cache import caches
+
+# ============================================================================
+# LÍMITES DE FRECUENCIA (ventana deslizante sobre la caché compartida)
+# ============================================================================
+
+# Contadores por clave y ventana; con CACHE_BACKEND=redis o file los comparten
+# todos los workers
+cache_limites = caches['limites']
+
+
+def ip_cliente(request):
+    """
+    IP del cliente. Detrás de PROXIES_CONFIABLES proxies se toma de
+    X-Forwarded-For la que agregó el más externo (las anteriores las puede
+    inventar el cliente).
+    """
+    if settings.PROXIES_CONFIABLES:
+        reenviadas = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+        if len(reenviadas) >= settings.PROXIES_CONFIABLES:
+            return reenviadas[-settings.PROXIES_CONFIABLES]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def _ventanas(clave, ventana):
+    """Claves de la ventana actual y la anterior, y fracción transcurrida de la actual"""
+    ahora = time.time()
+    numero = int(ahora // ventana)
+    return f'{clave}:{numero}', f'{clave}:{numero - 1}', (ahora % ventana) / ventana
+
+
+def _excedido(cuenta, anterior, transcurrido, limite, ventana):
+    """
+    Segundos a esperar si se excedió el límite, o 0. Estima los requests de
+    los últimos `ventana` segundos como los de la ventana actual más la parte
+    de la anterior que todavía cae dentro.
+    """
+    if cuenta + (anterior or 0) * (1 - transcurrido) <= limite:
+        return 0
+    return math.ceil(ventana * (1 - transcurrido))
+
+
+def registrar(clave, limite, ventana):
+    """Cuenta un request para `clave`; retorna los segundos de espera si excede `limite` (0 si no)"""
+    if not limite:
+        return 0
+    actual, anterior, transcurrido = _ventanas(clave, ventana)
+    cache_limites.add(actual, 0, timeout=2 * ventana)
+    try:
+        cuenta = cache_limites.incr(actual)
+    except ValueError:  # expiró entre add e incr
+        cache_limites.set(actual, 1, timeout=2 * ventana)
+        cuenta = 1
+    return _excedido(cuenta, cache_limites.get(anterior), transcurrido, limite, ventana)
+
+
+async def aregistrar(clave, limite, ventana):
+    """Versión asíncrona de registrar"""
+    if not limite:
+        return 0
+    actual, anterior, transcurrido = _ventanas(clave, ventana)
+    await cache_limites.aadd(actual, 0, timeout=2 * ventana)
+    try:
+        cuenta = await cache_limites.aincr(actual)
+    except ValueError:
+        await cache_limites.aset(actual, 1, timeout=2 * ventana)
+        cuenta = 1
+    return _excedido(cuenta, await cache_limites.aget(anterior), transcurrido, limite, ventana)
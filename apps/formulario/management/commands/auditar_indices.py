@@ -0,0 +1,177 @@
+import json
+import re
+from collections import defaultdict
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+# "tabla"."columna" seguido de un operador de filtro
+_FILTRO = re.compile(
+    r'"(\w+)"\."(\w+)"\s*(=|<>|!=|<=|>=|<|>|IN\b|LIKE\b|IS\b|BETWEEN\b)', re.I
+)
+_ORDEN = re.compile(r'"(\w+)"\."(\w+)"\s*(ASC|DESC)', re.I)
+_CLAUSULA_WHERE = re.compile(r'\bWHERE\b(.*?)(?:\bGROUP BY\b|\bORDER BY\b|\bLIMIT\b|$)', re.I | re.S)
+_CLAUSULA_ORDER = re.compile(r'\bORDER BY\b(.*?)(?:\bLIMIT\b|\bOFFSET\b|$)', re.I | re.S)
+_IGUALDAD = {'=', 'IN', 'IS'}
+
+
+def forma_consulta(sql):
+    """
+    Columnas de filtro (igualdad y rango) y de orden por tabla de una consulta
+    generada por el ORM: {tabla: {'igualdad': [...], 'rango': [...], 'orden': [...]}}
+    """
+    formas = defaultdict(lambda: {'igualdad': [], 'rango': [], 'orden': []})
+    where = _CLAUSULA_WHERE.search(sql)
+    if where:
+        for tabla, columna, operador in _FILTRO.findall(where.group(1)):
+            clave = 'igualdad' if operador.upper() in _IGUALDAD else 'rango'
+            if columna not in formas[tabla][clave]:
+                formas[tabla][clave].append(columna)
+    orden = _CLAUSULA_ORDER.search(sql)
+    if orden:
+        for tabla, columna, _ in _ORDEN.findall(orden.group(1)):
+            if columna not in formas[tabla]['orden']:
+                formas[tabla]['orden'].append(columna)
+    return formas
+
+
+def proponer_indice(forma):
+    """Columnas del índice compuesto: igualdad, luego un rango o, si no hay, el orden"""
+    columnas = list(forma['igualdad'])
+    if forma['rango']:
+        columnas.append(forma['rango'][0])
+    else:
+        columnas += [c for c in forma['orden'] if c not in columnas]
+    return tuple(c for c in columnas if c != 'id')
+
+
+class Command(BaseCommand):
+    help = (
+        'Audita los índices: propone índices compuestos a partir de las consultas lentas '
+        'registradas y detecta índices redundantes'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--archivo', help='Registro de consultas lentas (default: CONSULTAS_LENTAS_ARCHIVO)')
+        parser.add_argument('--minimo', type=int, default=1,
+                            help='Apariciones mínimas de una forma para proponer índice (default: 1)')
+        parser.add_argument('--json', action='store_true', help='Salida en JSON')
+
+    def handle(self, *args, **options):
+        tablas = {m._meta.db_table for m in apps.get_app_config('formulario').get_models()}
+        indices = self._indices_existentes(tablas)
+
+        reporte = {
+            'propuestas': self._propuestas(options['archivo'] or settings.CONSULTAS_LENTAS_ARCHIVO,
+                                           tablas, indices, options['minimo']),
+            'redundantes': self._redundantes(indices),
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(reporte, indent=2, ensure_ascii=False))
+            return
+        self._imprimir(reporte)
+
+    def _indices_existentes(self, tablas):
+        """{tabla: [(nombre, columnas, unico, parcial)]} según la base de datos y los modelos"""
+        parciales = {
+            indice.name
+            for modelo in apps.get_app_config('formulario').get_models()
+            for indice in modelo._meta.indexes if indice.condition is not None
+        }
+        indices = {}
+        with connection.cursor() as cursor:
+            for tabla in sorted(tablas):
+                restricciones = connection.introspection.get_constraints(cursor, tabla)
+                indices[tabla] = [
+                    (nombre, tuple(datos['columns']), bool(datos['unique'] or datos['primary_key']), nombre in parciales)
+                    for nombre, datos in restricciones.items()
+                    if (datos['index'] or datos['unique'] or datos['primary_key']) and datos['columns']
+                ]
+        return indices
+
+    def _propuestas(self, archivo, tablas, indices, minimo):
+        conteo = defaultdict(lambda: {'apariciones': 0, 'total_ms': 0.0, 'vistas': set()})
+        try:
+            with open(archivo, encoding='utf-8') as f:
+                entradas = [json.loads(linea) for linea in f if linea.strip()]
+        except FileNotFoundError:
+            self.stderr.write(self.style.WARNING(f'Sin registro de consultas lentas en {archivo}'))
+            entradas = []
+
+        for entrada in entradas:
+            for tabla, forma in forma_consulta(entrada['sql']).items():
+                columnas = proponer_indice(forma)
+                if tabla not in tablas or not columnas or self._cubierta(indices[tabla], forma, columnas):
+                    continue
+                datos = conteo[(tabla, columnas)]
+                datos['apariciones'] += 1
+                datos['total_ms'] += entrada['ms']
+                if entrada.get('vista'):
+                    datos['vistas'].add(entrada['vista'])
+
+        propuestas = []
+        for (tabla, columnas), datos in conteo.items():
+            if datos['apariciones'] < minimo:
+                continue
+            propuestas.append({
+                'tabla': tabla,
+                'columnas': list(columnas),
+                'apariciones': datos['apariciones'],
+                'total_ms': round(datos['total_ms'], 2),
+                'vistas': sorted(datos['vistas']),
+                'parecidos': [n for n, cols, _, _ in indices[tabla] if cols[0] == columnas[0]],
+            })
+        return sorted(propuestas, key=lambda p: p['total_ms'], reverse=True)
+
+    def _cubierta(self, indices, forma, columnas):
+        """Un índice no parcial empieza con las columnas propuestas, o uno único
+        sobre columnas de igualdad ya deja una sola fila"""
+        for _, cols, unico, parcial in indices:
+            if parcial:
+                continue
+            if cols[:len(columnas)] == columnas or (unico and set(cols) <= set(forma['igualdad'])):
+                return True
+        return False
+
+    def _redundantes(self, indices):
+        """Índices no únicos cuyas columnas son prefijo de otro índice (o lo duplican)"""
+        redundantes = []
+        for tabla, lista in indices.items():
+            marcados = set()
+            for nombre, columnas, unico, parcial in lista:
+                if unico or parcial:
+                    continue
+                for otro, otras, _, otro_parcial in lista:
+                    if otro == nombre or otro_parcial or otras[:len(columnas)] != columnas:
+                        continue
+                    # De dos índices idénticos se informa solo uno
+                    if otras == columnas and otro in marcados:
+                        continue
+                    marcados.add(nombre)
+                    redundantes.append({
+                        'tabla': tabla, 'indice': nombre, 'columnas': list(columnas), 'cubierto_por': otro,
+                    })
+                    break
+        return redundantes
+
+    def _imprimir(self, reporte):
+        self.stdout.write(self.style.SUCCESS('=' * 60))
+        self.stdout.write(self.style.SUCCESS('AUDITORÍA DE ÍNDICES'))
+        self.stdout.write(self.style.SUCCESS('=' * 60))
+
+        self.stdout.write(f'\nÍndices propuestos ({len(reporte["propuestas"])}):')
+        for p in reporte['propuestas']:
+            self.stdout.write(self.style.WARNING(
+                f'  {p["tabla"]} ({", ".join(p["columnas"])}): {p["apariciones"]} consultas, {p["total_ms"]}ms'
+            ))
+            if p['vistas']:
+                self.stdout.write(f'    Vistas: {", ".join(p["vistas"])}')
+            if p['parecidos']:
+                self.stdout.write(f'    Índices con la misma primera columna: {", ".join(p["parecidos"])}')
+
+        self.stdout.write(f'\nÍndices redundantes ({len(reporte["redundantes"])}):')
+        for r in reporte['redundantes']:
+            self.stdout.write(self.style.WARNING(
+                f'  {r["tabla"]}.{r["indice"]} ({", ".join(r["columnas"])}) cubierto por {r["cubierto_por"]}'
+            ))
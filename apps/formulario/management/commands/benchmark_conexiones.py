@@ -0,0 +1,147 @@
+import statistics
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from django.test import Client
+from django.urls import reverse
+from apps.formulario.models import Autorizacion
+from apps.security.models import User
+
+class Command(BaseCommand):
+    help = 'Compara la latencia por request con y sin conexiones persistentes / pool de conexiones'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=200,
+            help='Cantidad de requests por escenario (default: 200)'
+        )
+        parser.add_argument(
+            '--vista',
+            choices=['verificar_qr', 'get_tipos_autorizacion'],
+            default='verificar_qr',
+            help='Vista a medir (default: verificar_qr)'
+        )
+        parser.add_argument(
+            '--max-age',
+            type=int,
+            default=60,
+            help='CONN_MAX_AGE del escenario persistente (default: 60)'
+        )
+
+    def handle(self, *args, **options):
+        conexion = connections['default']
+        original = {
+            'CONN_MAX_AGE': conexion.settings_dict['CONN_MAX_AGE'],
+            'CONN_HEALTH_CHECKS': conexion.settings_dict['CONN_HEALTH_CHECKS'],
+            'OPTIONS': dict(conexion.settings_dict['OPTIONS']),
+        }
+
+        sin_pool = {k: v for k, v in original['OPTIONS'].items() if k != 'pool'}
+        escenarios = [
+            ('Sin persistencia (CONN_MAX_AGE=0)', {
+                'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False, 'OPTIONS': sin_pool,
+            }),
+            (f'Persistente (CONN_MAX_AGE={options["max_age"]}, health checks)', {
+                'CONN_MAX_AGE': options['max_age'], 'CONN_HEALTH_CHECKS': True, 'OPTIONS': sin_pool,
+            }),
+        ]
+        if self._pool_disponible(conexion):
+            escenarios.append(('Pool psycopg', {
+                'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False,
+                'OPTIONS': {**sin_pool, 'pool': original['OPTIONS'].get('pool') or True},
+            }))
+        else:
+            self.stdout.write(self.style.WARNING(
+                'Pool omitido: requiere PostgreSQL con psycopg 3 y psycopg_pool instalados.'
+            ))
+
+        client, url, params = self._preparar_request(options['vista'])
+
+        self.stdout.write(self.style.SUCCESS('\n' + '='*60))
+        self.stdout.write(self.style.SUCCESS(
+            f'BENCHMARK DE CONEXIONES - {options["vista"]} ({conexion.vendor}, {options["requests"]} requests)'
+        ))
+        self.stdout.write(self.style.SUCCESS('-'*60))
+
+        try:
+            for nombre, config in escenarios:
+                self._aplicar(conexion, config)
+                tiempos = self._medir(client, url, params, options['requests'])
+                self.stdout.write(self.style.SUCCESS(f'  {nombre}'))
+                self.stdout.write(
+                    f'    p50={self._ms(statistics.median(tiempos))}  '
+                    f'p95={self._ms(self._percentil(tiempos, 95))}  '
+                    f'media={self._ms(statistics.fmean(tiempos))}'
+                )
+        finally:
+            self._aplicar(conexion, original)
+
+        self.stdout.write(self.style.SUCCESS('='*60 + '\n'))
+
+    def _pool_disponible(self, conexion):
+        if conexion.vendor != 'postgresql':
+            return False
+        try:
+            import psycopg  # noqa: F401
+            import psycopg_pool  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def _preparar_request(self, vista):
+        # Host permitido con DEBUG=True y ALLOWED_HOSTS vacío
+        client = Client(HTTP_HOST='localhost')
+        url = reverse(f'formulario:{vista}')
+
+        if vista == 'get_tipos_autorizacion':
+            usuario = User.objects.filter(is_active=True).order_by('pk').first()
+            if usuario is None:
+                raise CommandError('Se necesita al menos un usuario activo para medir la API')
+            client.force_login(usuario)
+            return client, url, {}
+
+        # Parámetros de un QR real si hay autorizaciones; si no, un QR inexistente (igual consulta la BD)
+        autorizacion = Autorizacion.objects.select_related('usuario').order_by('pk').first()
+        if autorizacion:
+            params = {
+                'p': autorizacion.placa,
+                'n': autorizacion.usuario.nombres[:15],
+                'a': autorizacion.numero_autorizacion,
+                'c': autorizacion.vigencia.isoformat(),
+            }
+        else:
+            params = {'p': 'ABC1234', 'n': 'Benchmark', 'a': 'ACT-BENCH-000', 'c': '2030-01-01'}
+        return client, url, params
+
+    def _aplicar(self, conexion, config):
+        """Cierra la conexión (y el pool) y aplica la configuración del escenario"""
+        conexion.close()
+        if hasattr(conexion, 'close_pool'):
+            conexion.close_pool()
+        conexion.settings_dict.update(
+            CONN_MAX_AGE=config['CONN_MAX_AGE'],
+            CONN_HEALTH_CHECKS=config['CONN_HEALTH_CHECKS'],
+            OPTIONS=dict(config['OPTIONS']),
+        )
+
+    def _medir(self, client, url, params, cantidad):
+        # El test Client no emite el cierre de conexiones de request_started/finished;
+        # se replica con close_old_connections() como en un servidor real.
+        tiempos = []
+        for _ in range(cantidad):
+            inicio = time.perf_counter()
+            close_old_connections()
+            response = client.get(url, params)
+            close_old_connections()
+            tiempos.append(time.perf_counter() - inicio)
+            if response.status_code != 200:
+                raise CommandError(f'{url} respondió {response.status_code}')
+        return tiempos
+
+    def _percentil(self, valores, percentil):
+        return statistics.quantiles(valores, n=100)[percentil - 1] if len(valores) > 1 else valores[0]
+
+    def _ms(self, segundos):
+        return f'{segundos * 1000:.2f}ms'
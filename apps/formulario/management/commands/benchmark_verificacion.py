@@ -0,0 +1,199 @@
+import asyncio
+import io
+import json
+import platform
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from urllib.parse import urlsplit
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import AsyncClient, Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import path
+from django.utils import timezone
+from apps.formulario.management.commands.benchmark_vistas import caches_en_memoria
+from apps.formulario.models import Autorizacion
+from apps.formulario.views.qr_code import VerificarQRAsyncView, VerificarQRView
+
+
+class RutasVerificacion:
+    """URLconf del proyecto con `vista` atendiendo /verificar-qr/ (sin depender de VERIFICACION_ASINCRONA)"""
+
+    def __init__(self, vista):
+        self.urlpatterns = [
+            path('verificar-qr/', vista.as_view()),
+            *import_module(settings.ROOT_URLCONF).urlpatterns,
+        ]
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara el throughput de verificar_qr servido con WSGI (VerificarQRView, un hilo por '
+        'request concurrente) y con ASGI (VerificarQRAsyncView, asyncio) en una base de prueba temporal'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--autorizaciones', type=int, default=1000,
+                            help='Autorizaciones generadas (default: 1000)')
+        parser.add_argument('--requests', type=int, default=1000, help='Requests por corrida (default: 1000)')
+        parser.add_argument('--concurrencia', default='1,10,50',
+                            help='Requests simultáneos separados por coma (default: 1,10,50)')
+        parser.add_argument('--semilla', type=int, default=42, help='Semilla de los datos (default: 42)')
+        parser.add_argument('--sin-cache', action='store_true',
+                            help='Vaciar la caché de verificación antes de cada request (mide solo la BD)')
+        parser.add_argument('--salida', help='Archivo JSON donde guardar los resultados')
+
+    def handle(self, *args, **options):
+        niveles = [int(c) for c in options['concurrencia'].split(',') if c.strip()]
+        self.sin_cache = options['sin_cache']
+
+        setup_test_environment()
+        # Cachés propias en memoria y, como todos los requests salen de la misma
+        # IP, sin límites de frecuencia
+        aislado = override_settings(CACHES=caches_en_memoria(), VERIFICACION_LIMITE_IP=0, VERIFICACION_LIMITE_QR=0)
+        aislado.enable()
+        nombre_original = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            rutas = self._preparar_datos(options['autorizaciones'], options['semilla'], options['requests'])
+            resultados = []
+            for concurrencia in niveles:
+                for servidor, medir in (('wsgi', self._medir_wsgi), ('asgi', self._medir_asgi)):
+                    caches['verificacion'].clear()
+                    resultado = medir(rutas, concurrencia)
+                    resultado.update(servidor=servidor, concurrencia=concurrencia)
+                    resultados.append(resultado)
+                    self._imprimir(resultado)
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(nombre_original, verbosity=0)
+            aislado.disable()
+            teardown_test_environment()
+
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                json.dump({
+                    'fecha': timezone.now().isoformat(),
+                    'motor': connection.vendor,
+                    'python': platform.python_version(),
+                    'cache': not self.sin_cache,
+                    'resultados': resultados,
+                }, archivo, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Resultados guardados en {options["salida"]}'))
+
+    def _preparar_datos(self, cantidad, semilla, requests):
+        call_command(
+            'generar_datos_prueba',
+            usuarios=max(1, cantidad // 5),
+            autorizaciones=cantidad,
+            historial=0,
+            acciones=0,
+            semilla=semilla,
+            stdout=io.StringIO(),
+        )
+        qrs = list(Autorizacion.objects.filter(activo=True).order_by('pk').values_list('codigo_qr', flat=True))
+        if not qrs:
+            raise CommandError('No se generaron autorizaciones activas')
+        # codigo_qr guarda la URL absoluta: se reutiliza solo la ruta y los parámetros
+        rutas = [f'{partes.path}?{partes.query}' for partes in map(urlsplit, qrs)]
+        self.stdout.write(self.style.SUCCESS(
+            f'Dataset: {cantidad} autorizaciones, {requests} requests por corrida, motor {connection.vendor}'
+        ))
+        return [rutas[i % len(rutas)] for i in range(requests)]
+
+    # ------------------------------------------------------------------
+    # Corridas
+    # ------------------------------------------------------------------
+
+    def _medir_wsgi(self, rutas, concurrencia):
+        pendientes = iter(rutas)
+        lock = threading.Lock()
+        tiempos, errores = [], []
+
+        def trabajador():
+            client = Client()
+            try:
+                while True:
+                    with lock:
+                        ruta = next(pendientes, None)
+                    if ruta is None:
+                        return
+                    if self.sin_cache:
+                        caches['verificacion'].clear()
+                    inicio = time.perf_counter()
+                    response = client.get(ruta)
+                    self._registrar(response, time.perf_counter() - inicio, tiempos, errores)
+            finally:
+                connections.close_all()
+
+        with override_settings(ROOT_URLCONF=RutasVerificacion(VerificarQRView)):
+            inicio = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+                for futuro in [pool.submit(trabajador) for _ in range(concurrencia)]:
+                    futuro.result()
+            duracion = time.perf_counter() - inicio
+        return self._resumen(tiempos, errores, duracion)
+
+    def _medir_asgi(self, rutas, concurrencia):
+        with override_settings(ROOT_URLCONF=RutasVerificacion(VerificarQRAsyncView)):
+            return asyncio.run(self._corrida_asgi(rutas, concurrencia))
+
+    async def _corrida_asgi(self, rutas, concurrencia):
+        pendientes = iter(rutas)
+        tiempos, errores = [], []
+
+        async def trabajador():
+            client = AsyncClient()
+            for ruta in pendientes:
+                if self.sin_cache:
+                    await caches['verificacion'].aclear()
+                inicio = time.perf_counter()
+                response = await client.get(ruta)
+                self._registrar(response, time.perf_counter() - inicio, tiempos, errores)
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(trabajador() for _ in range(concurrencia)))
+        duracion = time.perf_counter() - inicio
+        # Conexiones abiertas por el hilo de sync_to_async del ORM asíncrono
+        await sync_to_async(connections.close_all)()
+        return self._resumen(tiempos, errores, duracion)
+
+    # ------------------------------------------------------------------
+    # Reporte
+    # ------------------------------------------------------------------
+
+    def _registrar(self, response, segundos, tiempos, errores):
+        if response.status_code != 200 or 'NO SE PUDO VERIFICAR' in response.content.decode():
+            errores.append(response.status_code)
+        tiempos.append(segundos)
+
+    def _resumen(self, tiempos, errores, duracion):
+        ordenados = sorted(tiempos)
+
+        def percentil(p):
+            return round(ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))] * 1000, 2)
+
+        return {
+            'requests': len(tiempos),
+            'errores': len(errores),
+            'rps': round(len(tiempos) / duracion, 1) if duracion else 0,
+            'p50_ms': percentil(50),
+            'p95_ms': percentil(95),
+            'p99_ms': percentil(99),
+            'media_ms': round(statistics.mean(tiempos) * 1000, 2),
+        }
+
+    def _imprimir(self, r):
+        estilo = self.style.ERROR if r['errores'] else self.style.SUCCESS
+        self.stdout.write(estilo(
+            f'  {r["servidor"]:<5} concurrencia={r["concurrencia"]:<4} {r["rps"]:>8.1f} req/s  '
+            f'p50={r["p50_ms"]:>8.2f}ms  p95={r["p95_ms"]:>8.2f}ms  p99={r["p99_ms"]:>8.2f}ms  '
+            f'errores={r["errores"]}'
+        ))
@@ -0,0 +1,230 @@
+import io
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+from datetime import timedelta
+from urllib.parse import urlsplit
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+from apps.formulario.management.commands.generar_datos_prueba import cedula_para, placa_para
+from apps.formulario.models import Autorizacion, TipoAutorizacion
+from apps.security.models import User
+
+
+def caches_en_memoria():
+    """CACHES con un LocMemCache propio por alias: el benchmark no toca las cachés reales (Redis/archivo)"""
+    return {
+        alias: {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': f'benchmark-{alias}',
+            'TIMEOUT': configuracion.get('TIMEOUT', 300),
+            'OPTIONS': configuracion.get('OPTIONS', {}),
+        }
+        for alias, configuracion in settings.CACHES.items()
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide latencia (p50/p95), consultas por request y memoria pico de las vistas principales '
+        'sobre datasets generados de tamaño creciente, en una base de datos de prueba temporal'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tamanos', default='100,1000',
+                            help='Cantidades de autorizaciones separadas por coma (default: 100,1000)')
+        parser.add_argument('--repeticiones', type=int, default=20, help='Requests medidos por escenario (default: 20)')
+        parser.add_argument('--semilla', type=int, default=42, help='Semilla de los datos (default: 42)')
+        parser.add_argument('--salida', help='Archivo JSON donde guardar los resultados')
+        parser.add_argument('--comparar', help='JSON de una corrida anterior para detectar regresiones')
+        parser.add_argument('--tolerancia', type=float, default=0.25,
+                            help='Aumento relativo de p95 permitido al comparar (default: 0.25)')
+
+    def handle(self, *args, **options):
+        tamanos = [int(t) for t in options['tamanos'].split(',') if t.strip()]
+        self.repeticiones = options['repeticiones']
+
+        setup_test_environment()
+        # Cachés propias en memoria y, como todos los requests salen de la misma
+        # IP, sin límites de frecuencia
+        aislado = override_settings(CACHES=caches_en_memoria(), VERIFICACION_LIMITE_IP=0, VERIFICACION_LIMITE_QR=0)
+        aislado.enable()
+        nombre_original = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            resultados = []
+            for tamano in tamanos:
+                self._preparar_datos(tamano, options['semilla'])
+                for escenario, funcion, repeticiones in self._escenarios():
+                    resultado = self._medir(funcion, repeticiones)
+                    resultado.update(tamano=tamano, escenario=escenario)
+                    resultados.append(resultado)
+                    self._imprimir(resultado)
+        finally:
+            connection.creation.destroy_test_db(nombre_original, verbosity=0)
+            aislado.disable()
+            teardown_test_environment()
+
+        corrida = {
+            'fecha': timezone.now().isoformat(),
+            'motor': connection.vendor,
+            'python': platform.python_version(),
+            'repeticiones': self.repeticiones,
+            'resultados': resultados,
+        }
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                json.dump(corrida, archivo, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Resultados guardados en {options["salida"]}'))
+
+        if options['comparar']:
+            self._comparar(corrida, options['comparar'], options['tolerancia'])
+
+    # ------------------------------------------------------------------
+    # Datos y escenarios
+    # ------------------------------------------------------------------
+
+    def _preparar_datos(self, tamano, semilla):
+        call_command('flush', interactive=False, verbosity=0)
+        for alias in caches:
+            caches[alias].clear()
+        call_command(
+            'generar_datos_prueba',
+            usuarios=max(1, tamano // 5),
+            autorizaciones=tamano,
+            historial=tamano * 2,
+            acciones=tamano * 2,
+            semilla=semilla,
+            stdout=io.StringIO(),
+        )
+        self.admin = User.objects.create_superuser(
+            username='benchmark', email='benchmark@example.com', password=None, names='Benchmark'
+        )
+        self.client = Client()
+        self.client.force_login(self.admin)
+        self.tipo = TipoAutorizacion.objects.order_by('codigo').first()
+        self.qrs = list(Autorizacion.objects.filter(activo=True).order_by('pk').values_list('codigo_qr', flat=True)[:200])
+        self.contador = 0
+        self.stdout.write(self.style.SUCCESS(f'\nDataset: {tamano} autorizaciones'))
+
+    def _escenarios(self):
+        return [
+            ('verificar_qr', self._verificar_qr, self.repeticiones),
+            ('generar_qr_post', self._generar_qr, self.repeticiones),
+            ('autorizacion_list_placa', lambda: self._get(
+                'formulario:autorizacion_list', {'tipo_busqueda': 'placa', 'termino_busqueda': 'GA'}
+            ), self.repeticiones),
+            ('autorizacion_list_nombres', lambda: self._get(
+                'formulario:autorizacion_list', {'tipo_busqueda': 'nombres', 'termino_busqueda': 'María'}
+            ), self.repeticiones),
+            ('historial_acciones_list', lambda: self._get('formulario:historial_acciones_list'), self.repeticiones),
+            ('dashboard', lambda: self._get('formulario:dashboard'), self.repeticiones),
+            ('exportar_historial_excel', lambda: self._get(
+                'formulario:historial_autorizaciones_exportar_excel'
+            ), max(1, self.repeticiones // 5)),
+        ]
+
+    def _get(self, nombre_url, params=None):
+        return self.client.get(reverse(nombre_url), params or {})
+
+    def _verificar_qr(self):
+        # codigo_qr guarda la URL absoluta: se reutiliza solo la ruta y los parámetros
+        partes = urlsplit(self.qrs[self.contador % len(self.qrs)])
+        self.contador += 1
+        return self.client.get(f'{partes.path}?{partes.query}')
+
+    def _generar_qr(self):
+        self.contador += 1
+        indice = 5_000_000 + self.contador
+        response = self.client.post(reverse('formulario:generar_qr'), {
+            'placa': placa_para(indice),
+            'nombres': f'Usuario Benchmark {indice}',
+            'tipo_identificacion': 'cedula',
+            'cedula': cedula_para(indice),
+            'correo': f'benchmark{indice}@example.com',
+            'telefono': f'09{(indice * 7919 + 12345678) % 10**8:08d}',
+            'tipo_autorizacion': self.tipo.pk,
+            'numero_autorizacion': f'BEN-{indice:07d}',
+            'vigencia': (timezone.localdate() + timedelta(days=365)).isoformat(),
+        })
+        # El formulario responde 200 también con errores: medir un POST inválido no sirve
+        if response.status_code == 200 and not response.context.get('qr_generado'):
+            raise CommandError(f'GenerarQRView no creó la autorización: {response.context["form"].errors.as_json()}')
+        return response
+
+    # ------------------------------------------------------------------
+    # Medición y reporte
+    # ------------------------------------------------------------------
+
+    def _medir(self, funcion, repeticiones):
+        self._verificar(funcion())  # calentamiento
+
+        tiempos = []
+        consultas = []
+        for _ in range(repeticiones):
+            with CaptureQueriesContext(connection) as capturadas:
+                inicio = time.perf_counter()
+                response = funcion()
+                tiempos.append(time.perf_counter() - inicio)
+            self._verificar(response)
+            consultas.append(len(capturadas))
+
+        # La memoria se mide aparte: tracemalloc distorsiona los tiempos
+        tracemalloc.start()
+        self._verificar(funcion())
+        _, pico = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return {
+            'p50_ms': round(statistics.median(tiempos) * 1000, 2),
+            'p95_ms': round(self._percentil(tiempos, 95) * 1000, 2),
+            'consultas': max(consultas),
+            'memoria_pico_kb': round(pico / 1024, 1),
+        }
+
+    def _verificar(self, response):
+        if response.status_code != 200:
+            raise CommandError(f'{response.request["PATH_INFO"]} respondió {response.status_code}')
+
+    def _percentil(self, valores, percentil):
+        return statistics.quantiles(valores, n=100)[percentil - 1] if len(valores) > 1 else valores[0]
+
+    def _imprimir(self, r):
+        self.stdout.write(
+            f'  {r["escenario"]:<28} p50={r["p50_ms"]:>9.2f}ms  p95={r["p95_ms"]:>9.2f}ms  '
+            f'consultas={r["consultas"]:>4}  memoria={r["memoria_pico_kb"]:>9.1f}KB'
+        )
+
+    def _comparar(self, corrida, ruta, tolerancia):
+        with open(ruta, encoding='utf-8') as archivo:
+            base = json.load(archivo)
+        anteriores = {(r['tamano'], r['escenario']): r for r in base['resultados']}
+
+        regresiones = []
+        for actual in corrida['resultados']:
+            anterior = anteriores.get((actual['tamano'], actual['escenario']))
+            if anterior is None:
+                continue
+            if actual['consultas'] > anterior['consultas']:
+                regresiones.append(
+                    f'{actual["escenario"]} ({actual["tamano"]}): consultas {anterior["consultas"]} -> {actual["consultas"]}'
+                )
+            if actual['p95_ms'] > anterior['p95_ms'] * (1 + tolerancia):
+                regresiones.append(
+                    f'{actual["escenario"]} ({actual["tamano"]}): p95 {anterior["p95_ms"]}ms -> {actual["p95_ms"]}ms'
+                )
+
+        if regresiones:
+            for regresion in regresiones:
+                self.stdout.write(self.style.ERROR(f'  REGRESIÓN: {regresion}'))
+            raise CommandError(f'Se detectaron {len(regresiones)} regresiones respecto a {ruta}')
+        self.stdout.write(self.style.SUCCESS(f'Sin regresiones respecto a {ruta}'))
@@ -0,0 +1,64 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from apps.formulario.models import Autorizacion, HistorialAcciones
+from apps.formulario.verificacion import cache_verificacion, clave_verificacion
+from apps.security.models import User
+
+
+def caducar(hoy, tamano_lote=1000):
+    """
+    Marca caducada=True en las autorizaciones con vigencia anterior a `hoy`
+    que todavía no lo estaban, por lotes de claves primarias, e invalida su
+    verificación en caché. Retorna cuántas se marcaron (idempotente).
+    """
+    pendientes = Autorizacion.objects.filter(caducada=False, vigencia__lt=hoy).order_by('pk')
+    total = 0
+    ultimo_id = 0
+    while lote := list(pendientes.filter(pk__gt=ultimo_id).values_list('pk', 'placa', 'numero_autorizacion')[:tamano_lote]):
+        with transaction.atomic():
+            total += Autorizacion.objects.filter(pk__in=[pk for pk, _, _ in lote]).update(caducada=True)
+        # update() no emite post_save: las verificaciones cacheadas se invalidan aquí
+        cache_verificacion.delete_many([clave_verificacion(placa, numero) for _, placa, numero in lote])
+        ultimo_id = lote[-1][0]
+    return total
+
+
+class Command(BaseCommand):
+    help = (
+        'Marca como caducadas las autorizaciones vencidas e invalida su verificación en caché '
+        '(programar una vez al día, pasada la medianoche en America/Guayaquil)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help='Autorizaciones por UPDATE (default: 1000)')
+        parser.add_argument(
+            '--usuario',
+            help='Usuario al que se atribuye la acción en el historial (default: el primer superusuario activo)'
+        )
+        parser.add_argument('--fecha', help='Día de referencia, AAAA-MM-DD (default: hoy en TIME_ZONE)')
+
+    def handle(self, *args, **options):
+        try:
+            hoy = datetime.strptime(options['fecha'], '%Y-%m-%d').date() if options['fecha'] else timezone.localdate()
+        except ValueError:
+            raise CommandError('--fecha debe tener el formato AAAA-MM-DD')
+
+        if options['usuario']:
+            usuario = User.objects.filter(username=options['usuario']).first()
+        else:
+            usuario = User.objects.filter(is_superuser=True, is_active=True).order_by('pk').first()
+        if usuario is None:
+            raise CommandError('No hay un usuario para registrar la acción en el historial (use --usuario)')
+
+        total = caducar(hoy, options['lote'])
+
+        # Una sola entrada de auditoría por corrida, no una por autorización
+        if total:
+            HistorialAcciones.objects.create(
+                accion='CADUCAR_AUTORIZACIONES',
+                descripcion=f'{total} autorizaciones con vigencia anterior al {hoy:%d/%m/%Y} marcadas como caducadas',
+                creado_por=usuario
+            )
+        self.stdout.write(self.style.SUCCESS(f'{total} autorizaciones marcadas como caducadas'))
@@ -0,0 +1,18 @@
+import os
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from apps.formulario import paquete_offline
+
+
+class Command(BaseCommand):
+    help = (
+        'Crea la clave privada Ed25519 que firma los paquetes sin conexión (si no existe) '
+        'y muestra la clave pública que se instala en los dispositivos'
+    )
+
+    def handle(self, *args, **options):
+        ruta = settings.PAQUETE_OFFLINE_CLAVE_PRIVADA
+        if not os.path.exists(ruta):
+            paquete_offline.crear_clave(ruta)
+            self.stdout.write(self.style.SUCCESS(f'Clave privada creada en {ruta} (no copiarla a los dispositivos)'))
+        self.stdout.write(f'Clave pública (hex): {paquete_offline.clave_publica().hex()}')
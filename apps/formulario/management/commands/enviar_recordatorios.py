@@ -0,0 +1,31 @@
+from datetime import datetime
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from apps.formulario.recordatorios import enviar_recordatorios
+
+
+class Command(BaseCommand):
+    help = (
+        'Envía por correo los recordatorios de vencimiento pendientes a los titulares '
+        '(programar a diario; volver a correrlo no repite envíos)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dias',
+            help='Días de anticipación separados por coma (default: RECORDATORIOS_DIAS)'
+        )
+        parser.add_argument('--lote', type=int, help='Autorizaciones por consulta (default: RECORDATORIOS_LOTE)')
+        parser.add_argument('--fecha', help='Día de referencia, AAAA-MM-DD (default: hoy en TIME_ZONE)')
+
+    def handle(self, *args, **options):
+        try:
+            hoy = datetime.strptime(options['fecha'], '%Y-%m-%d').date() if options['fecha'] else None
+            anticipaciones = [int(dias) for dias in options['dias'].split(',')] if options['dias'] else None
+        except ValueError:
+            raise CommandError('--fecha debe tener el formato AAAA-MM-DD y --dias ser enteros separados por coma')
+
+        resumen = enviar_recordatorios(hoy=hoy, anticipaciones=anticipaciones, tamano_lote=options['lote'])
+        self.stdout.write(self.style.SUCCESS(f'{resumen["enviados"]} recordatorios enviados ({settings.EMAIL_BACKEND})'))
+        if resumen['fallidos']:
+            self.stdout.write(self.style.WARNING(f'{resumen["fallidos"]} fallidos, se reintentarán en la próxima corrida'))
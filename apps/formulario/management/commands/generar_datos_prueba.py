@@ -0,0 +1,322 @@
+import csv
+import io
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.urls import reverse
+from django.utils import timezone
+from apps.formulario.models import (
+    TipoAutorizacion, UsuarioAutorizacion, Autorizacion, HistorialAcciones, HistorialAutorizacion, normalizar_placa
+)
+from apps.formulario.utils import construir_url_qr
+from apps.security.models import User
+
+NOMBRES = [
+    'José', 'Luis', 'Carlos', 'Juan', 'Jorge', 'Miguel', 'Andrés', 'Diego', 'Fernando', 'Ricardo',
+    'María', 'Ana', 'Carmen', 'Rosa', 'Gabriela', 'Daniela', 'Andrea', 'Verónica', 'Patricia', 'Mercedes',
+]
+APELLIDOS = [
+    'Zambrano', 'Mendoza', 'Vera', 'Cedeño', 'Bravo', 'Macías', 'Moreira', 'Alvarado', 'Rodríguez', 'Torres',
+    'Sánchez', 'Villamar', 'Castro', 'Solórzano', 'Chávez', 'Muñoz', 'Intriago', 'Pincay', 'Loor', 'Reyes',
+]
+ACCIONES = [
+    ('GENERAR_QR', 40), ('GENERAR_PDF', 30), ('DESCARGAR_QR', 15), ('DESCARGAR_PDF', 10),
+    ('ACTUALIZAR_AUTORIZACION', 4), ('ACTUALIZAR_USUARIO', 1),
+]
+LETRAS = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+# Cantidad de combinaciones de placa (2 letras x 4 dígitos) por letra de provincia
+_COMBINACIONES_PLACA = 26 * 26 * 10000
+
+
+def digito_verificador_cedula(nueve_digitos):
+    """Dígito verificador de la cédula ecuatoriana (módulo 10)"""
+    suma = 0
+    for posicion, digito in enumerate(nueve_digitos):
+        producto = int(digito) * (2 if posicion % 2 == 0 else 1)
+        suma += producto - 9 if producto > 9 else producto
+    return str((10 - suma % 10) % 10)
+
+
+def cedula_para(indice):
+    """Cédula única y válida de Guayas (09) para el índice dado"""
+    cuerpo = f'{(indice * 7919) % 6_000_000:07d}'  # tercer dígito < 6: persona natural
+    nueve = f'09{cuerpo}'
+    return nueve + digito_verificador_cedula(nueve)
+
+
+def placa_para(indice):
+    """Placa única con formato ecuatoriano (3 letras + 4 dígitos)"""
+    provincias = 'GMOEBPU'
+    provincia = provincias[(indice // _COMBINACIONES_PLACA) % len(provincias)]
+    valor = (indice * 2654435761) % _COMBINACIONES_PLACA
+    letras, numero = divmod(valor, 10000)
+    return f'{provincia}{LETRAS[letras // 26]}{LETRAS[letras % 26]}{numero:04d}'
+
+
+class Command(BaseCommand):
+    help = 'Genera datos sintéticos reproducibles para pruebas de carga y escala'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios', type=int, default=1000, help='Usuarios con autorización (default: 1000)')
+        parser.add_argument('--autorizaciones', type=int, default=5000, help='Autorizaciones (default: 5000)')
+        parser.add_argument('--historial', type=int, default=5000,
+                            help='Registros de historial de autorizaciones, mínimo uno por autorización (default: 5000)')
+        parser.add_argument('--acciones', type=int, default=10000, help='Registros de historial de acciones (default: 10000)')
+        parser.add_argument('--operadores', type=int, default=5, help='Usuarios del sistema que emiten (default: 5)')
+        parser.add_argument('--dias', type=int, default=730, help='Antigüedad máxima de las emisiones en días (default: 730)')
+        parser.add_argument('--semilla', type=int, default=42, help='Semilla aleatoria (default: 42)')
+        parser.add_argument('--lote', type=int, default=5000, help='Filas por inserción (default: 5000)')
+        parser.add_argument('--base-url', default='http://localhost:8000',
+                            help='URL base para codigo_qr (default: http://localhost:8000)')
+        parser.add_argument('--copy', action='store_true',
+                            help='Usar COPY de PostgreSQL para las tablas de historial')
+
+    def handle(self, *args, **options):
+        if options['copy'] and connection.vendor != 'postgresql':
+            raise CommandError('--copy solo está disponible con PostgreSQL')
+        if options['autorizaciones'] and not options['usuarios']:
+            raise CommandError('Se necesita al menos un usuario para generar autorizaciones')
+
+        self.rng = random.Random(options['semilla'])
+        self.options = options
+        self.ahora = timezone.now()
+        self.hoy = timezone.localdate()
+        self.base_url = options['base_url'].rstrip('/') + reverse('formulario:verificar_qr')
+        inicio = time.perf_counter()
+
+        self.stdout.write(self.style.SUCCESS('\n' + '='*60))
+        self.stdout.write(self.style.SUCCESS('GENERACIÓN DE DATOS DE PRUEBA'))
+        self.stdout.write(self.style.SUCCESS('-'*60))
+
+        if not TipoAutorizacion.objects.exists():
+            call_command('tipo_autorizacion_command', stdout=io.StringIO())
+        self.tipos = list(TipoAutorizacion.objects.order_by('codigo'))
+        # Distribución sesgada (Zipf): los primeros tipos concentran la mayoría de permisos
+        self.pesos_tipo = [1 / (posicion + 1) for posicion in range(len(self.tipos))]
+
+        self.operadores = self._crear_operadores(options['operadores'])
+        self.pesos_operador = [1 / (posicion + 1) for posicion in range(len(self.operadores))]
+
+        with self._fechas_manuales():
+            usuarios = self._crear_usuarios(options['usuarios'])
+            self._crear_autorizaciones(usuarios, options['autorizaciones'], options['historial'])
+            self._crear_acciones(options['acciones'])
+
+        self.stdout.write(self.style.SUCCESS('-'*60))
+        self.stdout.write(self.style.SUCCESS(f'Completado en {time.perf_counter() - inicio:.1f}s'))
+        self.stdout.write(self.style.SUCCESS('='*60 + '\n'))
+
+    # ------------------------------------------------------------------
+    # Entidades
+    # ------------------------------------------------------------------
+
+    def _crear_operadores(self, cantidad):
+        operadores = []
+        for numero in range(1, cantidad + 1):
+            operador, creado = User.objects.get_or_create(
+                username=f'operador_prueba_{numero}',
+                defaults={
+                    'email': f'operador_prueba_{numero}@example.com',
+                    'names': f'Operador de Prueba {numero}',
+                }
+            )
+            if creado:
+                operador.set_unusable_password()
+                operador.save(update_fields=['password'])
+            operadores.append(operador)
+        return operadores
+
+    def _crear_usuarios(self, cantidad):
+        """Crea los usuarios y retorna [(pk, nombres, cedula, ruc)] para armar las autorizaciones"""
+        desplazamiento = UsuarioAutorizacion.objects.count()
+        usuarios = []
+        for inicio in range(0, cantidad, self.options['lote']):
+            lote = []
+            for indice in range(desplazamiento + inicio, desplazamiento + min(cantidad, inicio + self.options['lote'])):
+                nombres = (
+                    f'{self.rng.choice(NOMBRES)} {self.rng.choice(NOMBRES)} '
+                    f'{self.rng.choice(APELLIDOS)} {self.rng.choice(APELLIDOS)}'
+                )
+                cedula = cedula_para(indice)
+                fecha = self._fecha_pasada()
+                lote.append(UsuarioAutorizacion(
+                    nombres=nombres,
+                    cedula=cedula,
+                    ruc=f'{cedula}001' if self.rng.random() < 0.3 else None,
+                    correo=f'usuario{indice}@example.com' if self.rng.random() < 0.8 else None,
+                    telefono=f'09{(indice * 7919 + 12345678) % 10**8:08d}' if self.rng.random() < 0.7 else None,
+                    creado_por=self._operador(),
+                    fecha_creacion=fecha,
+                    fecha_actualizacion=fecha,
+                ))
+            with transaction.atomic():
+                creados = UsuarioAutorizacion.objects.bulk_create(lote)
+            usuarios.extend((u.pk, u.nombres, u.cedula, u.ruc) for u in creados)
+            self._progreso('Usuarios', len(usuarios), cantidad)
+        return usuarios
+
+    def _crear_autorizaciones(self, usuarios, cantidad, total_historial):
+        desplazamiento = Autorizacion.objects.count()
+        anio = self.hoy.year
+        historial_por_autorizacion = max(total_historial, cantidad) / cantidad if cantidad else 0
+        creadas = historial_creado = 0
+
+        for inicio in range(0, cantidad, self.options['lote']):
+            lote = []
+            for indice in range(desplazamiento + inicio, desplazamiento + min(cantidad, inicio + self.options['lote'])):
+                pk, nombres, cedula, ruc = self.rng.choice(usuarios)
+                usuario = UsuarioAutorizacion(pk=pk, nombres=nombres, cedula=cedula, ruc=ruc)
+                tipo = self.rng.choices(self.tipos, weights=self.pesos_tipo)[0]
+                fecha = self._fecha_pasada()
+                vigencia = self._vigencia()
+                autorizacion = Autorizacion(
+                    usuario=usuario,
+                    tipo_autorizacion=tipo,
+                    placa=placa_para(indice),
+                    placa_normalizada=normalizar_placa(placa_para(indice)),
+                    # 20 caracteres: el QR solo lleva los primeros 20 del número
+                    numero_autorizacion=f'ACT-{indice:07d}-{anio}-{tipo.codigo[-3:]}',
+                    vigencia=vigencia,
+                    caducada=vigencia < self.hoy,
+                    qr_generado=True,
+                    activo=self.rng.random() < 0.95,
+                    creado_por=self._operador(),
+                    fecha_creacion=fecha,
+                    fecha_actualizacion=fecha,
+                )
+                autorizacion.codigo_qr = construir_url_qr(autorizacion, self.base_url)
+                lote.append(autorizacion)
+
+            with transaction.atomic():
+                Autorizacion.objects.bulk_create(lote)
+                objetivo = round((creadas + len(lote)) * historial_por_autorizacion) - historial_creado
+                historial_creado += self._crear_historial(lote, objetivo)
+            creadas += len(lote)
+            self._progreso('Autorizaciones', creadas, cantidad)
+
+        if cantidad:
+            self._progreso('Historial de autorizaciones', historial_creado, historial_creado)
+
+    def _crear_historial(self, autorizaciones, cantidad):
+        """Un registro por autorización y el resto repartido al azar dentro del lote"""
+        elegidas = autorizaciones + [
+            self.rng.choice(autorizaciones) for _ in range(max(0, cantidad - len(autorizaciones)))
+        ]
+        snapshot = settings.FORMULARIO_HISTORIAL_SNAPSHOT
+        filas = []
+        for autorizacion in elegidas:
+            fecha = autorizacion.fecha_creacion + timedelta(minutes=self.rng.randint(0, 60 * 24 * 30))
+            filas.append(HistorialAutorizacion(
+                autorizacion_id=autorizacion.pk,
+                creado_por_id=autorizacion.creado_por_id,
+                fecha_creacion=min(fecha, self.ahora),
+                fecha_actualizacion=min(fecha, self.ahora),
+                snapshot_placa=autorizacion.placa if snapshot else None,
+                snapshot_nombres=autorizacion.usuario.nombres if snapshot else None,
+                snapshot_tipo=autorizacion.tipo_autorizacion.nombre if snapshot else None,
+                snapshot_numero=autorizacion.numero_autorizacion if snapshot else None,
+                snapshot_vigencia=autorizacion.vigencia if snapshot else None,
+            ))
+        self._insertar(HistorialAutorizacion, filas)
+        return len(filas)
+
+    def _crear_acciones(self, cantidad):
+        if not cantidad:
+            return
+        ids = list(Autorizacion.objects.values_list('pk', 'placa'))
+        if not ids:
+            return
+        acciones, pesos = zip(*ACCIONES)
+        creadas = 0
+        for inicio in range(0, cantidad, self.options['lote']):
+            filas = []
+            for _ in range(min(self.options['lote'], cantidad - inicio)):
+                pk, placa = self.rng.choice(ids)
+                accion = self.rng.choices(acciones, weights=pesos)[0]
+                fecha = self._fecha_pasada()
+                filas.append(HistorialAcciones(
+                    autorizacion_id=pk,
+                    creado_por=self._operador(),
+                    accion=accion,
+                    descripcion=f'{accion.replace("_", " ").capitalize()} para placa {placa}',
+                    fecha_accion=fecha,
+                    fecha_creacion=fecha,
+                    fecha_actualizacion=fecha,
+                ))
+            with transaction.atomic():
+                self._insertar(HistorialAcciones, filas)
+            creadas += len(filas)
+            self._progreso('Historial de acciones', creadas, cantidad)
+
+    # ------------------------------------------------------------------
+    # Utilidades
+    # ------------------------------------------------------------------
+
+    def _insertar(self, modelo, filas):
+        if self.options['copy']:
+            self._copiar(modelo, filas)
+        else:
+            modelo.objects.bulk_create(filas, batch_size=self.options['lote'])
+
+    def _copiar(self, modelo, filas):
+        """Inserta con COPY FROM STDIN (psycopg2 o psycopg 3)"""
+        campos = [f for f in modelo._meta.concrete_fields if not f.primary_key]
+        buffer = io.StringIO()
+        escritor = csv.writer(buffer)
+        for fila in filas:
+            escritor.writerow([
+                '\\N' if (valor := f.get_db_prep_value(getattr(fila, f.attname), connection)) is None else valor
+                for f in campos
+            ])
+        buffer.seek(0)
+
+        columnas = ', '.join(connection.ops.quote_name(f.column) for f in campos)
+        sql = (
+            f'COPY {connection.ops.quote_name(modelo._meta.db_table)} ({columnas}) '
+            f"FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+        )
+        with connection.cursor() as cursor:
+            crudo = cursor.cursor
+            if hasattr(crudo, 'copy_expert'):
+                crudo.copy_expert(sql, buffer)
+            else:
+                with crudo.copy(sql) as copia:
+                    copia.write(buffer.getvalue())
+
+    @contextmanager
+    def _fechas_manuales(self):
+        """Desactiva auto_now/auto_now_add para poder repartir las fechas en el tiempo"""
+        campos = []
+        for modelo in (UsuarioAutorizacion, Autorizacion, HistorialAcciones, HistorialAutorizacion):
+            for campo in modelo._meta.concrete_fields:
+                if getattr(campo, 'auto_now', False) or getattr(campo, 'auto_now_add', False):
+                    campos.append((campo, campo.auto_now, campo.auto_now_add))
+                    campo.auto_now = campo.auto_now_add = False
+        try:
+            yield
+        finally:
+            for campo, auto_now, auto_now_add in campos:
+                campo.auto_now, campo.auto_now_add = auto_now, auto_now_add
+
+    def _fecha_pasada(self):
+        # Más actividad reciente: el sesgo cuadrático acerca las fechas a hoy
+        dias = self.options['dias'] * self.rng.random() ** 2
+        return self.ahora - timedelta(days=dias)
+
+    def _vigencia(self):
+        # ~25% caducadas, la mayoría vence dentro del año
+        if self.rng.random() < 0.25:
+            return self.hoy - timedelta(days=self.rng.randint(1, 365))
+        return self.hoy + timedelta(days=int(self.rng.triangular(1, 730, 365)))
+
+    def _operador(self):
+        return self.rng.choices(self.operadores, weights=self.pesos_operador)[0]
+
+    def _progreso(self, etiqueta, actual, total):
+        self.stdout.write(f'  {etiqueta}: {actual}/{total}')
@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from apps.formulario import paquete_offline
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera el paquete firmado de autorizaciones vigentes para verificar sin conexión '
+        'y los deltas desde las versiones conservadas (programar a diario)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', help='Directorio de salida (default: PAQUETE_OFFLINE_DIR)')
+        parser.add_argument(
+            '--conservar',
+            type=int,
+            help='Versiones anteriores conservadas para ofrecer deltas (default: PAQUETE_OFFLINE_CONSERVAR)'
+        )
+        parser.add_argument(
+            '--tamano-lote',
+            type=int,
+            default=1_000_000,
+            help='Huellas ordenadas en memoria antes de volcarlas a disco (default: 1000000)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            resumen = paquete_offline.generar(
+                directorio=options['dir'],
+                conservar=options['conservar'],
+                tamano_lote=options['tamano_lote'],
+            )
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f'Paquete {resumen["version"]}: {resumen["autorizaciones"]} autorizaciones vigentes '
+            f'en {options["dir"] or settings.PAQUETE_OFFLINE_DIR}'
+        ))
+        for base, delta in resumen['deltas'].items():
+            self.stdout.write(f'  delta desde {base}: +{delta["altas"]} -{delta["bajas"]}')
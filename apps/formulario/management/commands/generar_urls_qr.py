@@ -0,0 +1,40 @@
+import random
+from django.core.management.base import BaseCommand
+from django.urls import reverse
+from apps.formulario.models import Autorizacion
+from apps.formulario.utils import construir_url_qr
+
+class Command(BaseCommand):
+    help = 'Genera URLs de QR (una por línea) desde la base de datos para las pruebas de carga'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://localhost:8000',
+                            help='URL base de la instancia a probar (default: http://localhost:8000)')
+        parser.add_argument('--limite', type=int, default=10000, help='Máximo de autorizaciones (default: 10000)')
+        parser.add_argument('--invalidas', type=float, default=0.0,
+                            help='Fracción de URLs alteradas que no existen en la BD (default: 0)')
+        parser.add_argument('--semilla', type=int, default=42, help='Semilla aleatoria (default: 42)')
+        parser.add_argument('--salida', help='Archivo de salida (default: stdout)')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['semilla'])
+        base_url = options['base_url'].rstrip('/') + reverse('formulario:verificar_qr')
+
+        autorizaciones = Autorizacion.objects.filter(activo=True).select_related(
+            'usuario', 'tipo_autorizacion'
+        ).order_by('pk')[:options['limite']]
+
+        urls = []
+        for autorizacion in autorizaciones.iterator(chunk_size=2000):
+            if rng.random() < options['invalidas']:
+                # Simula un QR adulterado: mismo formato, número que no existe
+                autorizacion.numero_autorizacion = f'X{autorizacion.numero_autorizacion}'[:20]
+            urls.append(construir_url_qr(autorizacion, base_url))
+
+        contenido = '\n'.join(urls) + ('\n' if urls else '')
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                archivo.write(contenido)
+            self.stdout.write(self.style.SUCCESS(f'{len(urls)} URLs escritas en {options["salida"]}'))
+        else:
+            self.stdout.write(contenido, ending='')
@@ -0,0 +1,342 @@
+import asyncio
+import json
+import random
+import re
+import ssl
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+from urllib.parse import urlencode, urlsplit
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from django.utils import timezone
+from apps.formulario.management.commands.generar_datos_prueba import cedula_para, placa_para
+
+# Límites superiores (ms) de los buckets del histograma de latencia
+BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+_CSRF = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+_SELECT_TIPO = re.compile(r'<select name="tipo_autorizacion".*?</select>', re.S)
+_OPCION = re.compile(r'<option value="(\d+)"')
+
+
+class ClienteHTTP:
+    """Cliente HTTP/1.1 mínimo sobre asyncio con keep-alive y cookies"""
+
+    def __init__(self, base_url, timeout):
+        partes = urlsplit(base_url)
+        self.host = partes.hostname
+        self.puerto = partes.port or (443 if partes.scheme == 'https' else 80)
+        self.ssl = ssl.create_default_context() if partes.scheme == 'https' else None
+        self.base_url = f'{partes.scheme}://{partes.netloc}'
+        self.timeout = timeout
+        self.cookies = {}
+        self._reader = self._writer = None
+
+    async def cerrar(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except (ConnectionError, ssl.SSLError):
+                pass
+        self._reader = self._writer = None
+
+    async def solicitar(self, metodo, ruta, datos=None):
+        """Devuelve (estado, cabeceras, cuerpo); reintenta una vez si el servidor cerró la conexión"""
+        for intento in (1, 2):
+            try:
+                return await asyncio.wait_for(self._solicitar(metodo, ruta, datos), self.timeout)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                await self.cerrar()
+                if intento == 2:
+                    raise
+            except asyncio.TimeoutError:
+                await self.cerrar()
+                raise
+
+    async def _solicitar(self, metodo, ruta, datos):
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.puerto, ssl=self.ssl)
+
+        cuerpo = urlencode(datos, doseq=True).encode() if datos is not None else b''
+        lineas = [
+            f'{metodo} {ruta} HTTP/1.1',
+            f'Host: {self.host}' + (f':{self.puerto}' if self.puerto not in (80, 443) else ''),
+            'Connection: keep-alive',
+            'User-Agent: prueba-carga/1.0',
+        ]
+        if self.cookies:
+            lineas.append('Cookie: ' + '; '.join(f'{k}={v}' for k, v in self.cookies.items()))
+        if metodo == 'POST':
+            lineas += [
+                'Content-Type: application/x-www-form-urlencoded',
+                f'Content-Length: {len(cuerpo)}',
+                f'Referer: {self.base_url}{ruta}',
+            ]
+        self._writer.write(('\r\n'.join(lineas) + '\r\n\r\n').encode('latin-1') + cuerpo)
+        await self._writer.drain()
+
+        estado_linea = await self._reader.readline()
+        if not estado_linea:
+            raise ConnectionResetError('Conexión cerrada por el servidor')
+        estado = int(estado_linea.split()[1])
+
+        cabeceras = {}
+        while (linea := await self._reader.readline()) not in (b'\r\n', b'\n', b''):
+            nombre, _, valor = linea.decode('latin-1').partition(':')
+            nombre, valor = nombre.strip().lower(), valor.strip()
+            if nombre == 'set-cookie':
+                clave, _, resto = valor.partition('=')
+                self.cookies[clave] = resto.split(';', 1)[0]
+            cabeceras[nombre] = valor
+
+        if cabeceras.get('transfer-encoding', '').lower() == 'chunked':
+            partes = []
+            while (tamano := int((await self._reader.readline()).split(b';')[0], 16)):
+                partes.append(await self._reader.readexactly(tamano))
+                await self._reader.readline()
+            await self._reader.readline()
+            respuesta = b''.join(partes)
+        elif 'content-length' in cabeceras:
+            respuesta = await self._reader.readexactly(int(cabeceras['content-length']))
+        else:
+            respuesta = await self._reader.read()
+            await self.cerrar()
+            return estado, cabeceras, respuesta
+
+        if cabeceras.get('connection', '').lower() == 'close':
+            await self.cerrar()
+        return estado, cabeceras, respuesta
+
+
+class Resultados:
+    """Latencias, estados y errores por escenario"""
+
+    def __init__(self):
+        self.latencias = defaultdict(list)
+        self.errores = defaultdict(Counter)
+
+    def registrar(self, escenario, segundos, error=None):
+        self.latencias[escenario].append(segundos * 1000)
+        if error:
+            self.errores[escenario][error] += 1
+
+    def resumen(self, duracion):
+        resumen = {}
+        for escenario, latencias in sorted(self.latencias.items()):
+            ordenadas = sorted(latencias)
+            errores = sum(self.errores[escenario].values())
+            resumen[escenario] = {
+                'solicitudes': len(ordenadas),
+                'rps': round(len(ordenadas) / duracion, 2) if duracion else 0,
+                'tasa_error': round(errores / len(ordenadas), 4),
+                'errores': dict(self.errores[escenario]),
+                'p50_ms': round(self._percentil(ordenadas, 50), 2),
+                'p95_ms': round(self._percentil(ordenadas, 95), 2),
+                'p99_ms': round(self._percentil(ordenadas, 99), 2),
+                'histograma': self._histograma(ordenadas),
+            }
+        return resumen
+
+    def _percentil(self, ordenadas, percentil):
+        return ordenadas[min(len(ordenadas) - 1, int(round(percentil / 100 * (len(ordenadas) - 1))))]
+
+    def _histograma(self, ordenadas):
+        conteo = Counter()
+        for latencia in ordenadas:
+            limite = next((b for b in BUCKETS_MS if latencia <= b), None)
+            conteo[f'<={limite}ms' if limite else f'>{BUCKETS_MS[-1]}ms'] += 1
+        etiquetas = [f'<={b}ms' for b in BUCKETS_MS] + [f'>{BUCKETS_MS[-1]}ms']
+        return {etiqueta: conteo[etiqueta] for etiqueta in etiquetas if conteo[etiqueta]}
+
+
+class Command(BaseCommand):
+    help = (
+        'Prueba de carga con clientes HTTP asyncio contra una instancia en ejecución: ráfagas de '
+        'verificación de QR, operadores generando QR y auditores exportando el historial'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://localhost:8000', help='Instancia a probar (default: http://localhost:8000)')
+        parser.add_argument('--urls-qr', required=True,
+                            help='Archivo con URLs de QR, una por línea (ver generar_urls_qr)')
+        parser.add_argument('--duracion', type=float, default=30, help='Segundos de prueba (default: 30)')
+        parser.add_argument('--escaneres', type=int, default=50, help='Clientes que verifican QR (default: 50)')
+        parser.add_argument('--operadores', type=int, default=2, help='Clientes que generan QR (default: 2)')
+        parser.add_argument('--auditores', type=int, default=1, help='Clientes que exportan a Excel (default: 1)')
+        parser.add_argument('--rafaga', type=int, default=10,
+                            help='Escaneos seguidos por ráfaga de cada escáner (default: 10)')
+        parser.add_argument('--pausa', type=float, default=1.0,
+                            help='Pausa media en segundos entre ráfagas (exponencial, default: 1.0)')
+        parser.add_argument('--pausa-operador', type=float, default=2.0,
+                            help='Pausa media entre acciones de operadores y auditores (default: 2.0)')
+        parser.add_argument('--usuario', help='Superusuario para operadores y auditores')
+        parser.add_argument('--password', help='Contraseña del superusuario')
+        parser.add_argument('--timeout', type=float, default=30, help='Timeout por solicitud en segundos (default: 30)')
+        parser.add_argument('--semilla', type=int, help='Semilla aleatoria')
+        parser.add_argument('--salida', help='Archivo JSON con el resumen')
+
+    def handle(self, *args, **options):
+        with open(options['urls_qr'], encoding='utf-8') as archivo:
+            self.rutas_qr = [self._ruta(linea.strip()) for linea in archivo if linea.strip()]
+        if not self.rutas_qr:
+            raise CommandError(f'{options["urls_qr"]} no contiene URLs')
+        if (options['operadores'] or options['auditores']) and not (options['usuario'] and options['password']):
+            raise CommandError('Operadores y auditores requieren --usuario y --password')
+
+        self.options = options
+        self.rng = random.Random(options['semilla'])
+        # Índices altos para no chocar con generar_datos_prueba ni con otras corridas
+        self.siguiente_indice = 6_000_000 + self.rng.randrange(0, 1_000_000, 1000)
+        self.resultados = Resultados()
+
+        # Todos los escáneres salen de la misma IP: la instancia probada debe correr
+        # con VERIFICACION_LIMITE_IP=0 y VERIFICACION_LIMITE_QR=0 (por defecto); los
+        # settings de este proceso no la afectan
+        inicio = time.perf_counter()
+        asyncio.run(self._ejecutar())
+        duracion = time.perf_counter() - inicio
+
+        resumen = self.resultados.resumen(duracion)
+        self._imprimir(resumen, duracion)
+        if any('HTTP 429' in datos['errores'] for datos in resumen.values()):
+            self.stderr.write(self.style.WARNING(
+                'La instancia respondió 429: tiene activos los límites de verificación y la prueba '
+                'los está midiendo a ellos. Correrla con VERIFICACION_LIMITE_IP=0 y VERIFICACION_LIMITE_QR=0.'
+            ))
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                json.dump({
+                    'url': options['url'],
+                    'duracion_s': round(duracion, 2),
+                    'clientes': {k: options[k] for k in ('escaneres', 'operadores', 'auditores')},
+                    'escenarios': resumen,
+                }, archivo, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Resumen guardado en {options["salida"]}'))
+
+    def _ruta(self, url):
+        partes = urlsplit(url)
+        return f'{partes.path}?{partes.query}' if partes.query else partes.path
+
+    # ------------------------------------------------------------------
+    # Clientes
+    # ------------------------------------------------------------------
+
+    async def _ejecutar(self):
+        self.fin = time.monotonic() + self.options['duracion']
+        tareas = [self._escaner() for _ in range(self.options['escaneres'])]
+        tareas += [self._sesion(self._operador) for _ in range(self.options['operadores'])]
+        tareas += [self._sesion(self._auditor) for _ in range(self.options['auditores'])]
+        await asyncio.gather(*tareas)
+
+    async def _medir(self, cliente, escenario, metodo, ruta, datos=None, esperado=(200,)):
+        inicio = time.perf_counter()
+        try:
+            estado, cabeceras, cuerpo = await cliente.solicitar(metodo, ruta, datos)
+        except asyncio.TimeoutError:
+            self.resultados.registrar(escenario, time.perf_counter() - inicio, 'timeout')
+            return None
+        except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+            self.resultados.registrar(escenario, time.perf_counter() - inicio, type(e).__name__)
+            return None
+        error = None if estado in esperado else f'HTTP {estado}'
+        self.resultados.registrar(escenario, time.perf_counter() - inicio, error)
+        return None if error else (estado, cabeceras, cuerpo)
+
+    async def _escaner(self):
+        """Escáner de control vial: ráfagas de verificaciones separadas por pausas"""
+        cliente = ClienteHTTP(self.options['url'], self.options['timeout'])
+        try:
+            await asyncio.sleep(self.rng.uniform(0, self.options['pausa']))
+            while time.monotonic() < self.fin:
+                for _ in range(self.options['rafaga']):
+                    if time.monotonic() >= self.fin:
+                        break
+                    await self._medir(cliente, 'verificar_qr', 'GET', self.rng.choice(self.rutas_qr))
+                await asyncio.sleep(self.rng.expovariate(1 / self.options['pausa']))
+        finally:
+            await cliente.cerrar()
+
+    async def _sesion(self, rol):
+        cliente = ClienteHTTP(self.options['url'], self.options['timeout'])
+        try:
+            await asyncio.sleep(self.rng.uniform(0, self.options['pausa_operador']))
+            if await self._login(cliente):
+                while time.monotonic() < self.fin:
+                    await rol(cliente)
+                    await asyncio.sleep(self.rng.expovariate(1 / self.options['pausa_operador']))
+        finally:
+            await cliente.cerrar()
+
+    async def _login(self, cliente):
+        ruta = reverse('security:login')
+        respuesta = await self._medir(cliente, 'login', 'GET', ruta)
+        token = _CSRF.search(respuesta[2].decode()) if respuesta else None
+        if not token:
+            return False
+        respuesta = await self._medir(cliente, 'login', 'POST', ruta, {
+            'csrfmiddlewaretoken': token.group(1),
+            'username': self.options['usuario'],
+            'password': self.options['password'],
+        }, esperado=(302,))
+        if not respuesta or respuesta[1].get('location', '').endswith(ruta):
+            self.stderr.write(self.style.ERROR('Login rechazado: se requiere un superusuario válido'))
+            return False
+        return True
+
+    async def _operador(self, cliente):
+        """Operador: abre el formulario y emite una autorización nueva"""
+        ruta = reverse('formulario:generar_qr')
+        respuesta = await self._medir(cliente, 'generar_qr_form', 'GET', ruta)
+        if not respuesta:
+            return
+        html = respuesta[2].decode()
+        select = _SELECT_TIPO.search(html)
+        token, tipos = _CSRF.search(html), _OPCION.findall(select.group(0)) if select else []
+        if not token or not tipos:
+            return
+
+        indice = self.siguiente_indice
+        self.siguiente_indice += 1
+        await self._medir(cliente, 'generar_qr', 'POST', ruta, {
+            'csrfmiddlewaretoken': token.group(1),
+            'placa': placa_para(indice),
+            'nombres': f'Usuario Carga {indice}',
+            'tipo_identificacion': 'cedula',
+            'cedula': cedula_para(indice),
+            'correo': f'carga{indice}@example.com',
+            'telefono': f'09{(indice * 7919 + 12345678) % 10**8:08d}',
+            'tipo_autorizacion': self.rng.choice(tipos),
+            'numero_autorizacion': f'CAR-{indice:07d}',
+            'vigencia': (timezone.localdate() + timedelta(days=365)).isoformat(),
+        })
+
+    async def _auditor(self, cliente):
+        """Auditor: exporta el historial del último mes"""
+        desde = (timezone.localdate() - timedelta(days=30)).isoformat()
+        ruta = reverse('formulario:historial_autorizaciones_exportar_excel') + f'?fecha_creacion_desde={desde}'
+        await self._medir(cliente, 'exportar_excel', 'GET', ruta)
+
+    # ------------------------------------------------------------------
+    # Reporte
+    # ------------------------------------------------------------------
+
+    def _imprimir(self, resumen, duracion):
+        total = sum(e['solicitudes'] for e in resumen.values())
+        self.stdout.write(self.style.SUCCESS('=' * 60))
+        self.stdout.write(self.style.SUCCESS(
+            f'{total} solicitudes en {duracion:.1f}s ({total / duracion:.1f} req/s)'
+        ))
+        self.stdout.write(self.style.SUCCESS('=' * 60))
+        for escenario, datos in resumen.items():
+            self.stdout.write(
+                f'\n{escenario}: {datos["solicitudes"]} solicitudes, {datos["rps"]} req/s, '
+                f'error {datos["tasa_error"]:.2%}  p50={datos["p50_ms"]}ms  p95={datos["p95_ms"]}ms  '
+                f'p99={datos["p99_ms"]}ms'
+            )
+            for motivo, cantidad in datos['errores'].items():
+                self.stdout.write(self.style.ERROR(f'  {motivo}: {cantidad}'))
+            mayor = max(datos['histograma'].values())
+            for etiqueta, cantidad in datos['histograma'].items():
+                self.stdout.write(f'  {etiqueta:>10} {"#" * max(1, round(40 * cantidad / mayor))} {cantidad}')
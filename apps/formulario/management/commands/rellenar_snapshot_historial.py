@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.db.models import OuterRef, Subquery
+from apps.formulario.models import Autorizacion, HistorialAutorizacion
+
+class Command(BaseCommand):
+    help = 'Rellena las columnas snapshot del historial de autorizaciones con los datos actuales'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=5000,
+            help='Cantidad de registros a actualizar por consulta (default: 5000)'
+        )
+        parser.add_argument(
+            '--forzar',
+            action='store_true',
+            help='Recalcula también los registros que ya tienen snapshot'
+        )
+
+    def handle(self, *args, **options):
+        lote = options['lote']
+
+        pendientes = HistorialAutorizacion.objects.select_related(None)
+        if not options['forzar']:
+            pendientes = pendientes.filter(snapshot_placa__isnull=True)
+
+        # Un UPDATE con subconsultas por lote: no carga filas en Python
+        autorizacion = Autorizacion.objects.filter(pk=OuterRef('autorizacion_id'))
+        valores = {
+            'snapshot_placa': Subquery(autorizacion.values('placa')[:1]),
+            'snapshot_nombres': Subquery(autorizacion.values('usuario__nombres')[:1]),
+            'snapshot_tipo': Subquery(autorizacion.values('tipo_autorizacion__nombre')[:1]),
+            'snapshot_numero': Subquery(autorizacion.values('numero_autorizacion')[:1]),
+            'snapshot_vigencia': Subquery(autorizacion.values('vigencia')[:1]),
+        }
+
+        total = 0
+        ultimo_id = 0
+        while True:
+            ids = list(
+                pendientes.filter(pk__gt=ultimo_id).order_by('pk').values_list('pk', flat=True)[:lote]
+            )
+            if not ids:
+                break
+            total += HistorialAutorizacion.objects.filter(pk__in=ids).update(**valores)
+            ultimo_id = ids[-1]
+            self.stdout.write(f'  {total} registros actualizados...')
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Se rellenó el snapshot de {total} registros de historial'
+            )
+        )
@@ -0,0 +1,86 @@
+import json
+from collections import Counter, defaultdict
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from apps.formulario.consultas_lentas import normalizar_sql
+
+class Command(BaseCommand):
+    help = 'Resume el registro de consultas lentas agrupando por huella de SQL normalizado'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--archivo', help='Registro JSONL (default: CONSULTAS_LENTAS_ARCHIVO)')
+        parser.add_argument('--top', type=int, default=10, help='Cantidad de huellas a mostrar (default: 10)')
+        parser.add_argument('--orden', choices=['total', 'cantidad', 'p95', 'max'], default='total',
+                            help='Criterio de orden (default: total)')
+        parser.add_argument('--desde', help='Solo entradas desde esta fecha (YYYY-MM-DD)')
+        parser.add_argument('--vista', help='Solo consultas originadas en esta vista')
+        parser.add_argument('--planes', action='store_true', help='Mostrar el último plan EXPLAIN de cada huella')
+        parser.add_argument('--json', action='store_true', help='Salida en JSON')
+
+    def handle(self, *args, **options):
+        archivo = options['archivo'] or settings.CONSULTAS_LENTAS_ARCHIVO
+        grupos = defaultdict(list)
+        try:
+            with open(archivo, encoding='utf-8') as f:
+                for linea in f:
+                    try:
+                        entrada = json.loads(linea)
+                    except ValueError:
+                        continue
+                    if options['desde'] and entrada['fecha'] < options['desde']:
+                        continue
+                    if options['vista'] and entrada.get('vista') != options['vista']:
+                        continue
+                    grupos[entrada['huella']].append(entrada)
+        except FileNotFoundError:
+            raise CommandError(f'No existe el registro {archivo}')
+
+        resumen = [self._resumir(huella, entradas) for huella, entradas in grupos.items()]
+        resumen.sort(key=lambda r: r[f'{options["orden"]}_ms' if options['orden'] != 'cantidad' else 'cantidad'],
+                     reverse=True)
+        resumen = resumen[:options['top']]
+
+        if options['json']:
+            self.stdout.write(json.dumps(resumen, indent=2, ensure_ascii=False))
+            return
+
+        if not resumen:
+            self.stdout.write(self.style.WARNING('Sin consultas lentas registradas'))
+            return
+
+        self.stdout.write(self.style.SUCCESS('=' * 60))
+        self.stdout.write(self.style.SUCCESS(
+            f'{sum(r["cantidad"] for r in resumen)} consultas lentas en {len(resumen)} huellas ({archivo})'
+        ))
+        self.stdout.write(self.style.SUCCESS('=' * 60))
+        for posicion, r in enumerate(resumen, 1):
+            self.stdout.write(self.style.WARNING(
+                f'\n{posicion}. [{r["huella"]}] {r["cantidad"]} veces  total={r["total_ms"]}ms  '
+                f'p50={r["p50_ms"]}ms  p95={r["p95_ms"]}ms  max={r["max_ms"]}ms'
+            ))
+            vistas = ', '.join(f'{v} ({n})' for v, n in r['vistas'].items())
+            self.stdout.write(f'   Vistas: {vistas}')
+            self.stdout.write(f'   SQL: {r["sql"][:500]}')
+            if options['planes'] and r['plan']:
+                self.stdout.write('   Plan:')
+                for linea in r['plan'].splitlines():
+                    self.stdout.write(f'     {linea}')
+
+    def _resumir(self, huella, entradas):
+        tiempos = sorted(e['ms'] for e in entradas)
+        planes = [e['plan'] for e in entradas if e.get('plan')]
+
+        def percentil(p):
+            return tiempos[min(len(tiempos) - 1, int(round(p / 100 * (len(tiempos) - 1))))]
+
+        return {
+            'huella': huella,
+            'cantidad': len(tiempos),
+            'total_ms': round(sum(tiempos), 2),
+            'p50_ms': percentil(50),
+            'p95_ms': percentil(95),
+            'max_ms': tiempos[-1],
+            'vistas': dict(Counter(e.get('vista') or 'sin vista' for e in entradas).most_common(5)),
+            'sql': normalizar_sql(entradas[-1]['sql']),
+            'plan': planes[-1] if planes else None,
+        }
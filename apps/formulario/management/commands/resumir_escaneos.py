@@ -0,0 +1,64 @@
+from datetime import datetime, time, timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from apps.formulario.escaneos import buffer
+from apps.formulario.models import EventoEscaneo, ResumenEscaneoDiario
+
+
+def inicio_del_dia(dia):
+    return timezone.make_aware(datetime.combine(dia, time.min))
+
+
+def resumir_dia(dia):
+    """Recalcula el resumen de `dia` desde los eventos (idempotente); retorna los escaneos del día"""
+    filas = EventoEscaneo.objects.filter(
+        fecha__gte=inicio_del_dia(dia),
+        fecha__lt=inicio_del_dia(dia + timedelta(days=1)),
+    ).order_by().values('autorizacion_id', 'tipo_autorizacion_id', 'resultado').annotate(escaneos=Count('id'))
+
+    with transaction.atomic():
+        ResumenEscaneoDiario.objects.filter(fecha=dia).delete()
+        resumenes = ResumenEscaneoDiario.objects.bulk_create(
+            [ResumenEscaneoDiario(fecha=dia, **fila) for fila in filas], batch_size=1000
+        )
+    return sum(resumen.escaneos for resumen in resumenes)
+
+
+class Command(BaseCommand):
+    help = (
+        'Resume los eventos de escaneo por día, autorización, tipo y resultado para el dashboard '
+        '(programar a diario después de la medianoche) y purga los eventos antiguos'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fecha', help='Último día a resumir, AAAA-MM-DD (default: ayer)')
+        parser.add_argument('--dias', type=int, default=1, help='Días a resumir hasta --fecha (default: 1)')
+        parser.add_argument(
+            '--purgar',
+            action='store_true',
+            help='Eliminar eventos con más de ESCANEOS_RETENCION_DIAS días (los resúmenes se conservan)'
+        )
+
+    def handle(self, *args, **options):
+        hoy = timezone.localdate()
+        try:
+            fecha = datetime.strptime(options['fecha'], '%Y-%m-%d').date() if options['fecha'] else hoy - timedelta(days=1)
+        except ValueError:
+            raise CommandError('--fecha debe tener el formato AAAA-MM-DD')
+
+        # Eventos que este proceso tenga todavía en memoria (p. ej. al correr desde el shell)
+        buffer.vaciar()
+
+        for desplazamiento in range(options['dias'] - 1, -1, -1):
+            dia = fecha - timedelta(days=desplazamiento)
+            self.stdout.write(f'  {dia}: {resumir_dia(dia)} escaneos')
+
+        if options['purgar']:
+            limite = inicio_del_dia(hoy - timedelta(days=settings.ESCANEOS_RETENCION_DIAS))
+            eliminados, _ = EventoEscaneo.objects.filter(fecha__lt=limite).delete()
+            self.stdout.write(f'  {eliminados} eventos anteriores a {limite.date()} eliminados')
+
+        self.stdout.write(self.style.SUCCESS('Resumen de escaneos actualizado'))
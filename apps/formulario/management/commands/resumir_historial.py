@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from apps.formulario.resumen_historial import actualizar_resumen
+
+
+class Command(BaseCommand):
+    help = (
+        'Actualiza el resumen del historial de autorizaciones (día, tipo, operador y mes de '
+        'vencimiento) desde la última corrida; programarlo cada pocos minutos o a diario'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--completo',
+            action='store_true',
+            help='Reconstruir todo el resumen (p. ej. después de eliminar autorizaciones antiguas)'
+        )
+
+    def handle(self, *args, **options):
+        resultado = actualizar_resumen(completo=options['completo'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Resumen actualizado hasta el registro {resultado["ultimo_id"]}: '
+            f'{resultado["registros"]} emisiones recalculadas en {resultado["filas"]} filas'
+        ))
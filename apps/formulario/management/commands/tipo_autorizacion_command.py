@@ -1,4 +1,5 @@
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from django.utils import timezone
 from apps.formulario.models import TipoAutorizacion
 
@@ -57,21 +58,22 @@ class Command(BaseCommand):
         nuevos_insertados = []
         ya_existentes = []
         
-        # Insertar tipos de autorización
-        for tipo_data in tipos_autorizacion:
-            tipo, creado = TipoAutorizacion.objects.get_or_create(
-                codigo=tipo_data['codigo'],
-                defaults={
-                    'nombre': tipo_data['nombre'],
-                    'descripcion': tipo_data['descripcion'],
-                    'activo': True
-                }
-            )
+        # Insertar tipos de autorización (todos o ninguno)
+        with transaction.atomic():
+            for tipo_data in tipos_autorizacion:
+                tipo, creado = TipoAutorizacion.objects.get_or_create(
+                    codigo=tipo_data['codigo'],
+                    defaults={
+                        'nombre': tipo_data['nombre'],
+                        'descripcion': tipo_data['descripcion'],
+                        'activo': True
+                    }
+                )
             
-            if creado:
-                nuevos_insertados.append(tipo)
-            else:
-                ya_existentes.append(tipo)
+                if creado:
+                    nuevos_insertados.append(tipo)
+                else:
+                    ya_existentes.append(tipo)
         
         # Contar tipos después de insertar
         tipos_existentes_despues = TipoAutorizacion.objects.count()
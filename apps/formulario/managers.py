@@ -0,0 +1,89 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import models
+from django.db.models.fields.related_descriptors import ForwardManyToOneDescriptor
+
+# ============================================================================
+# GUARDIA CONTRA CARGAS PEREZOSAS DE FK (N+1)
+# ============================================================================
+
+_prohibir_fk_perezosas = ContextVar('prohibir_fk_perezosas', default=False)
+
+
+class CargaPerezosaError(RuntimeError):
+    """Se intentó cargar una FK con una consulta adicional estando la guardia activa"""
+
+
+@contextmanager
+def prohibir_fk_perezosas():
+    """Activa la guardia dentro del bloque (pensado para tests)"""
+    token = _prohibir_fk_perezosas.set(True)
+    try:
+        yield
+    finally:
+        _prohibir_fk_perezosas.reset(token)
+
+
+def guardia_activa():
+    """La guardia se activa por contexto o globalmente con FORMULARIO_PROHIBIR_FK_PEREZOSAS"""
+    return _prohibir_fk_perezosas.get() or getattr(settings, 'FORMULARIO_PROHIBIR_FK_PEREZOSAS', False)
+
+
+class DescriptorFKEstricto(ForwardManyToOneDescriptor):
+    """Descriptor de FK que lanza CargaPerezosaError si la relación no vino en el select_related"""
+
+    def get_object(self, instance):
+        if guardia_activa():
+            raise CargaPerezosaError(
+                f'Carga perezosa de {self.field.model.__name__}.{self.field.name} '
+                f'(id={instance.pk}). Agregue select_related("{self.field.name}") a la consulta.'
+            )
+        return super().get_object(instance)
+
+
+def instalar_guardia_fk(model, *campos):
+    """Reemplaza los descriptores de las FK indicadas por DescriptorFKEstricto"""
+    for campo in campos:
+        setattr(model, campo, DescriptorFKEstricto(model._meta.get_field(campo)))
+
+
+# ============================================================================
+# QUERYSETS Y MANAGERS
+# ============================================================================
+
+class HistorialAutorizacionQuerySet(models.QuerySet):
+
+    def con_relaciones(self):
+        """Relaciones que usan __str__, las propiedades de acceso rápido y el admin"""
+        return self.select_related(
+            'autorizacion',
+            'autorizacion__usuario',
+            'autorizacion__tipo_autorizacion',
+            'creado_por'
+        )
+
+
+class HistorialAutorizacionManager(models.Manager.from_queryset(HistorialAutorizacionQuerySet)):
+    """Manager por defecto: siempre une las relaciones necesarias para listar"""
+
+    def get_queryset(self):
+        return super().get_queryset().con_relaciones()
+
+
+class HistorialAccionesQuerySet(models.QuerySet):
+
+    def con_relaciones(self):
+        """Relaciones que usan __str__ y los listados (la autorización se muestra con su usuario)"""
+        return self.select_related(
+            'autorizacion',
+            'autorizacion__usuario',
+            'creado_por'
+        )
+
+
+class HistorialAccionesManager(models.Manager.from_queryset(HistorialAccionesQuerySet)):
+    """Manager por defecto: siempre une las relaciones necesarias para listar"""
+
+    def get_queryset(self):
+        return super().get_queryset().con_relaciones()
@@ -0,0 +1,404 @@
+import cProfile
+import functools
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+
+try:
+    from pyinstrument import Profiler
+except ImportError:  # pyinstrument es opcional: se usa cProfile
+    Profiler = None
+
+logger = logging.getLogger('apps.formulario.instrumentacion')
+
+# ============================================================================
+# MIDDLEWARE SÍNCRONO Y ASÍNCRONO
+# ============================================================================
+
+class MiddlewareHibrido:
+    """
+    Base de los middleware que sirven con WSGI y con ASGI. En una cadena
+    asíncrona __call__ debe delegar en __acall__: un middleware solo síncrono
+    obligaría a Django a atender todo el resto del request en un hilo.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.asincrono = iscoroutinefunction(get_response)
+        if self.asincrono:
+            markcoroutinefunction(self)
+
+
+# ============================================================================
+# OBSERVADORES DE CONSULTAS
+# ============================================================================
+
+# execute_wrappers activos en el request en curso. Viven en el contexto y no en
+# la conexión para ver también las consultas del ORM asíncrono, que se ejecutan
+# en otro hilo (sync_to_async copia el contexto)
+_observadores = ContextVar('observadores_consultas', default=())
+
+
+def _ejecutar_observado(execute, sql, params, many, context):
+    for observador in reversed(_observadores.get()):
+        execute = functools.partial(observador, execute)
+    return execute(sql, params, many, context)
+
+
+def instalar_observador(sender, connection, **kwargs):
+    """Receptor de connection_created: agrega _ejecutar_observado a cada conexión nueva"""
+    if _ejecutar_observado not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _ejecutar_observado)
+
+
+@contextmanager
+def observar_consultas(observador):
+    """Pasa al observador (un execute_wrapper) cada consulta ejecutada dentro del bloque"""
+    token = _observadores.set(_observadores.get() + (observador,))
+    try:
+        yield observador
+    finally:
+        _observadores.reset(token)
+
+
+# ============================================================================
+# MÉTRICAS POR REQUEST
+# ============================================================================
+
+class MetricasRecientes:
+    """Ventana deslizante (por proceso) de las últimas mediciones por nombre de URL"""
+
+    def __init__(self, tamano=500):
+        self.tamano = tamano
+        self._lock = threading.Lock()
+        self._mediciones = defaultdict(lambda: deque(maxlen=self.tamano))
+
+    def registrar(self, nombre, total_ms, consultas, db_ms):
+        with self._lock:
+            self._mediciones[nombre].append((total_ms, consultas, db_ms))
+
+    def limpiar(self):
+        with self._lock:
+            self._mediciones.clear()
+
+    def resumen(self):
+        """Percentiles p50/p95/p99 de tiempo total, consultas y tiempo de BD por URL"""
+        with self._lock:
+            copia = {nombre: list(valores) for nombre, valores in self._mediciones.items()}
+
+        resumen = {}
+        for nombre, valores in sorted(copia.items()):
+            totales = sorted(v[0] for v in valores)
+            consultas = sorted(v[1] for v in valores)
+            db = sorted(v[2] for v in valores)
+            resumen[nombre] = {
+                'requests': len(valores),
+                'total_ms': self._percentiles(totales),
+                'consultas': self._percentiles(consultas),
+                'db_ms': self._percentiles(db),
+            }
+        return resumen
+
+    def _percentiles(self, ordenados):
+        def percentil(p):
+            return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+        return {'p50': percentil(50), 'p95': percentil(95), 'p99': percentil(99)}
+
+
+metricas = MetricasRecientes(getattr(settings, 'INSTRUMENTACION_VENTANA', 500))
+
+
+class _Medicion:
+    """Acumula consultas y tiempo de BD de un request (via connection.execute_wrapper)"""
+
+    def __init__(self):
+        self.consultas = 0
+        self.db = 0.0
+        self.render = None
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - inicio
+            self.consultas += 1
+
+
+class InstrumentacionMiddleware(MiddlewareHibrido):
+    """
+    Mide consultas SQL, tiempo de BD, tiempo de render y tiempo total por request.
+
+    Escribe una línea JSON en el logger apps.formulario.instrumentacion y acumula
+    percentiles por URL del namespace formulario. La cabecera Server-Timing solo
+    se agrega para usuarios staff (o para todos con INSTRUMENTACION_SERVER_TIMING):
+    no mostrar consultas ni tiempos internos en la verificación pública. Solo se
+    mide la fracción INSTRUMENTACION_MUESTREO de los requests.
+    """
+
+    def __call__(self, request):
+        if self.asincrono:
+            return self.__acall__(request)
+        if not self._muestreado():
+            return self.get_response(request)
+
+        inicio = time.perf_counter()
+        with observar_consultas(_Medicion()) as medicion:
+            request._medicion = medicion
+            response = self.get_response(request)
+        total = time.perf_counter() - inicio
+        cabecera = settings.INSTRUMENTACION_SERVER_TIMING or self._staff(getattr(request, 'user', None))
+        return self._registrar(request, response, medicion, total, cabecera)
+
+    async def __acall__(self, request):
+        if not self._muestreado():
+            return await self.get_response(request)
+
+        inicio = time.perf_counter()
+        with observar_consultas(_Medicion()) as medicion:
+            request._medicion = medicion
+            response = await self.get_response(request)
+        total = time.perf_counter() - inicio
+        cabecera = settings.INSTRUMENTACION_SERVER_TIMING or self._staff(
+            await request.auser() if hasattr(request, 'auser') else None
+        )
+        return self._registrar(request, response, medicion, total, cabecera)
+
+    def _muestreado(self):
+        return settings.INSTRUMENTACION_ACTIVA and random.random() < settings.INSTRUMENTACION_MUESTREO
+
+    def _staff(self, user):
+        return bool(user and user.is_authenticated and user.is_staff)
+
+    def _registrar(self, request, response, medicion, total, cabecera):
+        vista = request.resolver_match.view_name if request.resolver_match else None
+        total_ms = round(total * 1000, 2)
+        db_ms = round(medicion.db * 1000, 2)
+
+        if cabecera:
+            partes = [
+                f'db;dur={db_ms};desc="{medicion.consultas} consultas"',
+                f'total;dur={total_ms}',
+            ]
+            if medicion.render is not None:
+                partes.insert(1, f'render;dur={round(medicion.render * 1000, 2)}')
+            response['Server-Timing'] = ', '.join(partes)
+
+        logger.info(json.dumps({
+            'vista': vista,
+            'metodo': request.method,
+            'ruta': request.path,
+            'estado': response.status_code,
+            'consultas': medicion.consultas,
+            'db_ms': db_ms,
+            'render_ms': round(medicion.render * 1000, 2) if medicion.render is not None else None,
+            'total_ms': total_ms,
+        }))
+
+        if vista and vista.startswith('formulario:'):
+            metricas.registrar(vista, total_ms, medicion.consultas, db_ms)
+
+        return response
+
+    def process_template_response(self, request, response):
+        # Las TemplateResponse (ListView, TemplateView...) se renderizan después de este hook
+        medicion = getattr(request, '_medicion', None)
+        if medicion is not None:
+            inicio = time.perf_counter()
+
+            def fin_render(response):
+                medicion.render = time.perf_counter() - inicio
+
+            response.add_post_render_callback(fin_render)
+        return response
+
+
+# ============================================================================
+# PERFILAMIENTO BAJO DEMANDA
+# ============================================================================
+
+# Nombre base de un perfil: timestamp + vista, sin separadores de ruta
+_NOMBRE_PERFIL = re.compile(r'^[0-9]{8}-[0-9]{6}-[0-9]{6}-[A-Za-z0-9_.-]+$')
+
+
+def ruta_perfil(nombre):
+    """Ruta absoluta de un archivo de perfil, o None si el nombre no es válido"""
+    base, _, extension = nombre.rpartition('.')
+    if not _NOMBRE_PERFIL.match(base) or extension not in ('json', 'html', 'txt', 'prof'):
+        return None
+    return os.path.join(settings.PERFILAMIENTO_DIR, nombre)
+
+
+def listar_perfiles():
+    """Metadatos de los perfiles guardados, del más reciente al más antiguo"""
+    try:
+        archivos = sorted(
+            (a for a in os.listdir(settings.PERFILAMIENTO_DIR) if a.endswith('.json')), reverse=True
+        )
+    except FileNotFoundError:
+        return []
+
+    perfiles = []
+    for archivo in archivos:
+        with open(os.path.join(settings.PERFILAMIENTO_DIR, archivo), encoding='utf-8') as f:
+            perfiles.append(json.load(f))
+    return perfiles
+
+
+class _RegistroSQL:
+    """Guarda cada consulta del request con su duración (sin parámetros)"""
+
+    def __init__(self):
+        self.consultas = []
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.consultas.append({'sql': sql, 'ms': round((time.perf_counter() - inicio) * 1000, 3)})
+
+
+class _Perfilador:
+    """pyinstrument (muestreo) si está instalado; si no, cProfile"""
+
+    def __init__(self):
+        self.tipo = 'pyinstrument' if Profiler else 'cProfile'
+        self._perfil = Profiler(interval=0.001) if Profiler else cProfile.Profile()
+
+    def iniciar(self):
+        if Profiler:
+            self._perfil.start()
+        else:
+            self._perfil.enable()
+
+    def detener(self):
+        if Profiler:
+            self._perfil.stop()
+        else:
+            self._perfil.disable()
+
+    def guardar(self, ruta):
+        """Escribe el perfil junto a `ruta` y devuelve los nombres de archivo"""
+        nombre = os.path.basename(ruta)
+        if Profiler:
+            with open(f'{ruta}.html', 'w', encoding='utf-8') as f:
+                f.write(self._perfil.output_html())
+            return [f'{nombre}.html']
+
+        self._perfil.dump_stats(f'{ruta}.prof')
+        texto = io.StringIO()
+        pstats.Stats(self._perfil, stream=texto).sort_stats('cumulative').print_stats(60)
+        with open(f'{ruta}.txt', 'w', encoding='utf-8') as f:
+            f.write(texto.getvalue())
+        return [f'{nombre}.txt', f'{nombre}.prof']
+
+
+class PerfilamientoMiddleware(MiddlewareHibrido):
+    """
+    Perfila un request puntual cuando un usuario staff lo pide con ?_perfil=1
+    o la cabecera X-Perfil: 1 (y PERFILAMIENTO_ACTIVO está encendido).
+
+    Guarda en PERFILAMIENTO_DIR un .json con las consultas SQL y sus tiempos y
+    el perfil: .html de pyinstrument (muestreo) o .prof/.txt de cProfile.
+    Debe ir después de AuthenticationMiddleware.
+    """
+
+    def __call__(self, request):
+        if self.asincrono:
+            return self.__acall__(request)
+        if not (self._solicitado(request) and self._autorizado(getattr(request, 'user', None))):
+            return self.get_response(request)
+
+        registro = _RegistroSQL()
+        perfilador = _Perfilador()
+        inicio = time.perf_counter()
+        with observar_consultas(registro):
+            perfilador.iniciar()
+            try:
+                response = self.get_response(request)
+            finally:
+                perfilador.detener()
+        total = time.perf_counter() - inicio
+
+        response['X-Perfil'] = self._guardar(request, response, perfilador, registro, total)
+        return response
+
+    async def __acall__(self, request):
+        if not (self._solicitado(request) and self._autorizado(
+                await request.auser() if hasattr(request, 'auser') else None)):
+            return await self.get_response(request)
+
+        # Con ASGI el perfil es del event loop: incluye lo que corran otros requests a la vez
+        registro = _RegistroSQL()
+        perfilador = _Perfilador()
+        inicio = time.perf_counter()
+        with observar_consultas(registro):
+            perfilador.iniciar()
+            try:
+                response = await self.get_response(request)
+            finally:
+                perfilador.detener()
+        total = time.perf_counter() - inicio
+
+        response['X-Perfil'] = await sync_to_async(self._guardar)(request, response, perfilador, registro, total)
+        return response
+
+    def _solicitado(self, request):
+        return settings.PERFILAMIENTO_ACTIVO and (
+            request.GET.get('_perfil') == '1' or request.headers.get('X-Perfil') == '1'
+        )
+
+    def _autorizado(self, user):
+        return bool(user and user.is_authenticated and user.is_staff)
+
+    def _guardar(self, request, response, perfilador, registro, total):
+        os.makedirs(settings.PERFILAMIENTO_DIR, exist_ok=True)
+        vista = request.resolver_match.view_name if request.resolver_match else 'sin_vista'
+        nombre = f"{datetime.now():%Y%m%d-%H%M%S-%f}-{re.sub(r'[^A-Za-z0-9_.-]', '_', vista)}"
+        ruta = os.path.join(settings.PERFILAMIENTO_DIR, nombre)
+
+        archivos = perfilador.guardar(ruta)
+
+        with open(f'{ruta}.json', 'w', encoding='utf-8') as f:
+            json.dump({
+                'nombre': nombre,
+                'fecha': datetime.now().isoformat(timespec='seconds'),
+                'vista': vista,
+                'metodo': request.method,
+                'ruta': request.get_full_path(),
+                'usuario': request.user.get_username(),
+                'estado': response.status_code,
+                'total_ms': round(total * 1000, 2),
+                'db_ms': round(sum(c['ms'] for c in registro.consultas), 2),
+                'perfilador': perfilador.tipo,
+                'archivos': archivos,
+                'consultas': registro.consultas,
+            }, f, indent=2)
+
+        self._depurar()
+        return nombre
+
+    def _depurar(self):
+        """Conserva solo los PERFILAMIENTO_MAXIMO perfiles más recientes"""
+        bases = sorted({a.rsplit('.', 1)[0] for a in os.listdir(settings.PERFILAMIENTO_DIR)}, reverse=True)
+        for base in bases[settings.PERFILAMIENTO_MAXIMO:]:
+            for extension in ('json', 'html', 'txt', 'prof'):
+                try:
+                    os.remove(os.path.join(settings.PERFILAMIENTO_DIR, f'{base}.{extension}'))
+                except FileNotFoundError:
+                    pass
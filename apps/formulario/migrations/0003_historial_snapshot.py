@@ -0,0 +1,44 @@
+# Generated by Django 5.2.7 on 2026-10-18 23:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('formulario', '0002_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historialautorizacion',
+            name='snapshot_nombres',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='Nombres (emisión)'),
+        ),
+        migrations.AddField(
+            model_name='historialautorizacion',
+            name='snapshot_numero',
+            field=models.CharField(blank=True, max_length=30, null=True, verbose_name='Número de Autorización (emisión)'),
+        ),
+        migrations.AddField(
+            model_name='historialautorizacion',
+            name='snapshot_placa',
+            field=models.CharField(blank=True, max_length=20, null=True, verbose_name='Placa (emisión)'),
+        ),
+        migrations.AddField(
+            model_name='historialautorizacion',
+            name='snapshot_tipo',
+            field=models.CharField(blank=True, max_length=50, null=True, verbose_name='Tipo de Autorización (emisión)'),
+        ),
+        migrations.AddField(
+            model_name='historialautorizacion',
+            name='snapshot_vigencia',
+            field=models.DateField(blank=True, null=True, verbose_name='Vigencia (emisión)'),
+        ),
+        migrations.AddIndex(
+            model_name='historialautorizacion',
+            index=models.Index(fields=['-fecha_creacion'], include=('snapshot_placa', 'snapshot_nombres', 'snapshot_tipo', 'snapshot_numero', 'snapshot_vigencia'), name='hist_aut_snapshot_idx'),
+        ),
+    ]
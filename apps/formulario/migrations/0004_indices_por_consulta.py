@@ -0,0 +1,65 @@
+# Generated by Django 5.2.7 on 2026-10-18 23:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('formulario', '0003_historial_snapshot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='autorizacion',
+            name='formulario__numero__2b9ffe_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='autorizacion',
+            name='formulario__activo_52e081_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='historialautorizacion',
+            name='formulario__fecha_c_61b4a4_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='historialautorizacion',
+            name='formulario__fecha_c_a78caa_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='usuarioautorizacion',
+            name='formulario__cedula_a56719_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='usuarioautorizacion',
+            name='formulario__ruc_09812e_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='usuarioautorizacion',
+            name='formulario__correo_c363eb_idx',
+        ),
+        migrations.AlterField(
+            model_name='autorizacion',
+            name='usuario',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='autorizaciones', to='formulario.usuarioautorizacion', verbose_name='Usuario'),
+        ),
+        migrations.AddIndex(
+            model_name='autorizacion',
+            index=models.Index(fields=['activo', 'vigencia'], name='aut_activo_vigencia_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='autorizacion',
+            index=models.Index(condition=models.Q(('activo', True)), fields=['placa', 'numero_autorizacion'], name='aut_verificacion_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historialacciones',
+            index=models.Index(fields=['-fecha_accion'], name='hist_acc_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historialacciones',
+            index=models.Index(fields=['accion', '-fecha_accion'], name='hist_acc_accion_fecha_idx'),
+        ),
+    ]
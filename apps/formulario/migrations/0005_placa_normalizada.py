@@ -0,0 +1,43 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:11
+
+import re
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def normalizar_placa(placa):
+    # Copia de models.normalizar_placa al crear esta migración: no debe seguir sus cambios
+    return re.sub(r'[^0-9A-Za-z]', '', placa or '').upper()
+
+
+def rellenar_placa_normalizada(apps, schema_editor):
+    Autorizacion = apps.get_model('formulario', 'Autorizacion')
+    pendientes = Autorizacion.objects.order_by('pk').only('pk', 'placa')
+    ultimo_id = 0
+    while lote := list(pendientes.filter(pk__gt=ultimo_id)[:5000]):
+        for autorizacion in lote:
+            autorizacion.placa_normalizada = normalizar_placa(autorizacion.placa)
+        Autorizacion.objects.bulk_update(lote, ['placa_normalizada'], batch_size=1000)
+        ultimo_id = lote[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('formulario', '0004_indices_por_consulta'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='autorizacion',
+            name='placa_normalizada',
+            field=models.CharField(default='', editable=False, max_length=20),
+        ),
+        migrations.RunPython(rellenar_placa_normalizada, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='autorizacion',
+            index=models.Index(fields=['placa_normalizada'], name='aut_placa_normalizada_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('formulario', '0005_placa_normalizada'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoEscaneo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateTimeField(verbose_name='Fecha del escaneo')),
+                ('resultado', models.CharField(choices=[('vigente', 'Vigente'), ('caducada', 'Caducada'), ('no_encontrada', 'No encontrada'), ('incompleta', 'Datos incompletos'), ('error', 'Error')], max_length=15, verbose_name='Resultado')),
+                ('ip', models.GenericIPAddressField(blank=True, null=True, verbose_name='IP')),
+                ('autorizacion', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='formulario.autorizacion')),
+                ('tipo_autorizacion', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='formulario.tipoautorizacion')),
+            ],
+            options={
+                'verbose_name': 'Evento de Escaneo',
+                'verbose_name_plural': 'Eventos de Escaneo',
+                'db_table': 'formulario_evento_escaneo',
+                'indexes': [models.Index(fields=['fecha'], name='escaneo_fecha_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ResumenEscaneoDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(verbose_name='Fecha')),
+                ('resultado', models.CharField(choices=[('vigente', 'Vigente'), ('caducada', 'Caducada'), ('no_encontrada', 'No encontrada'), ('incompleta', 'Datos incompletos'), ('error', 'Error')], max_length=15, verbose_name='Resultado')),
+                ('escaneos', models.PositiveIntegerField(verbose_name='Escaneos')),
+                ('autorizacion', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='formulario.autorizacion')),
+                ('tipo_autorizacion', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='formulario.tipoautorizacion')),
+            ],
+            options={
+                'verbose_name': 'Resumen Diario de Escaneos',
+                'verbose_name_plural': 'Resúmenes Diarios de Escaneos',
+                'db_table': 'formulario_resumen_escaneo_diario',
+                'indexes': [models.Index(fields=['fecha', 'tipo_autorizacion'], name='resumen_escaneo_fecha_idx')],
+            },
+        ),
+    ]
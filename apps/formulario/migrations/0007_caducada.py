@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:34
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def marcar_caducadas(apps, schema_editor):
+    Autorizacion = apps.get_model('formulario', 'Autorizacion')
+    Autorizacion.objects.filter(vigencia__lt=timezone.localdate()).update(caducada=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('formulario', '0006_escaneos'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='autorizacion',
+            name='caducada',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Caducada'),
+        ),
+        migrations.RunPython(marcar_caducadas, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='autorizacion',
+            index=models.Index(condition=models.Q(('caducada', False)), fields=['vigencia'], name='aut_vigentes_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='autorizacion',
+            index=models.Index(condition=models.Q(('caducada', True)), fields=['-fecha_creacion'], name='aut_caducadas_idx'),
+        ),
+    ]
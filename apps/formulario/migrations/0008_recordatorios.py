@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('formulario', '0007_caducada'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecordatorioVencimiento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('vigencia', models.DateField(verbose_name='Vigencia Avisada')),
+                ('dias', models.PositiveSmallIntegerField(verbose_name='Días de Anticipación')),
+                ('correo', models.EmailField(max_length=254, verbose_name='Correo Electrónico')),
+                ('fecha_envio', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de Envío')),
+                ('autorizacion', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='recordatorios', to='formulario.autorizacion')),
+            ],
+            options={
+                'verbose_name': 'Recordatorio de Vencimiento',
+                'verbose_name_plural': 'Recordatorios de Vencimiento',
+                'db_table': 'formulario_recordatorio_vencimiento',
+                'constraints': [models.UniqueConstraint(fields=('autorizacion', 'vigencia', 'dias'), name='unique_recordatorio_vencimiento')],
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('formulario', '0008_recordatorios'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarcaResumen',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=50, unique=True, verbose_name='Nombre')),
+                ('ultimo_id', models.BigIntegerField(default=0, verbose_name='Último ID')),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True, verbose_name='Fecha de Actualización')),
+            ],
+            options={
+                'verbose_name': 'Marca de Resumen',
+                'verbose_name_plural': 'Marcas de Resumen',
+                'db_table': 'formulario_marca_resumen',
+            },
+        ),
+        migrations.CreateModel(
+            name='ResumenHistorialDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(verbose_name='Fecha de Emisión')),
+                ('mes_vencimiento', models.DateField(verbose_name='Mes de Vencimiento')),
+                ('emitidas', models.PositiveIntegerField(verbose_name='Emitidas')),
+                ('creado_por', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('tipo_autorizacion', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='formulario.tipoautorizacion')),
+            ],
+            options={
+                'verbose_name': 'Resumen Diario de Historial',
+                'verbose_name_plural': 'Resúmenes Diarios de Historial',
+                'db_table': 'formulario_resumen_historial_diario',
+                'indexes': [models.Index(fields=['fecha'], name='resumen_hist_fecha_idx'), models.Index(fields=['mes_vencimiento'], name='resumen_hist_vence_idx')],
+            },
+        ),
+    ]
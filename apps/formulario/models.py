@@ -1,7 +1,14 @@
+import re
+from django.conf import settings
 from django.db import models
 from django.core.validators import RegexValidator
 from django.utils.translation import gettext_lazy as _
 from apps.security.models import User
+from apps.formulario.managers import HistorialAccionesManager, HistorialAutorizacionManager, instalar_guardia_fk
+
+def normalizar_placa(placa):
+    """Placa solo con letras y números, en mayúsculas ('abc-1234 ' -> 'ABC1234')"""
+    return re.sub(r'[^0-9A-Za-z]', '', placa or '').upper()
 
 # Clase base de auditoría
 class AuditoriaModel(models.Model):
@@ -91,10 +98,8 @@ class UsuarioAutorizacion(AuditoriaModel):
         verbose_name = 'Usuario con Autorización'
         verbose_name_plural = 'Usuarios con Autorización'
         ordering = ['nombres']
+        # cedula, ruc y correo ya tienen índice por ser unique
         indexes = [
-            models.Index(fields=['cedula']),
-            models.Index(fields=['ruc']),
-            models.Index(fields=['correo']),
             models.Index(fields=['nombres']),
         ]
     
@@ -118,7 +123,8 @@ class Autorizacion(AuditoriaModel):
         UsuarioAutorizacion,
         on_delete=models.CASCADE,
         related_name='autorizaciones',
-        verbose_name='Usuario'
+        verbose_name='Usuario',
+        db_index=False  # cubierto por unique_usuario_placa_tipo (usuario es su primera columna)
     )
     tipo_autorizacion = models.ForeignKey(
         TipoAutorizacion,
@@ -133,6 +139,9 @@ class Autorizacion(AuditoriaModel):
         max_length=20,
         help_text='Ej: OBM0979-ABC1234'
     )
+    # normalizar_placa(placa), calculada en save(): búsqueda exacta por placa
+    # venga como venga escrita (verificación por lote)
+    placa_normalizada = models.CharField(max_length=20, editable=False, default='')
     
     # Información de la autorización
     numero_autorizacion = models.CharField(
@@ -151,6 +160,8 @@ class Autorizacion(AuditoriaModel):
         help_text='URL del código QR generado'
     )
     qr_generado = models.BooleanField('QR Generado', default=False)
+    # Lo mantiene save() y lo actualiza a diario caducar_autorizaciones
+    caducada = models.BooleanField('Caducada', default=False, editable=False)
     
     # Auditoría específica de autorización
     fecha_descarga_qr = models.DateTimeField(
@@ -169,12 +180,31 @@ class Autorizacion(AuditoriaModel):
         verbose_name = 'Autorización'
         verbose_name_plural = 'Autorizaciones'
         ordering = ['-fecha_creacion']
+        # numero_autorizacion ya tiene índice por ser unique
         indexes = [
             models.Index(fields=['placa']),
-            models.Index(fields=['numero_autorizacion']),
+            models.Index(fields=['placa_normalizada'], name='aut_placa_normalizada_idx'),
             models.Index(fields=['vigencia']),
             models.Index(fields=['fecha_creacion']),
-            models.Index(fields=['activo']),
+            # Dashboard: activas y activas por vigencia (reemplaza al índice de activo solo)
+            models.Index(fields=['activo', 'vigencia'], name='aut_activo_vigencia_idx'),
+            # Verificación de QR: placa + número entre las activas
+            models.Index(
+                fields=['placa', 'numero_autorizacion'],
+                condition=models.Q(activo=True),
+                name='aut_verificacion_idx'
+            ),
+            # Filtros de estado: índices parciales chicos sobre la columna caducada
+            models.Index(
+                fields=['vigencia'],
+                condition=models.Q(caducada=False),
+                name='aut_vigentes_idx'
+            ),
+            models.Index(
+                fields=['-fecha_creacion'],
+                condition=models.Q(caducada=True),
+                name='aut_caducadas_idx'
+            ),
         ]
         constraints = [
             models.UniqueConstraint(
@@ -186,6 +216,28 @@ class Autorizacion(AuditoriaModel):
     def __str__(self):
         return f"{self.placa} - {self.numero_autorizacion} - {self.usuario.nombres}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instancia = super().from_db(db, field_names, values)
+        # Placa y número tal como se leyeron: si se editan, verificacion invalida
+        # también la clave vieja sin volver a consultar la BD
+        if 'placa' in instancia.__dict__ and 'numero_autorizacion' in instancia.__dict__:
+            instancia._placa_numero_leidos = (instancia.placa, instancia.numero_autorizacion)
+        return instancia
+
+    def save(self, *args, **kwargs):
+        from apps.formulario.utils import validar_autorizacion_caducada
+        self.placa_normalizada = normalizar_placa(self.placa)
+        if self.vigencia:
+            self.caducada = validar_autorizacion_caducada(self.vigencia)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            derivados = {'placa_normalizada'} if 'placa' in update_fields else set()
+            if 'vigencia' in update_fields:
+                derivados.add('caducada')
+            kwargs['update_fields'] = {*update_fields, *derivados}
+        super().save(*args, **kwargs)
+
     def get_tipo_autorizacion_display(self):
         """Retorna el nombre del tipo de autorización"""
         return self.tipo_autorizacion.nombre if self.tipo_autorizacion else "No especificado"
@@ -193,15 +245,14 @@ class Autorizacion(AuditoriaModel):
     @property
     def esta_caducada(self):
         """Verifica si la autorización está caducada"""
-        from django.utils import timezone
-        return self.vigencia < timezone.now().date()
+        from apps.formulario.utils import validar_autorizacion_caducada
+        return validar_autorizacion_caducada(self.vigencia)
     
     @property
     def dias_restantes(self):
         """Calcula los días restantes para la caducidad"""
         from django.utils import timezone
-        from datetime import date
-        hoy = timezone.now().date()
+        hoy = timezone.localdate()
         if self.vigencia > hoy:
             return (self.vigencia - hoy).days
         return 0
@@ -227,14 +278,23 @@ class HistorialAcciones(AuditoriaModel):
         verbose_name='Usuario que realizó la acción'
     )
     
+    objects = HistorialAccionesManager()
+    
     class Meta:
         db_table = 'formulario_historial_acciones'
         verbose_name = 'Historial de Acción'
         verbose_name_plural = 'Historial de Acciones'
         ordering = ['-fecha_accion']
+        indexes = [
+            # Listado y actividad reciente ordenados por fecha
+            models.Index(fields=['-fecha_accion'], name='hist_acc_fecha_idx'),
+            # Filtro y conteos por acción con el mismo orden
+            models.Index(fields=['accion', '-fecha_accion'], name='hist_acc_accion_fecha_idx'),
+        ]
     
     def __str__(self):
-        return f"{self.autorizacion.placa} - {self.accion} - {self.fecha_accion}"
+        placa = self.autorizacion.placa if self.autorizacion else 'Sin autorización'
+        return f"{placa} - {self.accion} - {self.fecha_accion}"
 
 class HistorialAutorizacion(AuditoriaModel):
     """
@@ -261,46 +321,226 @@ class HistorialAutorizacion(AuditoriaModel):
     
     # fecha_creacion viene de AuditoriaModel (auto_now_add=True)
     
+    # Snapshot de la autorización al momento de la emisión (FORMULARIO_HISTORIAL_SNAPSHOT).
+    # Permite que los reportes lean solo esta tabla y que el historial no cambie
+    # si luego se edita el usuario o la autorización.
+    snapshot_placa = models.CharField('Placa (emisión)', max_length=20, blank=True, null=True)
+    snapshot_nombres = models.CharField('Nombres (emisión)', max_length=100, blank=True, null=True)
+    snapshot_tipo = models.CharField('Tipo de Autorización (emisión)', max_length=50, blank=True, null=True)
+    snapshot_numero = models.CharField('Número de Autorización (emisión)', max_length=30, blank=True, null=True)
+    snapshot_vigencia = models.DateField('Vigencia (emisión)', blank=True, null=True)
+    
+    # Siempre une autorizacion, usuario, tipo y creado_por (ver managers.py)
+    objects = HistorialAutorizacionManager()
+    
     class Meta:
         db_table = 'formulario_historial_autorizaciones'
         verbose_name = 'Historial de Autorización'
         verbose_name_plural = 'Historial de Autorizaciones'
         ordering = ['-fecha_creacion']  
         indexes = [
-            models.Index(fields=['fecha_creacion']), 
-            models.Index(fields=['-fecha_creacion']),  
+            # Cubre el orden por fecha y, en PostgreSQL, el listado/exportación en modo
+            # snapshot (INCLUDE se ignora en otros motores)
+            models.Index(
+                fields=['-fecha_creacion'],
+                include=['snapshot_placa', 'snapshot_nombres', 'snapshot_tipo', 'snapshot_numero', 'snapshot_vigencia'],
+                name='hist_aut_snapshot_idx'
+            ),
         ]
     
     def __str__(self):
-        return f"{self.autorizacion.placa} - {self.autorizacion.tipo_autorizacion.nombre} - {self.fecha_creacion.strftime('%d/%m/%Y %H:%M')}"
+        return f"{self.placa} - {self.tipo_autorizacion} - {self.fecha_creacion.strftime('%d/%m/%Y %H:%M')}"
+    
+    def save(self, *args, **kwargs):
+        if self._state.adding and settings.FORMULARIO_HISTORIAL_SNAPSHOT and self.snapshot_placa is None:
+            self.capturar_snapshot()
+        super().save(*args, **kwargs)
     
-    # Propiedades de acceso rápido (sin duplicar datos)
+    def capturar_snapshot(self):
+        """Copia los datos actuales de la autorización a las columnas snapshot"""
+        autorizacion = self.autorizacion
+        self.snapshot_placa = autorizacion.placa
+        self.snapshot_nombres = autorizacion.usuario.nombres
+        self.snapshot_tipo = autorizacion.tipo_autorizacion.nombre
+        self.snapshot_numero = autorizacion.numero_autorizacion
+        self.snapshot_vigencia = autorizacion.vigencia
+    
+    @property
+    def tiene_snapshot(self):
+        return self.snapshot_placa is not None
+    
+    # Propiedades de acceso rápido: usan el snapshot si existe, si no la autorización
     @property
     def placa(self):
         """Retorna la placa de la autorización"""
-        return self.autorizacion.placa
+        return self.snapshot_placa if self.tiene_snapshot else self.autorizacion.placa
     
     @property
     def usuario_nombres(self):
         """Retorna el nombre del usuario"""
-        return self.autorizacion.usuario.nombres
+        return self.snapshot_nombres if self.tiene_snapshot else self.autorizacion.usuario.nombres
     
     @property
     def tipo_autorizacion(self):
         """Retorna el tipo de autorización"""
-        return self.autorizacion.tipo_autorizacion.nombre
+        return self.snapshot_tipo if self.tiene_snapshot else self.autorizacion.tipo_autorizacion.nombre
+    
+    @property
+    def numero_autorizacion(self):
+        """Retorna el número de autorización"""
+        return self.snapshot_numero if self.tiene_snapshot else self.autorizacion.numero_autorizacion
     
     @property
     def vigencia(self):
         """Retorna la fecha de vigencia"""
-        return self.autorizacion.vigencia
+        return self.snapshot_vigencia if self.tiene_snapshot else self.autorizacion.vigencia
     
     @property
     def esta_caducada(self):
         """Verifica si la autorización está caducada"""
-        return self.autorizacion.esta_caducada
+        from apps.formulario.utils import validar_autorizacion_caducada
+        return validar_autorizacion_caducada(self.vigencia)
     
     @property
     def dias_vigencia_restantes(self):
         """Calcula los días restantes para la caducidad"""
-        return self.autorizacion.dias_restantes
\ No newline at end of file
+        from django.utils import timezone
+        hoy = timezone.localdate()
+        if self.vigencia > hoy:
+            return (self.vigencia - hoy).days
+        return 0
+
+class EventoEscaneo(models.Model):
+    #Escaneo de un QR en verificar_qr; se escribe por lotes (ver escaneos.py)
+    RESULTADOS = [
+        ('vigente', 'Vigente'),
+        ('caducada', 'Caducada'),
+        ('no_encontrada', 'No encontrada'),
+        ('incompleta', 'Datos incompletos'),
+        ('error', 'Error'),
+    ]
+
+    fecha = models.DateTimeField('Fecha del escaneo')
+    # Sin restricción de FK: el lote se inserta después y la autorización pudo
+    # haberse eliminado; los conteos se conservan
+    autorizacion = models.ForeignKey(
+        Autorizacion, on_delete=models.DO_NOTHING, db_constraint=False,
+        null=True, blank=True, related_name='+'
+    )
+    tipo_autorizacion = models.ForeignKey(
+        TipoAutorizacion, on_delete=models.DO_NOTHING, db_constraint=False,
+        null=True, blank=True, related_name='+'
+    )
+    resultado = models.CharField('Resultado', max_length=15, choices=RESULTADOS)
+    ip = models.GenericIPAddressField('IP', null=True, blank=True)
+
+    class Meta:
+        db_table = 'formulario_evento_escaneo'
+        verbose_name = 'Evento de Escaneo'
+        verbose_name_plural = 'Eventos de Escaneo'
+        indexes = [
+            models.Index(fields=['fecha'], name='escaneo_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha:%d/%m/%Y %H:%M} - {self.resultado}"
+
+class ResumenEscaneoDiario(models.Model):
+    #Escaneos por día, autorización, tipo y resultado (resumir_escaneos)
+    fecha = models.DateField('Fecha')
+    autorizacion = models.ForeignKey(
+        Autorizacion, on_delete=models.DO_NOTHING, db_constraint=False,
+        null=True, blank=True, related_name='+'
+    )
+    tipo_autorizacion = models.ForeignKey(
+        TipoAutorizacion, on_delete=models.DO_NOTHING, db_constraint=False,
+        null=True, blank=True, related_name='+'
+    )
+    resultado = models.CharField('Resultado', max_length=15, choices=EventoEscaneo.RESULTADOS)
+    escaneos = models.PositiveIntegerField('Escaneos')
+
+    class Meta:
+        db_table = 'formulario_resumen_escaneo_diario'
+        verbose_name = 'Resumen Diario de Escaneos'
+        verbose_name_plural = 'Resúmenes Diarios de Escaneos'
+        indexes = [
+            models.Index(fields=['fecha', 'tipo_autorizacion'], name='resumen_escaneo_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} - {self.resultado}: {self.escaneos}"
+
+class RecordatorioVencimiento(models.Model):
+    #Aviso de vencimiento enviado al titular (enviar_recordatorios); uno por
+    #autorización, vigencia avisada y anticipación, para no repetir envíos
+    autorizacion = models.ForeignKey(
+        Autorizacion,
+        on_delete=models.CASCADE,
+        related_name='recordatorios',
+        db_index=False  # cubierto por unique_recordatorio_vencimiento (autorizacion es su primera columna)
+    )
+    vigencia = models.DateField('Vigencia Avisada')
+    dias = models.PositiveSmallIntegerField('Días de Anticipación')
+    correo = models.EmailField('Correo Electrónico')
+    fecha_envio = models.DateTimeField('Fecha de Envío', auto_now_add=True)
+
+    class Meta:
+        db_table = 'formulario_recordatorio_vencimiento'
+        verbose_name = 'Recordatorio de Vencimiento'
+        verbose_name_plural = 'Recordatorios de Vencimiento'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['autorizacion', 'vigencia', 'dias'],
+                name='unique_recordatorio_vencimiento'
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.correo} - {self.vigencia} ({self.dias} días)"
+
+class ResumenHistorialDiario(models.Model):
+    #Autorizaciones emitidas por día, tipo, operador y mes de vencimiento
+    #(resumir_historial); los reportes anuales leen solo esta tabla
+    fecha = models.DateField('Fecha de Emisión')
+    tipo_autorizacion = models.ForeignKey(
+        TipoAutorizacion, on_delete=models.DO_NOTHING, db_constraint=False,
+        null=True, blank=True, related_name='+'
+    )
+    creado_por = models.ForeignKey(
+        User, on_delete=models.DO_NOTHING, db_constraint=False,
+        null=True, blank=True, related_name='+'
+    )
+    mes_vencimiento = models.DateField('Mes de Vencimiento')  # primer día del mes de la vigencia
+    emitidas = models.PositiveIntegerField('Emitidas')
+
+    class Meta:
+        db_table = 'formulario_resumen_historial_diario'
+        verbose_name = 'Resumen Diario de Historial'
+        verbose_name_plural = 'Resúmenes Diarios de Historial'
+        indexes = [
+            models.Index(fields=['fecha'], name='resumen_hist_fecha_idx'),
+            models.Index(fields=['mes_vencimiento'], name='resumen_hist_vence_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.fecha} - {self.emitidas}"
+
+class MarcaResumen(models.Model):
+    #Último registro incorporado por cada resumen incremental (marca de agua)
+    nombre = models.CharField('Nombre', max_length=50, unique=True)
+    ultimo_id = models.BigIntegerField('Último ID', default=0)
+    fecha_actualizacion = models.DateTimeField('Fecha de Actualización', auto_now=True)
+
+    class Meta:
+        db_table = 'formulario_marca_resumen'
+        verbose_name = 'Marca de Resumen'
+        verbose_name_plural = 'Marcas de Resumen'
+
+    def __str__(self):
+        return f"{self.nombre}: {self.ultimo_id}"
+
+# Las FK que recorren los accesores de historial lanzan CargaPerezosaError
+# cuando la guardia está activa y la relación no vino en el select_related
+instalar_guardia_fk(Autorizacion, 'usuario', 'tipo_autorizacion')
+instalar_guardia_fk(HistorialAcciones, 'autorizacion', 'creado_por')
+instalar_guardia_fk(HistorialAutorizacion, 'autorizacion', 'creado_por')
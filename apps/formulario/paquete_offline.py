@@ -0,0 +1,374 @@
+"""
+Paquete de verificación sin conexión para los dispositivos de los inspectores.
+
+Formato (enteros big-endian):
+
+    cabecera   '>4sBBHQQQQ': MAGIA, FORMATO, tipo (0 completo, 1 delta), 0,
+               versión, versión base (0 en el completo), altas, bajas
+    altas      huellas u64 ordenadas (en el completo: todas las vigentes)
+    bajas      huellas u64 ordenadas (solo en el delta)
+    firma      Ed25519 (64 bytes) del SHA-256 de todo lo anterior
+
+Lo firma la clave privada del servidor (PAQUETE_OFFLINE_CLAVE_PRIVADA, ver
+clave_paquete_offline); los dispositivos solo tienen la clave pública, así
+que quien la extraiga de uno no puede fabricar paquetes.
+
+La huella de una autorización son los 8 primeros bytes de SHA-256 de
+"NUMERO|PLACA|AAAA-MM-DD" (ver huella()), con NUMERO recortado a lo que lleva
+el QR (LARGO_NUMERO_QR): el dispositivo la calcula con los datos del QR escaneado y la busca con búsqueda binaria. El paquete solo trae
+autorizaciones activas con vigencia desde el día de generación; el dispositivo
+debe comprobar además que la vigencia del QR no haya pasado.
+"""
+import hashlib
+import heapq
+import os
+import re
+import struct
+import sys
+import tempfile
+import time
+from array import array
+from bisect import bisect_left
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from apps.formulario.models import Autorizacion, normalizar_placa
+from apps.formulario.utils import LARGO_NUMERO_QR
+
+MAGIA = b'ACTQ'
+FORMATO = 2  # 1: firma HMAC con clave compartida
+COMPLETO, DELTA = 0, 1
+CABECERA = struct.Struct('>4sBBHQQQQ')
+TAMANO_FIRMA = 64
+_BLOQUE = 8192  # huellas por lectura/escritura
+# array('Q') usa el orden nativo; en el archivo va big-endian
+_INVERTIR = sys.byteorder == 'little'
+
+_NOMBRE_COMPLETO = re.compile(r'^completo-(\d+)\.bin$')
+_NOMBRE_DELTA = re.compile(r'^delta-(\d+)-(\d+)\.bin$')
+
+
+class PaqueteInvalido(ValueError):
+    """Firma, magia o longitud del paquete no válidas"""
+
+
+def huella(numero_autorizacion, placa, vigencia):
+    """
+    Entero de 64 bits que identifica número + placa + vigencia (date o 'AAAA-MM-DD').
+    Del número solo cuentan los caracteres que lleva el QR: el completo y el
+    parámetro `a` escaneado dan la misma huella.
+    """
+    if not isinstance(vigencia, str):
+        vigencia = vigencia.isoformat()
+    numero = numero_autorizacion[:LARGO_NUMERO_QR].strip().upper()
+    texto = f'{numero}|{normalizar_placa(placa)}|{vigencia}'
+    return int.from_bytes(hashlib.sha256(texto.encode()).digest()[:8], 'big')
+
+
+# ============================================================================
+# CLAVES (Ed25519: la privada solo en el servidor)
+# ============================================================================
+
+def crear_clave(ruta=None):
+    """Crea la clave privada en `ruta` (PEM, solo legible por el dueño); falla si ya existe"""
+    ruta = ruta or settings.PAQUETE_OFFLINE_CLAVE_PRIVADA
+    os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+    pem = Ed25519PrivateKey.generate().private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    with os.fdopen(os.open(ruta, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'wb') as archivo:
+        archivo.write(pem)
+
+
+def clave_privada():
+    """Clave con la que el servidor firma los paquetes (PAQUETE_OFFLINE_CLAVE_PRIVADA)"""
+    ruta = settings.PAQUETE_OFFLINE_CLAVE_PRIVADA
+    try:
+        with open(ruta, 'rb') as archivo:
+            clave = serialization.load_pem_private_key(archivo.read(), password=None)
+    except FileNotFoundError:
+        raise ImproperlyConfigured(
+            f'No existe la clave de firma {ruta}: crearla con python manage.py clave_paquete_offline'
+        )
+    if not isinstance(clave, Ed25519PrivateKey):
+        raise ImproperlyConfigured(f'{ruta} no es una clave privada Ed25519')
+    return clave
+
+
+def clave_publica():
+    """Clave pública en bruto (32 bytes): la que se instala en los dispositivos"""
+    return clave_privada().public_key().public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+
+
+# ============================================================================
+# LECTURA Y ESCRITURA DE HUELLAS
+# ============================================================================
+
+def _escribir(archivo, huellas):
+    """Escribe huellas u64 big-endian desde un iterable; retorna la cantidad"""
+    total = 0
+    bloque = array('Q')
+    for valor in huellas:
+        bloque.append(valor)
+        if len(bloque) == _BLOQUE:
+            total += _volcar(archivo, bloque)
+            bloque = array('Q')
+    return total + _volcar(archivo, bloque)
+
+
+def _volcar(archivo, bloque):
+    if _INVERTIR:
+        bloque.byteswap()
+    archivo.write(bloque.tobytes())
+    return len(bloque)
+
+
+def _leer(archivo, cantidad):
+    """Itera `cantidad` huellas u64 big-endian desde la posición actual del archivo"""
+    while cantidad:
+        n = min(cantidad, _BLOQUE)
+        bloque = array('Q')
+        bloque.frombytes(archivo.read(n * 8))
+        if _INVERTIR:
+            bloque.byteswap()
+        yield from bloque
+        cantidad -= n
+
+
+class _Firmado:
+    """Archivo que acumula el SHA-256 de lo que se escribe y al final escribe su firma"""
+
+    def __init__(self, archivo, clave):
+        self.archivo = archivo
+        self.clave = clave
+        self.resumen = hashlib.sha256()
+
+    def write(self, datos):
+        self.resumen.update(datos)
+        self.archivo.write(datos)
+
+    def firmar(self):
+        self.archivo.write(self.clave.sign(self.resumen.digest()))
+
+
+def _escribir_paquete(ruta, clave, tipo, version, base, escribir_cuerpo, altas, bajas):
+    """Escribe el paquete en un temporal y lo renombra: el endpoint nunca ve uno a medias"""
+    temporal = f'{ruta}.tmp'
+    with open(temporal, 'wb') as archivo:
+        firmado = _Firmado(archivo, clave)
+        firmado.write(CABECERA.pack(MAGIA, FORMATO, tipo, 0, version, base, altas, bajas))
+        escribir_cuerpo(firmado)
+        firmado.firmar()
+    os.replace(temporal, ruta)
+
+
+def leer_cabecera(archivo):
+    magia, formato, tipo, _, version, base, altas, bajas = CABECERA.unpack(archivo.read(CABECERA.size))
+    if magia != MAGIA or formato != FORMATO:
+        raise PaqueteInvalido('No es un paquete de verificación sin conexión')
+    return {'tipo': tipo, 'version': version, 'base': base, 'altas': altas, 'bajas': bajas}
+
+
+# ============================================================================
+# GENERACIÓN
+# ============================================================================
+
+def _huellas_vigentes(hoy, tamano_lote):
+    """Recorre la BD por streaming y produce las huellas de a lotes ordenados"""
+    consulta = Autorizacion.objects.filter(activo=True, vigencia__gte=hoy).values_list(
+        'numero_autorizacion', 'placa', 'vigencia'
+    )
+    lote = array('Q')
+    for numero, placa, vigencia in consulta.iterator(chunk_size=5000):
+        lote.append(huella(numero, placa, vigencia))
+        if len(lote) >= tamano_lote:
+            yield array('Q', sorted(lote))
+            lote = array('Q')
+    if lote:
+        yield array('Q', sorted(lote))
+
+
+def _ordenar_externo(directorio, tamano_lote):
+    """
+    Ordena las huellas vigentes en un archivo temporal con memoria acotada: cada
+    lote ordenado va a un archivo y al final se mezclan (heapq.merge).
+    Retorna (ruta, cantidad).
+    """
+    corridas = []
+    try:
+        for lote in _huellas_vigentes(timezone.localdate(), tamano_lote):
+            descriptor, ruta = tempfile.mkstemp(dir=directorio, suffix='.corrida')
+            with os.fdopen(descriptor, 'wb') as archivo:
+                _escribir(archivo, lote)
+            corridas.append((ruta, len(lote)))
+
+        descriptor, ruta = tempfile.mkstemp(dir=directorio, suffix='.huellas')
+        archivos = [open(r, 'rb') for r, _ in corridas]
+        try:
+            with os.fdopen(descriptor, 'wb') as salida:
+                mezcla = heapq.merge(*(_leer(a, n) for a, (_, n) in zip(archivos, corridas)))
+                cantidad = _escribir(salida, _sin_repetidos(mezcla))
+        finally:
+            for archivo in archivos:
+                archivo.close()
+        return ruta, cantidad
+    finally:
+        for r, _ in corridas:
+            os.remove(r)
+
+
+def _sin_repetidos(ordenadas):
+    anterior = None
+    for valor in ordenadas:
+        if valor != anterior:
+            yield valor
+            anterior = valor
+
+
+def _diferencia(anteriores, actuales):
+    """(altas, bajas) entre dos secuencias ordenadas, recorriéndolas una sola vez"""
+    altas, bajas = array('Q'), array('Q')
+    a, b = next(anteriores, None), next(actuales, None)
+    while a is not None or b is not None:
+        if b is None or (a is not None and a < b):
+            bajas.append(a)
+            a = next(anteriores, None)
+        elif a is None or b < a:
+            altas.append(b)
+            b = next(actuales, None)
+        else:
+            a, b = next(anteriores, None), next(actuales, None)
+    return altas, bajas
+
+
+def versiones(directorio=None):
+    """Versiones de paquetes completos disponibles, de la más antigua a la más reciente"""
+    directorio = directorio or settings.PAQUETE_OFFLINE_DIR
+    try:
+        nombres = os.listdir(directorio)
+    except FileNotFoundError:
+        return []
+    return sorted(int(m.group(1)) for m in map(_NOMBRE_COMPLETO.match, nombres) if m)
+
+
+def ruta_completo(version, directorio=None):
+    return os.path.join(directorio or settings.PAQUETE_OFFLINE_DIR, f'completo-{version}.bin')
+
+
+def ruta_delta(base, version, directorio=None):
+    return os.path.join(directorio or settings.PAQUETE_OFFLINE_DIR, f'delta-{base}-{version}.bin')
+
+
+def generar(directorio=None, conservar=None, tamano_lote=1_000_000):
+    """
+    Genera el paquete completo de una nueva versión y los deltas desde cada
+    versión conservada. Retorna un resumen con la versión y las cantidades.
+    """
+    directorio = directorio or settings.PAQUETE_OFFLINE_DIR
+    conservar = settings.PAQUETE_OFFLINE_CONSERVAR if conservar is None else conservar
+    clave = clave_privada()  # antes de leer la BD: sin clave no hay nada que generar
+    os.makedirs(directorio, exist_ok=True)
+
+    anteriores = versiones(directorio)
+    version = max(int(time.time()), anteriores[-1] + 1 if anteriores else 0)
+
+    ruta_huellas, cantidad = _ordenar_externo(directorio, tamano_lote)
+    try:
+        def cuerpo(firmado):
+            with open(ruta_huellas, 'rb') as huellas:
+                while datos := huellas.read(_BLOQUE * 8):
+                    firmado.write(datos)
+
+        _escribir_paquete(ruta_completo(version, directorio), clave, COMPLETO, version, 0, cuerpo, cantidad, 0)
+
+        deltas = {}
+        for base in (anteriores[-conservar:] if conservar else []):
+            with open(ruta_completo(base, directorio), 'rb') as previo, open(ruta_huellas, 'rb') as actual:
+                n_previo = leer_cabecera(previo)['altas']
+                altas, bajas = _diferencia(_leer(previo, n_previo), _leer(actual, cantidad))
+
+            def cuerpo_delta(firmado, altas=altas, bajas=bajas):
+                _escribir(firmado, altas)
+                _escribir(firmado, bajas)
+
+            _escribir_paquete(
+                ruta_delta(base, version, directorio), clave, DELTA, version, base, cuerpo_delta,
+                len(altas), len(bajas)
+            )
+            deltas[base] = {'altas': len(altas), 'bajas': len(bajas)}
+    finally:
+        os.remove(ruta_huellas)
+
+    _depurar(directorio, [*anteriores, version][-(conservar + 1):])
+    return {'version': version, 'autorizaciones': cantidad, 'deltas': deltas}
+
+
+def _depurar(directorio, conservadas):
+    """Borra completos de versiones que ya no se conservan y deltas que no llegan a la última"""
+    ultima = conservadas[-1]
+    for nombre in os.listdir(directorio):
+        completo = _NOMBRE_COMPLETO.match(nombre)
+        delta = _NOMBRE_DELTA.match(nombre)
+        if (completo and int(completo.group(1)) not in conservadas) or (delta and int(delta.group(2)) != ultima):
+            os.remove(os.path.join(directorio, nombre))
+
+
+# ============================================================================
+# LECTOR DE REFERENCIA (lo que implementa el dispositivo)
+# ============================================================================
+
+def verificar_firma(datos, publica):
+    """Retorna el contenido sin la firma si la firma es de la clave pública `publica` (32 bytes)"""
+    if len(datos) < CABECERA.size + TAMANO_FIRMA:
+        raise PaqueteInvalido('Firma inválida')
+    contenido, firma = datos[:-TAMANO_FIRMA], datos[-TAMANO_FIRMA:]
+    try:
+        Ed25519PublicKey.from_public_bytes(publica).verify(firma, hashlib.sha256(contenido).digest())
+    except InvalidSignature:
+        raise PaqueteInvalido('Firma inválida')
+    return contenido
+
+
+class VerificadorOffline:
+    """Huellas vigentes en memoria: aplica paquetes completos y deltas y verifica escaneos"""
+
+    def __init__(self, publica):
+        self.publica = publica
+        self.version = 0
+        self.huellas = array('Q')
+
+    def aplicar(self, datos):
+        contenido = verificar_firma(datos, self.publica)
+        cabecera = CABECERA.unpack_from(contenido)
+        magia, formato, tipo, _, version, base, n_altas, n_bajas = cabecera
+        if magia != MAGIA or formato != FORMATO:
+            raise PaqueteInvalido('No es un paquete de verificación sin conexión')
+        if len(contenido) != CABECERA.size + (n_altas + n_bajas) * 8:
+            raise PaqueteInvalido('Longitud inválida')
+
+        cuerpo = array('Q')
+        cuerpo.frombytes(contenido[CABECERA.size:])
+        if _INVERTIR:
+            cuerpo.byteswap()
+        altas, bajas = cuerpo[:n_altas], set(cuerpo[n_altas:])
+
+        if tipo == COMPLETO:
+            self.huellas = altas
+        else:
+            if base != self.version:
+                raise PaqueteInvalido(f'El delta parte de la versión {base} y el dispositivo tiene {self.version}')
+            self.huellas = array('Q', sorted(heapq.merge((h for h in self.huellas if h not in bajas), altas)))
+        self.version = version
+
+    def vigente(self, numero_autorizacion, placa, vigencia, hoy=None):
+        """La autorización del QR está en el paquete y su vigencia no pasó"""
+        if not isinstance(vigencia, str):
+            vigencia = vigencia.isoformat()
+        if vigencia < (hoy or timezone.localdate()).isoformat():
+            return False
+        buscada = huella(numero_autorizacion, placa, vigencia)
+        posicion = bisect_left(self.huellas, buscada)
+        return posicion < len(self.huellas) and self.huellas[posicion] == buscada
@@ -0,0 +1,114 @@
+import logging
+import smtplib
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models import OuterRef, Subquery
+from django.template.loader import get_template
+from django.utils import timezone
+from apps.formulario.models import Autorizacion, RecordatorioVencimiento
+
+logger = logging.getLogger(__name__)
+
+ASUNTO = 'Su autorización {numero_autorizacion} vence el {vigencia:%d/%m/%Y}'
+
+# ============================================================================
+# RECORDATORIOS DE VENCIMIENTO (por lotes, sin repetir envíos)
+# ============================================================================
+
+def anticipacion(dias_restantes, anticipaciones):
+    """Menor anticipación configurada que cubre los días restantes (anticipaciones ordenadas)"""
+    return next(dias for dias in anticipaciones if dias >= dias_restantes)
+
+
+def pendientes(hoy, anticipaciones, tamano_lote):
+    """
+    Lotes de (fila, anticipación) a avisar: autorizaciones activas que vencen
+    dentro de la mayor anticipación y que todavía no recibieron el aviso de esa
+    anticipación (o uno más cercano) para su vigencia actual. Una consulta por
+    lote; el último aviso enviado viene anotado en la misma fila.
+    """
+    ultimo_aviso = RecordatorioVencimiento.objects.filter(
+        autorizacion=OuterRef('pk'), vigencia=OuterRef('vigencia')
+    ).order_by('dias').values('dias')[:1]
+    consulta = Autorizacion.objects.filter(
+        activo=True,
+        caducada=False,
+        vigencia__gte=hoy,
+        vigencia__lte=hoy + timedelta(days=anticipaciones[-1]),
+        usuario__correo__gt='',  # excluye NULL y vacío
+    ).annotate(ultimo_aviso=Subquery(ultimo_aviso)).order_by('pk').values(
+        'pk', 'placa', 'numero_autorizacion', 'vigencia', 'ultimo_aviso',
+        'tipo_autorizacion__nombre', 'usuario__nombres', 'usuario__correo',
+    )
+    ultimo_id = 0
+    while filas := list(consulta.filter(pk__gt=ultimo_id)[:tamano_lote]):
+        ultimo_id = filas[-1]['pk']
+        lote = []
+        for fila in filas:
+            dias = anticipacion((fila['vigencia'] - hoy).days, anticipaciones)
+            if fila['ultimo_aviso'] is None or fila['ultimo_aviso'] > dias:
+                lote.append((fila, dias))
+        if lote:
+            yield lote
+
+
+def _mensaje(fila, hoy, plantillas, conexion):
+    contexto = {
+        'nombres': fila['usuario__nombres'],
+        'placa': fila['placa'],
+        'numero_autorizacion': fila['numero_autorizacion'],
+        'tipo_autorizacion': fila['tipo_autorizacion__nombre'],
+        'vigencia': fila['vigencia'],
+        'dias_restantes': (fila['vigencia'] - hoy).days,
+    }
+    texto, html = plantillas
+    mensaje = EmailMultiAlternatives(
+        ASUNTO.format(**contexto),
+        texto.render(contexto),
+        to=[fila['usuario__correo']],
+        connection=conexion,
+    )
+    mensaje.attach_alternative(html.render(contexto), 'text/html')
+    return mensaje
+
+
+def enviar_recordatorios(hoy=None, anticipaciones=None, tamano_lote=None):
+    """
+    Envía los avisos pendientes por una sola conexión de correo y registra cada
+    envío con bulk_create por lote. Un mensaje que falla no se registra y se
+    reintenta en la próxima corrida; volver a correr el mismo día no reenvía.
+    Retorna {'enviados', 'fallidos'}.
+    """
+    hoy = hoy or timezone.localdate()
+    anticipaciones = sorted(anticipaciones or settings.RECORDATORIOS_DIAS)
+    tamano_lote = tamano_lote or settings.RECORDATORIOS_LOTE
+    # Compiladas una vez por corrida; cada mensaje solo renderiza
+    plantillas = (
+        get_template('formulario/correos/recordatorio_vencimiento.txt'),
+        get_template('formulario/correos/recordatorio_vencimiento.html'),
+    )
+    resumen = {'enviados': 0, 'fallidos': 0}
+
+    # Una conexión para toda la corrida, abierta solo si hay algo que enviar
+    conexion = get_connection()
+    try:
+        for lote in pendientes(hoy, anticipaciones, tamano_lote):
+            enviados = []
+            for fila, dias in lote:
+                try:
+                    conexion.open()  # no hace nada si ya está abierta
+                    conexion.send_messages([_mensaje(fila, hoy, plantillas, conexion)])
+                except (smtplib.SMTPException, OSError) as e:
+                    logger.warning('No se pudo enviar el recordatorio de %s: %s', fila['numero_autorizacion'], e)
+                    resumen['fallidos'] += 1
+                    conexion.close()  # el próximo envío reabre la conexión
+                    continue
+                enviados.append(RecordatorioVencimiento(
+                    autorizacion_id=fila['pk'], vigencia=fila['vigencia'], dias=dias, correo=fila['usuario__correo']
+                ))
+            RecordatorioVencimiento.objects.bulk_create(enviados, ignore_conflicts=True)
+            resumen['enviados'] += len(enviados)
+    finally:
+        conexion.close()
+    return resumen
@@ -0,0 +1,121 @@
+from datetime import datetime, time
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Count, DateField, F, Max, Min, Sum
+from django.db.models.functions import Coalesce, TruncDate, TruncMonth
+from django.utils import timezone
+from apps.formulario.models import HistorialAutorizacion, MarcaResumen, ResumenHistorialDiario
+
+MARCA_HISTORIAL = 'historial_autorizaciones'
+MESES = ['Ene', 'Feb', 'Mar', 'Abr', 'May', 'Jun', 'Jul', 'Ago', 'Sep', 'Oct', 'Nov', 'Dic']
+
+# ============================================================================
+# ACTUALIZACIÓN INCREMENTAL (marca de agua)
+# ============================================================================
+
+def _agrupar(historial):
+    """Emitidas por día local, tipo, operador y mes de vencimiento"""
+    return historial.annotate(
+        dia=TruncDate('fecha_creacion'),
+        mes=TruncMonth(Coalesce('snapshot_vigencia', 'autorizacion__vigencia'), output_field=DateField()),
+        tipo_id=F('autorizacion__tipo_autorizacion_id'),
+    ).order_by().values('dia', 'tipo_id', 'creado_por_id', 'mes').annotate(emitidas=Count('id'))
+
+
+def actualizar_resumen(completo=False):
+    """
+    Incorpora al resumen el historial registrado después de la marca de agua.
+    Recalcula enteros los días desde el del registro nuevo más antiguo (en la
+    práctica hoy), así que es idempotente. Las bajas de días anteriores (al
+    eliminar autorizaciones) se reflejan con completo=True, que reconstruye
+    todo. Retorna {'registros', 'filas', 'ultimo_id'}.
+    """
+    historial = HistorialAutorizacion.objects.select_related(None)
+    with transaction.atomic():
+        marca, _ = MarcaResumen.objects.select_for_update().get_or_create(nombre=MARCA_HISTORIAL)
+        nuevos = historial.filter(pk__gt=0 if completo else marca.ultimo_id).aggregate(
+            ultimo_id=Max('pk'), desde=Min('fecha_creacion')
+        )
+        if nuevos['ultimo_id'] is None:
+            if completo:
+                ResumenHistorialDiario.objects.all().delete()
+            return {'registros': 0, 'filas': 0, 'ultimo_id': marca.ultimo_id}
+
+        afectados, resumen = historial, ResumenHistorialDiario.objects.all()
+        if not completo:
+            dia = timezone.localtime(nuevos['desde']).date()
+            afectados = historial.filter(fecha_creacion__gte=timezone.make_aware(datetime.combine(dia, time.min)))
+            resumen = resumen.filter(fecha__gte=dia)
+        resumen.delete()
+        filas = ResumenHistorialDiario.objects.bulk_create([
+            ResumenHistorialDiario(
+                fecha=fila['dia'], tipo_autorizacion_id=fila['tipo_id'], creado_por_id=fila['creado_por_id'],
+                mes_vencimiento=fila['mes'], emitidas=fila['emitidas'],
+            )
+            for fila in _agrupar(afectados)
+        ], batch_size=1000)
+
+        marca.ultimo_id = nuevos['ultimo_id']
+        marca.save(update_fields=['ultimo_id', 'fecha_actualizacion'])
+    return {'registros': sum(fila.emitidas for fila in filas), 'filas': len(filas), 'ultimo_id': marca.ultimo_id}
+
+
+# ============================================================================
+# REPORTE ANUAL (solo lee el resumen)
+# ============================================================================
+
+def _por_mes(filas, clave, fecha):
+    """Tabla {clave: 12 meses + total} ordenada por total, y los totales por mes"""
+    tabla = {}
+    totales = [0] * 12
+    for fila in filas:
+        mes = fila[fecha].month - 1
+        tabla.setdefault(fila[clave] or 'Sin registro', [0] * 12)[mes] += fila['total']
+        totales[mes] += fila['total']
+    filas = sorted(
+        ({'nombre': nombre, 'meses': meses, 'total': sum(meses)} for nombre, meses in tabla.items()),
+        key=lambda fila: (-fila['total'], fila['nombre'])
+    )
+    return {'filas': filas, 'totales': totales, 'total': sum(totales)}
+
+
+def reporte_anual(anio):
+    """
+    Emitidas en `anio` por mes y tipo y por mes y operador, y autorizaciones
+    que vencen cada mes de `anio` por tipo. Tres consultas sobre
+    ResumenHistorialDiario; agrupan por las columnas de fecha tal cual (sin
+    extraer el mes en SQL, que en SQLite se evalúa fila por fila) y los meses
+    se suman aquí.
+    """
+    emitidas = ResumenHistorialDiario.objects.filter(fecha__year=anio).order_by()
+    vencen = ResumenHistorialDiario.objects.filter(mes_vencimiento__year=anio).order_by()
+    return {
+        'anio': anio,
+        'meses': MESES,
+        'por_tipo': _por_mes(
+            emitidas.values('fecha', 'tipo_autorizacion__nombre').annotate(total=Sum('emitidas')),
+            'tipo_autorizacion__nombre', 'fecha'
+        ),
+        'por_operador': _por_mes(
+            emitidas.values('fecha', 'creado_por__names').annotate(total=Sum('emitidas')),
+            'creado_por__names', 'fecha'
+        ),
+        'vencimientos': _por_mes(
+            vencen.values('mes_vencimiento', 'tipo_autorizacion__nombre').annotate(total=Sum('emitidas')),
+            'tipo_autorizacion__nombre', 'mes_vencimiento'
+        ),
+    }
+
+
+def reporte_anual_en_cache(anio):
+    """
+    reporte_anual con la fecha de la última actualización del resumen. Se
+    guarda en caché con la marca de agua en la clave: cada actualización
+    del resumen genera claves nuevas y no hace falta invalidar.
+    """
+    marca = MarcaResumen.objects.filter(nombre=MARCA_HISTORIAL).values_list('ultimo_id', 'fecha_actualizacion').first()
+    if marca is None:
+        return {**reporte_anual(anio), 'actualizado': None}
+    ultimo_id, actualizado = marca
+    clave = f'reporte_historial:{anio}:{ultimo_id}:{actualizado.timestamp()}'
+    return {**caches['dashboard'].get_or_set(clave, lambda: reporte_anual(anio), 3600), 'actualizado': actualizado}
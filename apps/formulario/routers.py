@@ -0,0 +1,140 @@
+import logging
+import random
+import threading
+import time
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import connections
+from apps.formulario.middleware import MiddlewareHibrido
+
+logger = logging.getLogger(__name__)
+
+# Cookie que fija al navegador en la primaria después de escribir
+COOKIE_PRIMARIA = 'db_primaria'
+
+# Sesión, usuarios y permisos se leen siempre de la primaria: con retraso un
+# login recién hecho no existiría todavía en la réplica
+APPS_SOLO_PRIMARIA = {'sessions', 'auth', 'contenttypes', 'admin', 'security'}
+
+# El request en curso puede leer de una réplica (vista marcada con usar_replica)
+_lectura_replica = ContextVar('lectura_replica', default=False)
+# El request en curso ya escribió: sus lecturas siguientes van a la primaria
+_escribio = ContextVar('escribio', default=False)
+
+# ============================================================================
+# RETRASO DE LAS RÉPLICAS
+# ============================================================================
+
+_SQL_RETRASO_POSTGRESQL = """
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+_retrasos = {}
+_lock = threading.Lock()
+
+
+def medir_retraso(alias):
+    """Segundos de retraso de la réplica; infinito si no responde"""
+    conexion = connections[alias]
+    try:
+        if conexion.vendor != 'postgresql':
+            conexion.ensure_connection()
+            return 0.0
+        with conexion.cursor() as cursor:
+            cursor.execute(_SQL_RETRASO_POSTGRESQL)
+            return float(cursor.fetchone()[0] or 0)
+    except Exception as e:
+        logger.warning('Réplica %s no disponible: %s', alias, e)
+        return float('inf')
+
+
+def retraso_replica(alias):
+    """Retraso medido, reutilizado durante DB_REPLICA_INTERVALO_CHEQUEO segundos por proceso"""
+    ahora = time.monotonic()
+    with _lock:
+        medido = _retrasos.get(alias)
+    if medido and ahora - medido[0] < settings.DB_REPLICA_INTERVALO_CHEQUEO:
+        return medido[1]
+
+    retraso = medir_retraso(alias)
+    with _lock:
+        _retrasos[alias] = (ahora, retraso)
+    return retraso
+
+
+def replicas_disponibles():
+    return [alias for alias in settings.DB_REPLICAS if retraso_replica(alias) <= settings.DB_REPLICA_RETRASO_MAXIMO]
+
+
+# ============================================================================
+# ROUTER
+# ============================================================================
+
+class ReplicaRouter:
+    """
+    Escrituras y migraciones en default. Las lecturas de vistas marcadas con
+    usar_replica = True van a una réplica con retraso aceptable; si ninguna lo
+    tiene, si el request ya escribió o si el navegador escribió hace poco
+    (cookie db_primaria), se lee de default.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not _lectura_replica.get() or _escribio.get() or model._meta.app_label in APPS_SOLO_PRIMARIA:
+            return 'default'
+        replicas = replicas_disponibles()
+        return random.choice(replicas) if replicas else 'default'
+
+    def db_for_write(self, model, **hints):
+        _escribio.set(True)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Todas las bases contienen los mismos datos
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ReplicaMiddleware(MiddlewareHibrido):
+    """
+    Habilita la lectura en réplica para vistas con usar_replica = True en
+    requests GET/HEAD, y fija el navegador a la primaria DB_REPLICA_FIJAR_PRIMARIA
+    segundos después de un request que escribió.
+    """
+
+    def __call__(self, request):
+        if self.asincrono:
+            return self.__acall__(request)
+        tokens = (_lectura_replica.set(False), _escribio.set(False))
+        try:
+            return self._fijar_primaria(request, self.get_response(request))
+        finally:
+            _lectura_replica.reset(tokens[0])
+            _escribio.reset(tokens[1])
+
+    async def __acall__(self, request):
+        tokens = (_lectura_replica.set(False), _escribio.set(False))
+        try:
+            return self._fijar_primaria(request, await self.get_response(request))
+        finally:
+            _lectura_replica.reset(tokens[0])
+            _escribio.reset(tokens[1])
+
+    def _fijar_primaria(self, request, response):
+        if _escribio.get() and settings.DB_REPLICAS:
+            response.set_cookie(
+                COOKIE_PRIMARIA, '1',
+                max_age=settings.DB_REPLICA_FIJAR_PRIMARIA,
+                httponly=True, samesite='Lax', secure=request.is_secure(),
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        vista = getattr(view_func, 'view_class', view_func)
+        if (getattr(vista, 'usar_replica', False) and request.method in ('GET', 'HEAD')
+                and COOKIE_PRIMARIA not in request.COOKIES):
+            _lectura_replica.set(True)
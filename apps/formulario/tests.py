@@ -2,19 +2,60 @@
 Tests para la aplicación de formulario
 Incluye tests para models, forms, views y utils
 """
-from django.test import TestCase, RequestFactory, Client
+from django.test import TestCase, RequestFactory, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.cache import caches
+from django.core import mail
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 from django.urls import reverse
-from datetime import date, timedelta
+from django.http import HttpResponse
+from datetime import date, datetime, timedelta
 from decimal import Decimal
+import csv
+import io
+import json
+import logging
+import os
+import smtplib
+import tempfile
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlsplit
+
+import openpyxl
+from asgiref.sync import sync_to_async
 
 from apps.formulario.models import (
     TipoAutorizacion, 
     UsuarioAutorizacion, 
     Autorizacion, 
-    HistorialAutorizacion
+    HistorialAcciones,
+    HistorialAutorizacion,
+    EventoEscaneo,
+    ResumenEscaneoDiario,
+    RecordatorioVencimiento,
+    ResumenHistorialDiario
 )
+from apps.formulario import escaneos, exportacion, paquete_offline
+from apps.formulario.limites import ip_cliente
+from apps.formulario.managers import CargaPerezosaError, prohibir_fk_perezosas
+from apps.formulario.consultas_lentas import ArchivoConsultasLentas, RegistroConsultasLentas, explicar, huella_sql
+from apps.formulario.routers import COOKIE_PRIMARIA, ReplicaMiddleware, ReplicaRouter
+from apps.formulario.recordatorios import enviar_recordatorios
+from apps.formulario.resumen_historial import actualizar_resumen, reporte_anual
+from apps.formulario.verificacion import clave_verificacion
+from apps.formulario.middleware import metricas
+from apps.formulario.views.autorizacion import AutorizacionListView
+from apps.formulario.views.qr_code import VerificarQRAsyncView, VerificarQRView
+from apps.formulario.management.commands.benchmark_vistas import Command as BenchmarkVistasCommand
+from apps.formulario.management.commands.benchmark_verificacion import RutasVerificacion
+from apps.formulario.management.commands.prueba_carga import Resultados
+from apps.formulario.management.commands.auditar_indices import forma_consulta, proponer_indice
 from apps.formulario.form import (
     FormularioCompletoQRForm,
     BusquedaAutorizacionForm,
@@ -22,10 +63,13 @@ from apps.formulario.form import (
     UsuarioAutorizacionForm
 )
 from apps.formulario.utils import (
+    construir_url_qr,
     generar_url_qr,
     validar_autorizacion_caducada,
     crear_autorizacion_desde_form
 )
+from apps.formulario import urls as formulario_urls
+from apps.security import urls as security_urls
 
 User = get_user_model()
 
@@ -210,7 +254,7 @@ class AutorizacionModelTest(TestCase):
     
     def test_crear_autorizacion(self):
         """Test crear autorización"""
-        vigencia = timezone.now().date() + timedelta(days=365)
+        vigencia = timezone.localdate() + timedelta(days=365)
         autorizacion = Autorizacion.objects.create(
             usuario=self.usuario,
             tipo_autorizacion=self.tipo_autorizacion,
@@ -228,7 +272,7 @@ class AutorizacionModelTest(TestCase):
     
     def test_numero_autorizacion_unico(self):
         """Test que el número de autorización sea único"""
-        vigencia = timezone.now().date() + timedelta(days=365)
+        vigencia = timezone.localdate() + timedelta(days=365)
         
         Autorizacion.objects.create(
             usuario=self.usuario,
@@ -257,7 +301,7 @@ class AutorizacionModelTest(TestCase):
             tipo_autorizacion=self.tipo_autorizacion,
             placa='ABC1234',
             numero_autorizacion='ACT-EP-001-2025',
-            vigencia=timezone.now().date() + timedelta(days=30),
+            vigencia=timezone.localdate() + timedelta(days=30),
             creado_por=self.user
         )
         self.assertFalse(autorizacion_vigente.esta_caducada)
@@ -268,7 +312,7 @@ class AutorizacionModelTest(TestCase):
             tipo_autorizacion=self.tipo_autorizacion,
             placa='XYZ5678',
             numero_autorizacion='ACT-EP-002-2025',
-            vigencia=timezone.now().date() - timedelta(days=1),
+            vigencia=timezone.localdate() - timedelta(days=1),
             creado_por=self.user
         )
         self.assertTrue(autorizacion_caducada.esta_caducada)
@@ -281,7 +325,7 @@ class AutorizacionModelTest(TestCase):
             tipo_autorizacion=self.tipo_autorizacion,
             placa='ABC1234',
             numero_autorizacion='ACT-EP-001-2025',
-            vigencia=timezone.now().date() + timedelta(days=30),
+            vigencia=timezone.localdate() + timedelta(days=30),
             creado_por=self.user
         )
         self.assertEqual(autorizacion.dias_restantes, 30)
@@ -292,7 +336,7 @@ class AutorizacionModelTest(TestCase):
             tipo_autorizacion=self.tipo_autorizacion,
             placa='XYZ5678',
             numero_autorizacion='ACT-EP-002-2025',
-            vigencia=timezone.now().date() - timedelta(days=10),
+            vigencia=timezone.localdate() - timedelta(days=10),
             creado_por=self.user
         )
         self.assertEqual(autorizacion_caducada.dias_restantes, 0)
@@ -304,7 +348,7 @@ class AutorizacionModelTest(TestCase):
             tipo_autorizacion=self.tipo_autorizacion,
             placa='ABC1234',
             numero_autorizacion='ACT-EP-001-2025',
-            vigencia=timezone.now().date() + timedelta(days=365),
+            vigencia=timezone.localdate() + timedelta(days=365),
             creado_por=self.user
         )
         
@@ -315,7 +359,7 @@ class AutorizacionModelTest(TestCase):
     
     def test_constraint_unique_usuario_placa_tipo(self):
         """Test constraint de unicidad usuario-placa-tipo"""
-        vigencia = timezone.now().date() + timedelta(days=365)
+        vigencia = timezone.localdate() + timedelta(days=365)
         
         # Primera autorización
         Autorizacion.objects.create(
@@ -367,7 +411,7 @@ class HistorialAutorizacionModelTest(TestCase):
             tipo_autorizacion=tipo_autorizacion,
             placa='ABC1234',
             numero_autorizacion='ACT-EP-001-2025',
-            vigencia=timezone.now().date() + timedelta(days=365),
+            vigencia=timezone.localdate() + timedelta(days=365),
             creado_por=self.user
         )
     
@@ -434,7 +478,7 @@ class FormularioCompletoQRFormTest(TestCase):
     
     def test_form_valido_con_cedula(self):
         """Test formulario válido con cédula"""
-        vigencia = timezone.now().date() + timedelta(days=365)
+        vigencia = timezone.localdate() + timedelta(days=365)
         
         form_data = {
             'placa': 'ABC1234',
@@ -453,7 +497,7 @@ class FormularioCompletoQRFormTest(TestCase):
     
     def test_form_valido_con_ruc(self):
         """Test formulario válido con RUC"""
-        vigencia = timezone.now().date() + timedelta(days=365)
+        vigencia = timezone.localdate() + timedelta(days=365)
         
         form_data = {
             'placa': 'ABC1234',
@@ -472,7 +516,7 @@ class FormularioCompletoQRFormTest(TestCase):
     
     def test_form_valido_con_ambos(self):
         """Test formulario válido con cédula y RUC"""
-        vigencia = timezone.now().date() + timedelta(days=365)
+        vigencia = timezone.localdate() + timedelta(days=365)
         
         form_data = {
             'placa': 'ABC1234',
@@ -492,7 +536,7 @@ class FormularioCompletoQRFormTest(TestCase):
     
     def test_form_invalido_cedula_faltante(self):
         """Test formulario inválido - falta cédula cuando es requerida"""
-        vigencia = timezone.now().date() + timedelta(days=365)
+        vigencia = timezone.localdate() + timedelta(days=365)
         
         form_data = {
             'placa': 'ABC1234',
@@ -512,7 +556,7 @@ class FormularioCompletoQRFormTest(TestCase):
     
     def test_form_invalido_cedula_formato(self):
         """Test formulario inválido - formato de cédula incorrecto"""
-        vigencia = timezone.now().date() + timedelta(days=365)
+        vigencia = timezone.localdate() + timedelta(days=365)
         
         form_data = {
             'placa': 'ABC1234',
@@ -532,7 +576,7 @@ class FormularioCompletoQRFormTest(TestCase):
     
     def test_form_invalido_vigencia_pasada(self):
         """Test formulario inválido - fecha de vigencia pasada"""
-        vigencia = timezone.now().date() - timedelta(days=30)
+        vigencia = timezone.localdate() - timedelta(days=30)
         
         form_data = {
             'placa': 'ABC1234',
@@ -614,7 +658,7 @@ class UtilsTest(TestCase):
             tipo_autorizacion=self.tipo_autorizacion,
             placa='ABC1234',
             numero_autorizacion='ACT-EP-DPOTTTM-016-2025-ACVIL',
-            vigencia=timezone.now().date() + timedelta(days=365),
+            vigencia=timezone.localdate() + timedelta(days=365),
             creado_por=self.user
         )
     
@@ -633,7 +677,7 @@ class UtilsTest(TestCase):
     
     def test_validar_autorizacion_caducada_vigente(self):
         """Test validación de autorización vigente"""
-        vigencia = timezone.now().date() + timedelta(days=30)
+        vigencia = timezone.localdate() + timedelta(days=30)
         
         esta_caducada = validar_autorizacion_caducada(vigencia)
         
@@ -641,7 +685,7 @@ class UtilsTest(TestCase):
     
     def test_validar_autorizacion_caducada_vencida(self):
         """Test validación de autorización caducada"""
-        vigencia = timezone.now().date() - timedelta(days=10)
+        vigencia = timezone.localdate() - timedelta(days=10)
         
         esta_caducada = validar_autorizacion_caducada(vigencia)
         
@@ -649,7 +693,7 @@ class UtilsTest(TestCase):
     
     def test_validar_autorizacion_caducada_hoy(self):
         """Test validación de autorización que caduca hoy"""
-        vigencia = timezone.now().date()
+        vigencia = timezone.localdate()
         
         esta_caducada = validar_autorizacion_caducada(vigencia)
         
@@ -658,7 +702,7 @@ class UtilsTest(TestCase):
     
     def test_crear_autorizacion_desde_form_usuario_nuevo(self):
         """Test crear autorización con usuario nuevo"""
-        vigencia = timezone.now().date() + timedelta(days=365)
+        vigencia = timezone.localdate() + timedelta(days=365)
         
         form_data = {
             'nombres': 'María López',
@@ -684,7 +728,7 @@ class UtilsTest(TestCase):
     
     def test_crear_autorizacion_desde_form_usuario_existente(self):
         """Test crear autorización con usuario existente"""
-        vigencia = timezone.now().date() + timedelta(days=365)
+        vigencia = timezone.localdate() + timedelta(days=365)
         
         form_data = {
             'nombres': 'Juan Pérez',
@@ -739,7 +783,7 @@ class GenerarQRViewTest(TestCase):
     
     def test_post_generar_qr_valido(self):
         """Test POST válido para generar QR"""
-        vigencia = timezone.now().date() + timedelta(days=365)
+        vigencia = timezone.localdate() + timedelta(days=365)
         
         post_data = {
             'placa': 'TEST123',
@@ -773,7 +817,7 @@ class GenerarQRViewTest(TestCase):
         """Test POST sin estar autenticado"""
         self.client.logout()
         
-        vigencia = timezone.now().date() + timedelta(days=365)
+        vigencia = timezone.localdate() + timedelta(days=365)
         
         post_data = {
             'placa': 'TEST123',
@@ -801,6 +845,8 @@ class VerificarQRViewTest(TestCase):
     """Tests para la vista de verificación de QR"""
     
     def setUp(self):
+        # Los contadores de límites sobreviven entre tests (misma IP y mismos QR)
+        caches['limites'].clear()
         self.client = Client()
         self.user = User.objects.create_user(
             username='testuser',
@@ -826,7 +872,7 @@ class VerificarQRViewTest(TestCase):
             tipo_autorizacion=tipo_autorizacion,
             placa='ABC1234',
             numero_autorizacion='ACT-EP-001-2025',
-            vigencia=timezone.now().date() + timedelta(days=365),
+            vigencia=timezone.localdate() + timedelta(days=365),
             creado_por=self.user
         )
     
@@ -856,7 +902,7 @@ class VerificarQRViewTest(TestCase):
             tipo_autorizacion=self.autorizacion.tipo_autorizacion,
             placa='XYZ5678',
             numero_autorizacion='ACT-EP-002-2025',
-            vigencia=timezone.now().date() - timedelta(days=30),
+            vigencia=timezone.localdate() - timedelta(days=30),
             creado_por=self.user
         )
         
@@ -920,7 +966,7 @@ class AutorizacionListViewTest(TestCase):
                 tipo_autorizacion=tipo_autorizacion,
                 placa=f'ABC{i}234',
                 numero_autorizacion=f'ACT-EP-00{i}-2025',
-                vigencia=timezone.now().date() + timedelta(days=365),
+                vigencia=timezone.localdate() + timedelta(days=365),
                 creado_por=self.user
             )
         
@@ -1009,7 +1055,7 @@ class AutorizacionDetailViewTest(TestCase):
             tipo_autorizacion=tipo_autorizacion,
             placa='ABC1234',
             numero_autorizacion='ACT-EP-001-2025',
-            vigencia=timezone.now().date() + timedelta(days=365),
+            vigencia=timezone.localdate() + timedelta(days=365),
             creado_por=self.user
         )
         
@@ -1127,7 +1173,7 @@ class DashboardViewTest(TestCase):
                 tipo_autorizacion=tipo_autorizacion,
                 placa=f'ABC{i}234',
                 numero_autorizacion=f'ACT-EP-00{i}-2025',
-                vigencia=timezone.now().date() + timedelta(days=365),
+                vigencia=timezone.localdate() + timedelta(days=365),
                 creado_por=self.user
             )
         
@@ -1138,7 +1184,7 @@ class DashboardViewTest(TestCase):
                 tipo_autorizacion=tipo_autorizacion,
                 placa=f'XYZ{i}567',
                 numero_autorizacion=f'ACT-EP-10{i}-2024',
-                vigencia=timezone.now().date() - timedelta(days=30),
+                vigencia=timezone.localdate() - timedelta(days=30),
                 creado_por=self.user
             )
         
@@ -1182,7 +1228,7 @@ class IntegracionGenerarQRTest(TestCase):
     
     def test_flujo_completo_generacion_qr(self):
         """Test del flujo completo: crear usuario, autorización y generar QR"""
-        vigencia = timezone.now().date() + timedelta(days=365)
+        vigencia = timezone.localdate() + timedelta(days=365)
         
         # Paso 1: Generar QR (crea usuario y autorización)
         post_data = {
@@ -1253,7 +1299,7 @@ class IntegracionGenerarQRTest(TestCase):
             creado_por=self.user
         )
         
-        vigencia = timezone.now().date() + timedelta(days=365)
+        vigencia = timezone.localdate() + timedelta(days=365)
         
         # Crear primera autorización
         post_data_1 = {
@@ -1349,7 +1395,7 @@ class IntegracionBusquedaFiltroTest(TestCase):
             tipo_autorizacion=self.tipo_autorizacion_1,
             placa='ABC1234',
             numero_autorizacion='ACT-TRAN-001-2025',
-            vigencia=timezone.now().date() + timedelta(days=365),
+            vigencia=timezone.localdate() + timedelta(days=365),
             creado_por=self.user
         )
         
@@ -1359,7 +1405,7 @@ class IntegracionBusquedaFiltroTest(TestCase):
             tipo_autorizacion=self.tipo_autorizacion_2,
             placa='XYZ5678',
             numero_autorizacion='ACT-CARG-001-2025',
-            vigencia=timezone.now().date() + timedelta(days=180),
+            vigencia=timezone.localdate() + timedelta(days=180),
             creado_por=self.user
         )
         
@@ -1369,7 +1415,7 @@ class IntegracionBusquedaFiltroTest(TestCase):
             tipo_autorizacion=self.tipo_autorizacion_1,
             placa='OLD9012',
             numero_autorizacion='ACT-TRAN-002-2024',
-            vigencia=timezone.now().date() - timedelta(days=30),
+            vigencia=timezone.localdate() - timedelta(days=30),
             creado_por=self.user
         )
         
@@ -1421,6 +1467,1753 @@ class IntegracionBusquedaFiltroTest(TestCase):
         self.assertEqual(autorizaciones[0].placa, 'ABC1234')
 
 
+# ============================================================================
+# TESTS DE CONSULTAS (N+1)
+# ============================================================================
+
+class HistorialN1Test(TestCase):
+    """Tests de managers, list_select_related y guardia de FK perezosas"""
+    
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_superuser(
+            username='admin',
+            email='admin@example.com',
+            password='testpass123',
+            names='Administrador'
+        )
+        self.tipo_autorizacion = TipoAutorizacion.objects.create(
+            codigo='TRAN',
+            nombre='Transporte',
+            creado_por=self.user
+        )
+        self.client.login(username='admin', password='testpass123')
+    
+    def _crear_registros(self, cantidad):
+        """Crea autorizaciones de usuarios distintos con su historial"""
+        for i in range(HistorialAutorizacion.objects.count(), HistorialAutorizacion.objects.count() + cantidad):
+            usuario = UsuarioAutorizacion.objects.create(
+                nombres=f'Usuario {i}',
+                cedula=f'09{i:08d}',
+                creado_por=self.user
+            )
+            autorizacion = Autorizacion.objects.create(
+                usuario=usuario,
+                tipo_autorizacion=self.tipo_autorizacion,
+                placa=f'ABC{i:04d}',
+                numero_autorizacion=f'ACT-EP-{i:04d}-2025',
+                vigencia=timezone.localdate() + timedelta(days=30),
+                creado_por=self.user
+            )
+            HistorialAutorizacion.objects.create(autorizacion=autorizacion, creado_por=self.user)
+            HistorialAcciones.objects.create(
+                autorizacion=autorizacion,
+                creado_por=self.user,
+                accion='GENERAR_QR',
+                descripcion=f'QR generado para placa {autorizacion.placa}'
+            )
+    
+    def _contar_consultas(self, url):
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(consultas)
+    
+    def test_accesores_sin_consultas_adicionales(self):
+        """Test que __str__ y las propiedades no consultan con el manager por defecto"""
+        self._crear_registros(3)
+        
+        with prohibir_fk_perezosas(), self.assertNumQueries(2):
+            for historial in HistorialAutorizacion.objects.all():
+                str(historial)
+                historial.placa, historial.usuario_nombres, historial.tipo_autorizacion
+            for accion in HistorialAcciones.objects.all():
+                str(accion)
+    
+    def test_guardia_lanza_en_carga_perezosa(self):
+        """Test que la guardia detecta una FK no incluida en el select_related"""
+        self._crear_registros(1)
+        historial = HistorialAutorizacion.objects.select_related(None).get()
+        
+        with prohibir_fk_perezosas():
+            with self.assertRaises(CargaPerezosaError):
+                historial.placa
+        
+        # Fuera de la guardia la carga perezosa sigue funcionando
+        self.assertEqual(historial.placa, 'ABC0000')
+    
+    def test_changelists_admin_consultas_constantes(self):
+        """Test que los changelists del admin no escalan con la cantidad de filas"""
+        urls = [
+            reverse('admin:formulario_historialautorizacion_changelist'),
+            reverse('admin:formulario_historialacciones_changelist'),
+            reverse('admin:formulario_autorizacion_changelist'),
+        ]
+        
+        self._crear_registros(1)
+        # Primer request tras el login: renueva la sesión (escritura que no depende de las filas)
+        self.client.get(urls[0])
+        with prohibir_fk_perezosas():
+            con_una_fila = [self._contar_consultas(url) for url in urls]
+        
+        self._crear_registros(99)
+        with prohibir_fk_perezosas():
+            con_cien_filas = [self._contar_consultas(url) for url in urls]
+        
+        self.assertEqual(con_una_fila, con_cien_filas)
+
+
+@override_settings(FORMULARIO_HISTORIAL_SNAPSHOT=True)
+class HistorialSnapshotTest(TestCase):
+    """Tests del modo snapshot del historial de autorizaciones"""
+    
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.tipo_autorizacion = TipoAutorizacion.objects.create(
+            codigo='TRAN',
+            nombre='Transporte',
+            creado_por=self.user
+        )
+        self.usuario = UsuarioAutorizacion.objects.create(
+            nombres='Juan Pérez',
+            cedula='0912345678',
+            creado_por=self.user
+        )
+        self.autorizacion = Autorizacion.objects.create(
+            usuario=self.usuario,
+            tipo_autorizacion=self.tipo_autorizacion,
+            placa='ABC1234',
+            numero_autorizacion='ACT-EP-001-2025',
+            vigencia=timezone.localdate() + timedelta(days=365),
+            creado_por=self.user
+        )
+        self.client.login(username='testuser', password='testpass123')
+    
+    def test_captura_snapshot_al_emitir(self):
+        """Test que el historial guarda los datos al momento de la emisión"""
+        historial = HistorialAutorizacion.objects.create(
+            autorizacion=self.autorizacion,
+            creado_por=self.user
+        )
+        
+        self.assertEqual(historial.snapshot_placa, 'ABC1234')
+        self.assertEqual(historial.snapshot_nombres, 'Juan Pérez')
+        self.assertEqual(historial.snapshot_tipo, 'Transporte')
+        self.assertEqual(historial.snapshot_numero, 'ACT-EP-001-2025')
+        self.assertEqual(historial.snapshot_vigencia, self.autorizacion.vigencia)
+    
+    def test_historial_no_cambia_al_renombrar_usuario(self):
+        """Test que renombrar al usuario no altera el reporte"""
+        HistorialAutorizacion.objects.create(autorizacion=self.autorizacion, creado_por=self.user)
+        self.usuario.nombres = 'Nombre Nuevo'
+        self.usuario.save()
+        
+        response = self.client.get(
+            reverse('formulario:historial_autorizaciones_list'),
+            {'usuario': 'Juan'}
+        )
+        
+        historial = list(response.context['historial_autorizaciones'])
+        self.assertEqual(len(historial), 1)
+        self.assertEqual(historial[0].usuario_nombres, 'Juan Pérez')
+    
+    def test_listado_no_une_autorizacion(self):
+        """Test que el listado en modo snapshot lee solo la tabla de historial"""
+        HistorialAutorizacion.objects.create(autorizacion=self.autorizacion, creado_por=self.user)
+        
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(reverse('formulario:historial_autorizaciones_list'))
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'ABC1234')
+        sql = ' '.join(consulta['sql'] for consulta in consultas)
+        self.assertNotIn('"formulario_autorizacion"', sql)
+    
+    def test_listado_sin_snapshot_una_consulta_por_pagina(self):
+        """Test que los registros aún sin rellenar se muestran con una sola consulta a autorizaciones"""
+        with override_settings(FORMULARIO_HISTORIAL_SNAPSHOT=False):
+            for _ in range(3):
+                HistorialAutorizacion.objects.create(autorizacion=self.autorizacion, creado_por=self.user)
+        
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(reverse('formulario:historial_autorizaciones_list'))
+        
+        self.assertContains(response, 'Juan Pérez')
+        self.assertEqual(len([c for c in consultas if '"formulario_autorizacion"' in c['sql']]), 1)
+    
+    def test_exportar_excel_con_snapshot(self):
+        """Test exportación a Excel leyendo el snapshot"""
+        HistorialAutorizacion.objects.create(autorizacion=self.autorizacion, creado_por=self.user)
+        
+        response = self.client.get(
+            reverse('formulario:historial_autorizaciones_exportar_excel'),
+            {'tipo_autorizacion': self.tipo_autorizacion.id, 'estado': 'vigentes'}
+        )
+        
+        self.assertEqual(response.status_code, 200)
+        ws = openpyxl.load_workbook(io.BytesIO(response.content)).active
+        self.assertEqual(ws.cell(row=8, column=5).value, 'ABC1234')
+        self.assertEqual(ws.cell(row=8, column=8).value, 'VIGENTE')
+    
+    def test_comando_rellenar_snapshot(self):
+        """Test que el comando rellena registros creados sin snapshot"""
+        with override_settings(FORMULARIO_HISTORIAL_SNAPSHOT=False):
+            historial = HistorialAutorizacion.objects.create(
+                autorizacion=self.autorizacion,
+                creado_por=self.user
+            )
+        self.assertIsNone(historial.snapshot_placa)
+        
+        call_command('rellenar_snapshot_historial', stdout=io.StringIO())
+        
+        historial.refresh_from_db()
+        self.assertEqual(historial.snapshot_placa, 'ABC1234')
+        self.assertEqual(historial.snapshot_nombres, 'Juan Pérez')
+        self.assertEqual(historial.snapshot_tipo, 'Transporte')
+        self.assertEqual(historial.snapshot_vigencia, self.autorizacion.vigencia)
+
+
+class CacheConfigTest(TestCase):
+    """Tests de la configuración de caché por espacios de nombres"""
+    
+    def test_alias_configurados(self):
+        """Test que existen los alias de caché usados por la aplicación"""
+        for alias in ('default', 'verificacion', 'dashboard', 'qr', 'fragmentos', 'limites', settings.SESSION_CACHE_ALIAS):
+            self.assertIn(alias, settings.CACHES)
+            caches[alias].set('prueba', alias)
+            self.assertEqual(caches[alias].get('prueba'), alias)
+    
+    def test_alias_aislados(self):
+        """Test que una misma clave no se comparte entre alias"""
+        caches['verificacion'].set('clave', 'verificacion')
+        caches['dashboard'].set('clave', 'dashboard')
+        
+        self.assertEqual(caches['verificacion'].get('clave'), 'verificacion')
+        self.assertEqual(caches['dashboard'].get('clave'), 'dashboard')
+    
+    def tearDown(self):
+        for alias in settings.CACHES:
+            caches[alias].clear()
+
+
+class InstrumentacionMiddlewareTest(TestCase):
+    """Tests del middleware de instrumentación por request"""
+    
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123',
+            names='Usuario de Prueba',
+            is_staff=True
+        )
+        self.client.login(username='testuser', password='testpass123')
+        metricas.limpiar()
+    
+    def test_cabecera_server_timing_y_log(self):
+        """Test que se emite Server-Timing y una línea JSON con las consultas"""
+        with self.assertLogs('apps.formulario.instrumentacion', level='INFO') as logs:
+            response = self.client.get(reverse('formulario:dashboard'))
+        
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('render;dur=', response['Server-Timing'])
+        registro = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(registro['vista'], 'formulario:dashboard')
+        self.assertGreater(registro['consultas'], 0)
+    
+    def test_percentiles_por_url(self):
+        """Test que se acumulan percentiles por nombre de URL"""
+        for _ in range(3):
+            self.client.get(reverse('formulario:dashboard'))
+        
+        response = self.client.get(reverse('formulario:metricas'))
+        
+        resumen = response.json()
+        self.assertEqual(resumen['formulario:dashboard']['requests'], 3)
+        self.assertIn('p95', resumen['formulario:dashboard']['total_ms'])
+    
+    def test_server_timing_solo_para_staff(self):
+        """Test que un anónimo no recibe Server-Timing pero su request igual se registra"""
+        self.client.logout()
+        with self.assertLogs('apps.formulario.instrumentacion', level='INFO') as logs:
+            response = self.client.get(reverse('formulario:verificar_qr'))
+        
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(json.loads(logs.records[-1].getMessage())['vista'], 'formulario:verificar_qr')
+        
+        with override_settings(INSTRUMENTACION_SERVER_TIMING=True):
+            self.assertIn('Server-Timing', self.client.get(reverse('formulario:verificar_qr')))
+    
+    @override_settings(INSTRUMENTACION_MUESTREO=0.0)
+    def test_muestreo_desactiva_medicion(self):
+        """Test que los requests no muestreados no se instrumentan"""
+        response = self.client.get(reverse('formulario:dashboard'))
+        
+        self.assertNotIn('Server-Timing', response)
+
+
+class GenerarDatosPruebaCommandTest(TestCase):
+    """Tests del comando generar_datos_prueba"""
+    
+    def _generar(self, **opciones):
+        call_command(
+            'generar_datos_prueba',
+            usuarios=20, autorizaciones=50, historial=80, acciones=40, lote=15,
+            stdout=io.StringIO(), **opciones
+        )
+    
+    def test_genera_volumenes_solicitados(self):
+        """Test que se crean las cantidades pedidas con formatos válidos"""
+        self._generar()
+        
+        self.assertEqual(UsuarioAutorizacion.objects.count(), 20)
+        self.assertEqual(Autorizacion.objects.count(), 50)
+        self.assertEqual(HistorialAutorizacion.objects.count(), 80)
+        self.assertEqual(HistorialAcciones.objects.count(), 40)
+        for usuario in UsuarioAutorizacion.objects.all():
+            usuario.full_clean()
+    
+    def test_codigo_qr_verificable(self):
+        """Test que el codigo_qr generado encuentra la autorización al verificar"""
+        self._generar()
+        autorizacion = Autorizacion.objects.filter(activo=True).first()
+        
+        response = self.client.get(autorizacion.codigo_qr.replace('http://localhost:8000', ''))
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.context['autorizacion_data']['tipo_autorizacion'],
+            autorizacion.tipo_autorizacion.nombre
+        )
+    
+    def test_semilla_determinista(self):
+        """Test que la misma semilla produce los mismos datos"""
+        self._generar(semilla=7)
+        primera = list(Autorizacion.objects.order_by('pk').values_list('placa', 'vigencia', 'tipo_autorizacion__codigo'))
+        Autorizacion.objects.all().delete()
+        UsuarioAutorizacion.objects.all().delete()
+        
+        self._generar(semilla=7)
+        segunda = list(Autorizacion.objects.order_by('pk').values_list('placa', 'vigencia', 'tipo_autorizacion__codigo'))
+        
+        self.assertEqual([f[1:] for f in primera], [f[1:] for f in segunda])
+
+
+class BenchmarkVistasCommandTest(TestCase):
+    """Tests de la comparación de corridas de benchmark_vistas"""
+    
+    def setUp(self):
+        self.directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directorio.cleanup)
+        self.comando = BenchmarkVistasCommand(stdout=io.StringIO())
+    
+    def _base(self, **valores):
+        resultado = {'tamano': 100, 'escenario': 'dashboard', 'p50_ms': 10.0, 'p95_ms': 12.0, 'consultas': 10}
+        resultado.update(valores)
+        ruta = os.path.join(self.directorio.name, 'base.json')
+        with open(ruta, 'w', encoding='utf-8') as archivo:
+            json.dump({'resultados': [resultado]}, archivo)
+        return ruta
+    
+    def _corrida(self, **valores):
+        resultado = {'tamano': 100, 'escenario': 'dashboard', 'p50_ms': 10.0, 'p95_ms': 12.0, 'consultas': 10}
+        resultado.update(valores)
+        return {'resultados': [resultado]}
+    
+    def test_sin_regresion_dentro_de_tolerancia(self):
+        """Test que variaciones menores a la tolerancia no fallan"""
+        self.comando._comparar(self._corrida(p95_ms=14.0), self._base(), 0.25)
+    
+    def test_regresion_por_consultas_y_latencia(self):
+        """Test que más consultas o un p95 fuera de tolerancia se reportan como regresión"""
+        with self.assertRaisesMessage(CommandError, '2 regresiones'):
+            self.comando._comparar(self._corrida(p95_ms=20.0, consultas=11), self._base(), 0.25)
+
+
+class PruebaCargaTest(TestCase):
+    """Tests del generador de URLs de QR y del resumen de la prueba de carga"""
+    
+    def test_generar_urls_qr_verificables(self):
+        """Test que las URLs generadas verifican y las alteradas no existen en la BD"""
+        call_command('generar_datos_prueba', usuarios=5, autorizaciones=10, historial=10, acciones=0,
+                     stdout=io.StringIO())
+        salida = io.StringIO()
+        call_command('generar_urls_qr', base_url='http://carga.local', stdout=salida)
+        urls = salida.getvalue().splitlines()
+        
+        self.assertEqual(len(urls), Autorizacion.objects.filter(activo=True).count())
+        response = self.client.get(urls[0].replace('http://carga.local', ''))
+        self.assertIsNotNone(response.context['autorizacion_data'])
+        self.assertNotEqual(response.context['autorizacion_data']['tipo_autorizacion'], 'No disponible')
+        
+        salida = io.StringIO()
+        call_command('generar_urls_qr', invalidas=1.0, limite=1, stdout=salida)
+        response = self.client.get(salida.getvalue().strip().replace('http://localhost:8000', ''))
+        self.assertEqual(response.context['autorizacion_data']['tipo_autorizacion'], 'No disponible')
+    
+    def test_resumen_histograma_y_errores(self):
+        """Test que el resumen calcula tasa de error, percentiles y buckets"""
+        resultados = Resultados()
+        for ms in (3, 8, 8, 40, 900):
+            resultados.registrar('verificar_qr', ms / 1000)
+        resultados.registrar('verificar_qr', 12, 'timeout')
+        
+        resumen = resultados.resumen(duracion=2)['verificar_qr']
+        
+        self.assertEqual(resumen['solicitudes'], 6)
+        self.assertEqual(resumen['rps'], 3)
+        self.assertEqual(resumen['tasa_error'], round(1 / 6, 4))
+        self.assertEqual(resumen['errores'], {'timeout': 1})
+        self.assertEqual(resumen['histograma'], {'<=5ms': 1, '<=10ms': 2, '<=50ms': 1, '<=1000ms': 1, '>10000ms': 1})
+
+
+class PerfilamientoMiddlewareTest(TestCase):
+    """Tests del perfilamiento bajo demanda y su índice en el admin"""
+    
+    def setUp(self):
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        ajustes = override_settings(PERFILAMIENTO_ACTIVO=True, PERFILAMIENTO_DIR=directorio.name)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.directorio = directorio.name
+        
+        self.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='testpass123', names='Administrador'
+        )
+        self.operador = User.objects.create_user(
+            username='operador', email='operador@example.com', password='testpass123', names='Operador'
+        )
+        self.url = reverse('formulario:historial_autorizaciones_list')
+    
+    def test_staff_guarda_perfil_con_sql(self):
+        """Test que un staff obtiene perfil y SQL con tiempos, y el admin lo lista"""
+        self.client.force_login(self.admin)
+        response = self.client.get(self.url, {'_perfil': '1'})
+        
+        self.assertEqual(response.status_code, 200)
+        nombre = response['X-Perfil']
+        with open(os.path.join(self.directorio, f'{nombre}.json'), encoding='utf-8') as archivo:
+            perfil = json.load(archivo)
+        self.assertEqual(perfil['vista'], 'formulario:historial_autorizaciones_list')
+        self.assertTrue(perfil['consultas'])
+        self.assertIn('ms', perfil['consultas'][0])
+        for archivo in perfil['archivos']:
+            self.assertTrue(os.path.exists(os.path.join(self.directorio, archivo)))
+        
+        indice = self.client.get(reverse('perfiles_index'))
+        self.assertContains(indice, 'formulario:historial_autorizaciones_list')
+        self.assertEqual(self.client.get(reverse('perfil_archivo', args=[f'{nombre}.json'])).status_code, 200)
+        self.assertEqual(self.client.get(reverse('perfil_archivo', args=['..%2Fsettings.json'])).status_code, 404)
+    
+    def test_no_staff_o_desactivado_no_perfila(self):
+        """Test que sin staff, con el perfilamiento apagado o sin ?_perfil=1 no se guarda nada"""
+        self.client.force_login(self.operador)
+        self.assertNotIn('X-Perfil', self.client.get(self.url, {'_perfil': '1'}))
+        
+        self.client.force_login(self.admin)
+        with override_settings(PERFILAMIENTO_ACTIVO=False):
+            self.assertNotIn('X-Perfil', self.client.get(self.url, HTTP_X_PERFIL='1'))
+        for valor in ('0', ''):
+            self.assertNotIn('X-Perfil', self.client.get(self.url, {'_perfil': valor}))
+        
+        self.assertEqual(os.listdir(self.directorio), [])
+        self.client.force_login(self.operador)
+        self.assertEqual(self.client.get(reverse('perfiles_index')).status_code, 302)
+
+
+class ConsultasLentasTest(TestCase):
+    """Tests del registro de consultas lentas y su resumen por huella"""
+    
+    def test_huella_ignora_valores(self):
+        """Test que literales, parámetros y largo de listas IN no cambian la huella"""
+        self.assertEqual(
+            huella_sql("SELECT * FROM t WHERE placa = 'ABC1234' AND id IN (1, 2, 3)"),
+            huella_sql('SELECT *  FROM t WHERE placa = %s AND id IN (%s, %s)')
+        )
+        self.assertNotEqual(huella_sql('SELECT * FROM t WHERE a = 1'), huella_sql('SELECT * FROM t WHERE b = 1'))
+    
+    def test_registra_vista_y_plan(self):
+        """Test que cada consulta sobre el umbral se registra con su vista y su plan"""
+        User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='testpass123', names='Administrador'
+        )
+        self.client.login(username='admin', password='testpass123')
+        
+        with self.assertLogs('apps.formulario.consultas_lentas', 'WARNING') as registro, \
+                self.settings(CONSULTAS_LENTAS_UMBRAL_MS=0, CONSULTAS_LENTAS_EXPLAIN=True):
+            with connection.execute_wrapper(RegistroConsultasLentas(connection)):
+                self.client.get(reverse('formulario:historial_acciones_list'))
+        
+        entradas = [json.loads(r.getMessage()) for r in registro.records]
+        selects = [e for e in entradas if e['sql'].startswith('SELECT')]
+        self.assertTrue(selects)
+        self.assertEqual({e['vista'] for e in selects}, {'formulario:historial_acciones_list'})
+        self.assertTrue(all(e['plan'] for e in selects))
+    
+    def test_explain_fallido_no_rompe_la_transaccion(self):
+        """Test que un EXPLAIN que falla queda en su savepoint y la transacción sigue usable"""
+        with transaction.atomic():
+            plan = explicar(connection, 'SELECT * FROM tabla_inexistente', [])
+            self.assertTrue(plan.startswith('EXPLAIN falló'))
+            self.assertFalse(connection.needs_rollback)
+            self.assertEqual(User.objects.count(), 0)
+        
+        with tempfile.TemporaryDirectory() as directorio:
+            ruta = os.path.join(directorio, 'logs', 'lentas.jsonl')
+            handler = ArchivoConsultasLentas(ruta, delay=True)
+            self.assertFalse(os.path.exists(os.path.dirname(ruta)))
+            handler.emit(logging.makeLogRecord({'msg': '{}'}))
+            handler.close()
+            self.assertTrue(os.path.exists(ruta))
+    
+    def test_resumen_agrupa_por_huella(self):
+        """Test que el comando agrupa por huella y ordena por tiempo total"""
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False, encoding='utf-8') as archivo:
+            for ms, sql, vista in (
+                (300, 'SELECT * FROM a WHERE id = 1', 'formulario:dashboard'),
+                (500, 'SELECT * FROM a WHERE id = 2', 'formulario:dashboard'),
+                (700, 'SELECT * FROM b', 'formulario:historial_acciones_list'),
+            ):
+                archivo.write(json.dumps({
+                    'fecha': '2025-01-01T00:00:00', 'ms': ms, 'vista': vista,
+                    'huella': huella_sql(sql), 'sql': sql, 'plan': None,
+                }) + '\n')
+        self.addCleanup(os.remove, archivo.name)
+        
+        salida = io.StringIO()
+        call_command('resumen_consultas_lentas', archivo=archivo.name, json=True, stdout=salida)
+        resumen = json.loads(salida.getvalue())
+        
+        self.assertEqual([r['cantidad'] for r in resumen], [2, 1])
+        self.assertEqual(resumen[0]['total_ms'], 800)
+        self.assertEqual(resumen[0]['vistas'], {'formulario:dashboard': 2})
+
+
+class AuditarIndicesTest(TestCase):
+    """Tests de la auditoría de índices"""
+    
+    def test_forma_consulta(self):
+        """Test que separa columnas de igualdad, rango y orden por tabla"""
+        forma = forma_consulta(
+            'SELECT "t"."id" FROM "t" WHERE ("t"."accion" IN (%s, %s) AND "t"."fecha" >= %s) '
+            'ORDER BY "t"."fecha" DESC LIMIT 10'
+        )['t']
+        
+        self.assertEqual(forma, {'igualdad': ['accion'], 'rango': ['fecha'], 'orden': ['fecha']})
+        self.assertEqual(proponer_indice(forma), ('accion', 'fecha'))
+    
+    def test_sin_redundantes_y_propuesta_desde_registro(self):
+        """Test que el esquema actual no tiene índices redundantes y se proponen los faltantes"""
+        sql_cubierta = (
+            'SELECT * FROM "formulario_historial_acciones" WHERE "formulario_historial_acciones"."accion" = %s '
+            'ORDER BY "formulario_historial_acciones"."fecha_accion" DESC'
+        )
+        sql_sin_indice = (
+            'SELECT * FROM "formulario_historial_acciones" '
+            'WHERE "formulario_historial_acciones"."descripcion" LIKE %s'
+        )
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False, encoding='utf-8') as archivo:
+            for sql in (sql_cubierta, sql_sin_indice):
+                archivo.write(json.dumps({'ms': 500, 'vista': 'formulario:historial_acciones_list', 'sql': sql}) + '\n')
+        self.addCleanup(os.remove, archivo.name)
+        
+        salida = io.StringIO()
+        call_command('auditar_indices', archivo=archivo.name, json=True, stdout=salida)
+        reporte = json.loads(salida.getvalue())
+        
+        self.assertEqual(reporte['redundantes'], [])
+        self.assertEqual(
+            [(p['tabla'], p['columnas']) for p in reporte['propuestas']],
+            [('formulario_historial_acciones', ['descripcion'])]
+        )
+
+
+class ReplicaRouterTest(TestCase):
+    """Tests del enrutamiento de lecturas a réplicas"""
+    
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.router = ReplicaRouter()
+    
+    def _request(self, vista, metodo='get', cookies=None, escribir=False):
+        """Ejecuta el middleware y devuelve (alias leído, response)"""
+        leido = {}
+        
+        def get_response(request):
+            # Django llama a process_view dentro de la cadena de middlewares
+            middleware.process_view(request, vista, (), {})
+            if escribir:
+                self.router.db_for_write(Autorizacion)
+            leido['alias'] = self.router.db_for_read(Autorizacion)
+            leido['usuario'] = self.router.db_for_read(User)
+            return HttpResponse('ok')
+        
+        request = getattr(self.factory, metodo)('/')
+        request.COOKIES.update(cookies or {})
+        middleware = ReplicaMiddleware(get_response)
+        return leido, middleware(request)
+    
+    @override_settings(DB_REPLICAS=['replica_1'])
+    def test_lecturas_de_vista_marcada(self):
+        """Test que solo las vistas marcadas leen de la réplica, y nunca usuarios ni sesiones"""
+        with patch('apps.formulario.routers.retraso_replica', return_value=0.5):
+            leido, response = self._request(VerificarQRView.as_view())
+            self.assertEqual(leido, {'alias': 'replica_1', 'usuario': 'default'})
+            self.assertNotIn(COOKIE_PRIMARIA, response.cookies)
+            
+            leido, _ = self._request(AutorizacionListView.as_view())
+            self.assertEqual(leido['alias'], 'default')
+            
+            leido, _ = self._request(VerificarQRView.as_view(), metodo='post')
+            self.assertEqual(leido['alias'], 'default')
+    
+    @override_settings(DB_REPLICAS=['replica_1'], DB_REPLICA_RETRASO_MAXIMO=5)
+    def test_retraso_excesivo_usa_primaria(self):
+        """Test que una réplica atrasada o caída no se usa"""
+        for retraso in (30, float('inf')):
+            with patch('apps.formulario.routers.retraso_replica', return_value=retraso):
+                leido, _ = self._request(VerificarQRView.as_view())
+                self.assertEqual(leido['alias'], 'default')
+    
+    @override_settings(DB_REPLICAS=['replica_1'])
+    def test_escritura_fija_primaria(self):
+        """Test que tras escribir se lee de default y la cookie fija los requests siguientes"""
+        with patch('apps.formulario.routers.retraso_replica', return_value=0):
+            leido, response = self._request(VerificarQRView.as_view(), escribir=True)
+            self.assertEqual(leido['alias'], 'default')
+            self.assertIn(COOKIE_PRIMARIA, response.cookies)
+            
+            leido, _ = self._request(VerificarQRView.as_view(), cookies={COOKIE_PRIMARIA: '1'})
+            self.assertEqual(leido['alias'], 'default')
+        
+        # Fuera de un request marcado el router no usa réplicas
+        self.assertEqual(self.router.db_for_read(Autorizacion), 'default')
+
+
+class TransaccionesTest(TestCase):
+    """Tests de las unidades de escritura: se guardan completas o no se guarda nada"""
+    
+    def setUp(self):
+        self.user = User.objects.create_superuser(
+            username='admin',
+            email='admin@example.com',
+            password='testpass123',
+            names='Administrador'
+        )
+        self.tipo_autorizacion = TipoAutorizacion.objects.create(
+            codigo='TRAN',
+            nombre='Transporte',
+            creado_por=self.user
+        )
+        self.client.login(username='admin', password='testpass123')
+    
+    def _crear_autorizacion(self):
+        usuario = UsuarioAutorizacion.objects.create(
+            nombres='Usuario Test', cedula='0945678901', creado_por=self.user
+        )
+        return Autorizacion.objects.create(
+            usuario=usuario,
+            tipo_autorizacion=self.tipo_autorizacion,
+            placa='ABC1234',
+            numero_autorizacion='ACT-TX-001-2025',
+            vigencia=timezone.localdate() + timedelta(days=30),
+            creado_por=self.user
+        )
+    
+    def test_sin_transaccion_por_request(self):
+        """Test que ATOMIC_REQUESTS está desactivado"""
+        self.assertFalse(connection.settings_dict['ATOMIC_REQUESTS'])
+    
+    def test_descarga_registra_historial_y_fecha_juntos(self):
+        """Test que si falla el guardado de la fecha de descarga no queda la acción en el historial"""
+        autorizacion = self._crear_autorizacion()
+        url = reverse('formulario:descargar_qr_autorizacion', kwargs={'autorizacion_id': autorizacion.pk})
+        
+        with patch.object(Autorizacion, 'save', side_effect=RuntimeError('fallo simulado')):
+            with self.assertRaises(RuntimeError):
+                self.client.get(url)
+        self.assertFalse(HistorialAcciones.objects.exists())
+        
+        self.client.get(url)
+        self.assertEqual(HistorialAcciones.objects.get().accion, 'DESCARGAR_QR')
+        autorizacion.refresh_from_db()
+        self.assertIsNotNone(autorizacion.fecha_descarga_qr)
+    
+    def test_generar_qr_todo_o_nada(self):
+        """Test que si falla el registro del historial no queda usuario ni autorización"""
+        post_data = {
+            'placa': 'TEST123',
+            'nombres': 'Usuario Test',
+            'tipo_identificacion': 'cedula',
+            'cedula': '0945678901',
+            'correo': 'test@example.com',
+            'telefono': '0987654321',
+            'tipo_autorizacion': self.tipo_autorizacion.id,
+            'numero_autorizacion': 'ACT-TEST-001-2025',
+            'vigencia': timezone.localdate() + timedelta(days=365),
+        }
+        crear = HistorialAcciones.objects.create
+        
+        def fallar_en_pdf(**kwargs):
+            if kwargs.get('accion') == 'GENERAR_PDF':
+                raise RuntimeError('fallo simulado')
+            return crear(**kwargs)
+        
+        with patch.object(HistorialAcciones.objects, 'create', side_effect=fallar_en_pdf):
+            response = self.client.post(reverse('formulario:generar_qr'), data=post_data)
+        
+        self.assertFalse(response.context['qr_generado'])
+        self.assertIn('Error al generar QR', [str(m) for m in response.context['messages']][0])
+        self.assertFalse(UsuarioAutorizacion.objects.exists())
+        self.assertFalse(Autorizacion.objects.exists())
+        self.assertFalse(HistorialAutorizacion.objects.exists())
+        self.assertFalse(HistorialAcciones.objects.exists())
+        
+        response = self.client.post(reverse('formulario:generar_qr'), data=post_data)
+        self.assertTrue(response.context['qr_generado'])
+        self.assertEqual(HistorialAcciones.objects.count(), 2)
+    
+    def test_eliminar_autorizacion_por_post(self):
+        """Test que el POST de confirmación elimina solo la autorización, o nada si algo falla"""
+        autorizacion = self._crear_autorizacion()
+        url = reverse('formulario:autorizacion_delete', kwargs={'pk': autorizacion.pk})
+        
+        with patch.object(Autorizacion, 'delete', side_effect=RuntimeError('fallo simulado')):
+            with self.assertRaises(RuntimeError):
+                self.client.post(url)
+        self.assertTrue(Autorizacion.objects.filter(pk=autorizacion.pk).exists())
+        
+        response = self.client.post(url)
+        self.assertRedirects(response, reverse('formulario:autorizacion_list'))
+        self.assertFalse(Autorizacion.objects.exists())
+        # El titular se conserva aunque haya sido su última autorización
+        self.assertTrue(UsuarioAutorizacion.objects.filter(pk=autorizacion.usuario_id).exists())
+
+
+class VerificacionAsincronaTest(TestCase):
+    """Tests de VerificarQRAsyncView y de la caché de verificación"""
+    
+    def setUp(self):
+        caches['limites'].clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        tipo_autorizacion = TipoAutorizacion.objects.create(codigo='TRAN', nombre='Transporte', creado_por=self.user)
+        usuario = UsuarioAutorizacion.objects.create(
+            nombres='Juan Pérez', cedula='0912345678', creado_por=self.user
+        )
+        self.autorizacion = Autorizacion.objects.create(
+            usuario=usuario,
+            tipo_autorizacion=tipo_autorizacion,
+            placa='ABC1234',
+            numero_autorizacion='ACT-EP-001-2025',
+            vigencia=timezone.localdate() + timedelta(days=365),
+            creado_por=self.user
+        )
+        self.url = urlsplit(construir_url_qr(self.autorizacion, 'http://testserver/verificar-qr/'))
+        self.url = f'{self.url.path}?{self.url.query}'
+    
+    async def test_misma_respuesta_que_la_vista_sincrona(self):
+        """Test que la vista asíncrona arma el mismo contexto que VerificarQRView"""
+        with override_settings(ROOT_URLCONF=RutasVerificacion(VerificarQRView)):
+            sincrona = await sync_to_async(self.client.get)(self.url)
+        with override_settings(ROOT_URLCONF=RutasVerificacion(VerificarQRAsyncView)):
+            asincrona = await self.async_client.get(self.url)
+        
+        self.assertEqual(asincrona.status_code, 200)
+        self.assertEqual(asincrona.context['autorizacion_data'], sincrona.context['autorizacion_data'])
+        self.assertEqual(asincrona.context['autorizacion_data']['tipo_autorizacion'], 'Transporte')
+        self.assertIn('Autorización válida', asincrona.context['mensaje'])
+    
+    async def test_instrumentacion_cuenta_consultas_del_orm_asincrono(self):
+        """Test que el middleware asíncrono ve las consultas que corren en el hilo del ORM"""
+        await caches['verificacion'].aclear()
+        with override_settings(
+            ROOT_URLCONF=RutasVerificacion(VerificarQRAsyncView), INSTRUMENTACION_SERVER_TIMING=True
+        ):
+            fria = await self.async_client.get(self.url)
+            caliente = await self.async_client.get(self.url)
+        
+        self.assertIn('db;dur=', fria['Server-Timing'])
+        self.assertNotIn('"0 consultas"', fria['Server-Timing'])
+        self.assertIn('"0 consultas"', caliente['Server-Timing'])
+    
+    def test_guardar_invalida_la_cache(self):
+        """Test que editar la autorización o su usuario no deja resultados viejos en caché"""
+        self.client.get(self.url)
+        self.autorizacion.vigencia = timezone.localdate() - timedelta(days=1)
+        self.autorizacion.save()
+        response = self.client.get(self.url)
+        self.assertTrue(response.context['esta_caducada'])
+        
+        usuario = self.autorizacion.usuario
+        usuario.nombres = 'Juan Pérez Actualizado'
+        usuario.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['autorizacion_data']['nombres'], 'Juan Pérez Actualizado')
+    
+    def test_cambiar_placa_o_tipo_invalida_la_cache(self):
+        """Test que editar la placa invalida la clave vieja y la nueva, y que editar el tipo también"""
+        self.client.get(self.url)
+        clave_nueva = clave_verificacion('XYZ9876', self.autorizacion.numero_autorizacion)
+        caches['verificacion'].set(clave_nueva, 'no-encontrada')
+        
+        self.autorizacion.placa = 'XYZ9876'
+        self.autorizacion.save()
+        self.assertIsNone(caches['verificacion'].get(clave_verificacion('ABC1234', 'ACT-EP-001-2025')))
+        self.assertIsNone(caches['verificacion'].get(clave_nueva))
+        
+        nueva_url = urlsplit(construir_url_qr(self.autorizacion, 'http://testserver/verificar-qr/'))
+        self.client.get(f'{nueva_url.path}?{nueva_url.query}')
+        self.assertIsNotNone(caches['verificacion'].get(clave_nueva))
+        tipo = self.autorizacion.tipo_autorizacion
+        tipo.nombre = 'Transporte Público'
+        tipo.save()
+        self.assertIsNone(caches['verificacion'].get(clave_nueva))
+    
+    def test_editar_placa_no_consulta_la_anterior(self):
+        """Test que guardar una autorización leída de la BD no agrega un SELECT para la clave vieja"""
+        autorizacion = Autorizacion.objects.get(pk=self.autorizacion.pk)
+        self.client.get(self.url)
+        
+        autorizacion.placa = 'XYZ9876'
+        with self.assertNumQueries(1):
+            autorizacion.save()
+        self.assertIsNone(caches['verificacion'].get(clave_verificacion('ABC1234', 'ACT-EP-001-2025')))
+        
+        caches['verificacion'].set(clave_verificacion('XYZ9876', 'ACT-EP-001-2025'), 'no-encontrada')
+        autorizacion.placa = 'JKL5555'
+        with self.assertNumQueries(1):
+            autorizacion.save()
+        self.assertIsNone(caches['verificacion'].get(clave_verificacion('XYZ9876', 'ACT-EP-001-2025')))
+
+
+class VerificacionCondicionalTest(TestCase):
+    """Tests de ETag/Last-Modified y Cache-Control en la página de verificación"""
+
+    def setUp(self):
+        caches['limites'].clear()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        tipo_autorizacion = TipoAutorizacion.objects.create(codigo='TRAN', nombre='Transporte', creado_por=self.user)
+        usuario = UsuarioAutorizacion.objects.create(nombres='Juan Pérez', cedula='0912345678', creado_por=self.user)
+        self.autorizacion = Autorizacion.objects.create(
+            usuario=usuario,
+            tipo_autorizacion=tipo_autorizacion,
+            placa='ABC1234',
+            numero_autorizacion='ACT-EP-001-2025',
+            vigencia=timezone.localdate() + timedelta(days=365),
+            creado_por=self.user
+        )
+        self.url = urlsplit(construir_url_qr(self.autorizacion, 'http://testserver/verificar-qr/'))
+        self.url = f'{self.url.path}?{self.url.query}'
+
+    def test_revalidacion_responde_304_sin_renderizar(self):
+        """Test que con el ETag o la fecha ya vistos se responde 304 sin plantilla"""
+        primera = self.client.get(self.url)
+        self.assertEqual(primera.status_code, 200)
+        self.assertIn('public', primera['Cache-Control'])
+        self.assertLessEqual(int(primera['Cache-Control'].split('max-age=')[1]), 300)
+
+        por_etag = self.client.get(self.url, HTTP_IF_NONE_MATCH=primera['ETag'])
+        por_fecha = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=primera['Last-Modified'])
+        for response in (por_etag, por_fecha):
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.templates, [])
+            self.assertEqual(response['ETag'], primera['ETag'])
+
+    def test_editar_cambia_el_etag(self):
+        """Test que editar la autorización o su usuario invalida el ETag"""
+        etag = self.client.get(self.url)['ETag']
+        usuario = self.autorizacion.usuario
+        usuario.nombres = 'Juan Pérez Actualizado'
+        usuario.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_autenticado_privado_y_no_encontrado_sin_last_modified(self):
+        """Test que la página de un usuario autenticado no es cacheable por proxies"""
+        anonimo = self.client.get(self.url)
+        no_encontrada = self.client.get(self.url.replace('ABC1234', 'XYZ9999'))
+        self.client.login(username='testuser', password='testpass123')
+        autenticado = self.client.get(self.url)
+
+        self.assertIn('private', autenticado['Cache-Control'])
+        self.assertIn('no-cache', autenticado['Cache-Control'])
+        self.assertNotEqual(autenticado['ETag'], anonimo['ETag'])
+        self.assertIn('ETag', no_encontrada)
+        self.assertNotIn('Last-Modified', no_encontrada)
+
+    async def test_vista_asincrona_responde_304(self):
+        """Test que VerificarQRAsyncView aplica los mismos validadores"""
+        with override_settings(ROOT_URLCONF=RutasVerificacion(VerificarQRAsyncView)):
+            primera = await self.async_client.get(self.url)
+            segunda = await self.async_client.get(self.url, headers={'If-None-Match': primera['ETag']})
+        self.assertEqual(primera.status_code, 200)
+        self.assertEqual(segunda.status_code, 304)
+
+
+class LimitesVerificacionTest(TestCase):
+    """Tests de los límites de frecuencia y la caché negativa de verificar_qr"""
+
+    def setUp(self):
+        for alias in ('limites', 'verificacion'):
+            caches[alias].clear()
+        escaneos.buffer.descartar()
+        self.url = reverse('formulario:verificar_qr')
+        self.qr = {'p': 'ABC1234', 'n': 'Juan', 'a': 'ACT-EP-404-2025', 'c': '2030-01-01'}
+
+    @override_settings(VERIFICACION_LIMITE_IP=3, VERIFICACION_LIMITE_QR=0)
+    def test_limite_por_ip(self):
+        """Test que al superar el límite por IP se responde 429 con Retry-After, sin tocar la BD"""
+        for i in range(3):
+            self.assertEqual(self.client.get(self.url, {**self.qr, 'p': f'ABC{i}'}).status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, self.qr)
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+
+        # Otra IP no comparte el contador
+        otra = self.client.get(self.url, self.qr, REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(otra.status_code, 200)
+
+    @override_settings(VERIFICACION_LIMITE_IP=0, VERIFICACION_LIMITE_QR=2)
+    def test_limite_por_qr(self):
+        """Test que el mismo QR desde distintas IPs comparte su límite"""
+        for ip in ('10.0.0.1', '10.0.0.2'):
+            self.assertEqual(self.client.get(self.url, self.qr, REMOTE_ADDR=ip).status_code, 200)
+        self.assertEqual(self.client.get(self.url, self.qr, REMOTE_ADDR='10.0.0.3').status_code, 429)
+        self.assertEqual(self.client.get(self.url, {**self.qr, 'p': 'XYZ9876'}).status_code, 200)
+
+    @override_settings(PROXIES_CONFIABLES=1)
+    def test_ip_detras_de_proxy(self):
+        """Test que con un proxy confiable se usa la IP que este agregó a X-Forwarded-For"""
+        request = RequestFactory().get('/', HTTP_X_FORWARDED_FOR='1.1.1.1, 2.2.2.2', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(ip_cliente(request), '2.2.2.2')
+        with override_settings(PROXIES_CONFIABLES=0):
+            self.assertEqual(ip_cliente(request), '10.0.0.1')
+
+    def test_cache_negativa(self):
+        """Test que un QR inexistente no vuelve a consultar la BD y que crearlo invalida la marca"""
+        self.client.get(self.url, self.qr)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, self.qr)
+        self.assertEqual(response.context['autorizacion_data']['tipo_autorizacion'], 'No disponible')
+
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        Autorizacion.objects.create(
+            usuario=UsuarioAutorizacion.objects.create(nombres='Juan', cedula='0912345678', creado_por=user),
+            tipo_autorizacion=TipoAutorizacion.objects.create(codigo='TRAN', nombre='Transporte', creado_por=user),
+            placa='ABC1234', numero_autorizacion='ACT-EP-404-2025', vigencia=date(2030, 1, 1), creado_por=user
+        )
+        response = self.client.get(self.url, self.qr)
+        self.assertEqual(response.context['autorizacion_data']['tipo_autorizacion'], 'Transporte')
+
+
+class EscaneosTest(TestCase):
+    """Tests del registro de escaneos por lotes y de su resumen diario"""
+
+    def setUp(self):
+        caches['limites'].clear()
+        escaneos.buffer.descartar()
+        self.user = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='testpass123', names='Administrador'
+        )
+        self.tipo = TipoAutorizacion.objects.create(codigo='TRAN', nombre='Transporte', creado_por=self.user)
+        self.autorizacion = Autorizacion.objects.create(
+            usuario=UsuarioAutorizacion.objects.create(nombres='Juan Pérez', cedula='0912345678', creado_por=self.user),
+            tipo_autorizacion=self.tipo,
+            placa='ABC1234',
+            numero_autorizacion='ACT-EP-001-2025',
+            vigencia=timezone.localdate() + timedelta(days=30),
+            creado_por=self.user
+        )
+        self.url = urlsplit(construir_url_qr(self.autorizacion, 'http://testserver/verificar-qr/'))
+        self.url = f'{self.url.path}?{self.url.query}'
+
+    def test_verificar_no_escribe_hasta_completar_el_lote(self):
+        """Test que el escaneo queda en memoria y se inserta en lote al terminar el request"""
+        with patch.object(escaneos.buffer, 'lote', 2), patch.object(escaneos.buffer, 'intervalo', 3600):
+            self.client.get(self.url)
+            self.assertEqual(EventoEscaneo.objects.count(), 0)
+            self.client.get(self.url.replace('ABC1234', 'XYZ9999'))
+
+        self.assertEqual(
+            list(EventoEscaneo.objects.order_by('fecha').values_list('autorizacion_id', 'tipo_autorizacion_id', 'resultado', 'ip')),
+            [(self.autorizacion.pk, self.tipo.pk, 'vigente', '127.0.0.1'), (None, None, 'no_encontrada', '127.0.0.1')]
+        )
+
+    def test_buffer_circular_descarta_los_mas_antiguos(self):
+        """Test que el buffer lleno descarta los eventos más antiguos"""
+        buffer = escaneos.BufferEscaneos(tamano=2, lote=10, intervalo=60)
+        for resultado in ('vigente', 'caducada', 'no_encontrada'):
+            buffer.registrar(resultado)
+
+        self.assertEqual(buffer.descartados, 1)
+        self.assertEqual(buffer.vaciar(), 2)
+        self.assertEqual(
+            sorted(EventoEscaneo.objects.values_list('resultado', flat=True)), ['caducada', 'no_encontrada']
+        )
+
+    def test_resumen_diario_y_dashboard(self):
+        """Test que resumir_escaneos agrupa por autorización, tipo y resultado y es idempotente"""
+        ayer = timezone.now() - timedelta(days=1)
+        EventoEscaneo.objects.bulk_create(
+            [EventoEscaneo(fecha=ayer, autorizacion=self.autorizacion, tipo_autorizacion=self.tipo, resultado='vigente')] * 3
+            + [EventoEscaneo(fecha=ayer, resultado='no_encontrada')] * 2
+            + [EventoEscaneo(fecha=ayer - timedelta(days=200), resultado='no_encontrada')]
+        )
+        fecha = timezone.localtime(ayer).date().isoformat()
+        for _ in range(2):
+            call_command('resumir_escaneos', fecha=fecha, stdout=io.StringIO())
+
+        self.assertEqual(
+            sorted(ResumenEscaneoDiario.objects.values_list('autorizacion_id', 'resultado', 'escaneos'), key=str),
+            sorted([(self.autorizacion.pk, 'vigente', 3), (None, 'no_encontrada', 2)], key=str)
+        )
+
+        self.client.login(username='admin', password='testpass123')
+        response = self.client.get(reverse('formulario:dashboard'))
+        por_tipo = {fila['tipo_autorizacion__nombre']: fila for fila in response.context['escaneos_por_tipo']}
+        self.assertEqual(por_tipo['Transporte']['vigentes'], 3)
+        self.assertEqual(por_tipo[None]['no_encontradas'], 2)
+        self.assertEqual(response.context['autorizaciones_mas_escaneadas'][0]['total'], 3)
+
+        call_command('resumir_escaneos', fecha=fecha, purgar=True, stdout=io.StringIO())
+        self.assertEqual(EventoEscaneo.objects.count(), 5)
+
+
+class PaqueteOfflineTest(TestCase):
+    """Tests del paquete firmado para verificación sin conexión"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.tipo = TipoAutorizacion.objects.create(codigo='TRAN', nombre='Transporte', creado_por=self.user)
+        self.usuario = UsuarioAutorizacion.objects.create(
+            nombres='Juan Pérez', cedula='0912345678', creado_por=self.user
+        )
+        self.autorizaciones = [
+            Autorizacion.objects.create(
+                usuario=self.usuario,
+                tipo_autorizacion=self.tipo,
+                placa=f'ABC{i:04d}',
+                numero_autorizacion=f'ACT-EP-{i:03d}-2025',
+                vigencia=timezone.localdate() + timedelta(days=30),
+                creado_por=self.user
+            )
+            for i in range(5)
+        ]
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.directorio = directorio.name
+        clave = override_settings(PAQUETE_OFFLINE_CLAVE_PRIVADA=os.path.join(self.directorio, 'clave.pem'))
+        clave.enable()
+        self.addCleanup(clave.disable)
+        call_command('clave_paquete_offline', stdout=io.StringIO())
+        self.publica = paquete_offline.clave_publica()
+
+    def _leer(self, ruta):
+        with open(ruta, 'rb') as archivo:
+            return archivo.read()
+
+    def _completo(self, version, publica=None):
+        verificador = paquete_offline.VerificadorOffline(publica or self.publica)
+        verificador.aplicar(self._leer(paquete_offline.ruta_completo(version, self.directorio)))
+        return verificador
+
+    def test_paquete_completo_verifica_vigentes(self):
+        """Test que el paquete contiene las autorizaciones vigentes y rechaza datos alterados"""
+        version = paquete_offline.generar(directorio=self.directorio, tamano_lote=2)['version']
+        verificador = self._completo(version)
+        autorizacion = self.autorizaciones[0]
+
+        self.assertEqual(len(verificador.huellas), 5)
+        self.assertTrue(verificador.vigente(
+            ' act-ep-000-2025', 'abc 0000', autorizacion.vigencia.isoformat()
+        ))
+        self.assertFalse(verificador.vigente(autorizacion.numero_autorizacion, 'XYZ9999', autorizacion.vigencia))
+        self.assertFalse(verificador.vigente(
+            autorizacion.numero_autorizacion, autorizacion.placa, autorizacion.vigencia + timedelta(days=1)
+        ))
+        self.assertFalse(verificador.vigente(
+            autorizacion.numero_autorizacion, autorizacion.placa, autorizacion.vigencia,
+            hoy=autorizacion.vigencia + timedelta(days=1)
+        ))
+
+    def test_qr_con_numero_largo_verifica_sin_conexion(self):
+        """Test que el dispositivo verifica con los parámetros del QR aunque el número se recorte"""
+        autorizacion = Autorizacion.objects.create(
+            usuario=self.usuario, tipo_autorizacion=self.tipo, placa='LAR-0001',
+            numero_autorizacion='ACT-EP-DPOTTTM-016-2025-ACVIL',
+            vigencia=timezone.localdate() + timedelta(days=30), creado_por=self.user
+        )
+        verificador = self._completo(paquete_offline.generar(directorio=self.directorio)['version'])
+        url = urlsplit(construir_url_qr(autorizacion, 'http://testserver/verificar-qr/'))
+        qr = {k: v[0] for k, v in parse_qs(url.query).items()}
+
+        self.assertNotEqual(qr['a'], autorizacion.numero_autorizacion)
+        self.assertTrue(verificador.vigente(qr['a'], qr['p'], qr['c']))
+
+    def test_firma_alterada_se_rechaza(self):
+        """Test que un byte cambiado o una clave distinta invalidan el paquete"""
+        version = paquete_offline.generar(directorio=self.directorio)['version']
+        datos = bytearray(self._leer(paquete_offline.ruta_completo(version, self.directorio)))
+        datos[paquete_offline.CABECERA.size] ^= 1
+
+        with self.assertRaises(paquete_offline.PaqueteInvalido):
+            paquete_offline.VerificadorOffline(self.publica).aplicar(bytes(datos))
+        otra = os.path.join(self.directorio, 'otra.pem')
+        paquete_offline.crear_clave(otra)
+        with override_settings(PAQUETE_OFFLINE_CLAVE_PRIVADA=otra):
+            with self.assertRaises(paquete_offline.PaqueteInvalido):
+                self._completo(version, paquete_offline.clave_publica())
+        
+        # Sin clave privada no se genera nada
+        with override_settings(PAQUETE_OFFLINE_CLAVE_PRIVADA=os.path.join(self.directorio, 'no-existe.pem')):
+            with self.assertRaises(CommandError):
+                call_command('generar_paquete_offline', dir=self.directorio, stdout=io.StringIO())
+
+    def test_delta_equivale_al_paquete_completo(self):
+        """Test que aplicar el delta sobre la versión anterior da el paquete completo nuevo"""
+        anterior = paquete_offline.generar(directorio=self.directorio)['version']
+
+        self.autorizaciones[0].vigencia = timezone.localdate() - timedelta(days=1)
+        self.autorizaciones[0].save()
+        self.autorizaciones[1].activo = False
+        self.autorizaciones[1].save()
+        self.autorizaciones[2].delete()
+        Autorizacion.objects.create(
+            usuario=self.usuario, tipo_autorizacion=self.tipo, placa='NUE0001',
+            numero_autorizacion='ACT-EP-100-2025', vigencia=timezone.localdate(), creado_por=self.user
+        )
+        resumen = paquete_offline.generar(directorio=self.directorio)
+
+        self.assertEqual(resumen['deltas'][anterior], {'altas': 1, 'bajas': 3})
+        verificador = self._completo(anterior)
+        verificador.aplicar(self._leer(paquete_offline.ruta_delta(anterior, resumen['version'], self.directorio)))
+        self.assertEqual(verificador.version, resumen['version'])
+        self.assertEqual(verificador.huellas, self._completo(resumen['version']).huellas)
+
+        # Un delta solo se aplica sobre la versión de la que parte
+        with self.assertRaises(paquete_offline.PaqueteInvalido):
+            verificador.aplicar(self._leer(paquete_offline.ruta_delta(anterior, resumen['version'], self.directorio)))
+
+    def test_solo_se_conservan_las_ultimas_versiones(self):
+        """Test que se borran completos y deltas de versiones fuera de --conservar"""
+        for _ in range(4):
+            version = paquete_offline.generar(directorio=self.directorio, conservar=2)['version']
+
+        versiones = paquete_offline.versiones(self.directorio)
+        self.assertEqual(len(versiones), 3)
+        self.assertEqual(versiones[-1], version)
+        self.assertEqual(len([n for n in os.listdir(self.directorio) if n.startswith('delta-')]), 2)
+        
+        # --conservar 0: solo el completo nuevo, sin deltas
+        version = paquete_offline.generar(directorio=self.directorio, conservar=0)['version']
+        self.assertEqual(paquete_offline.versiones(self.directorio), [version])
+        self.assertFalse([n for n in os.listdir(self.directorio) if n.startswith('delta-')])
+
+    def test_endpoint_envia_delta_o_completo(self):
+        """Test que el endpoint envía el delta pedido, el completo si no lo hay y 204 si está al día"""
+        self.client.login(username='testuser', password='testpass123')
+        url = reverse('formulario:paquete_offline')
+        with override_settings(PAQUETE_OFFLINE_DIR=self.directorio):
+            self.assertEqual(self.client.get(url).status_code, 404)
+            anterior = paquete_offline.generar()['version']
+            version = paquete_offline.generar()['version']
+
+            delta = self.client.get(url, {'desde': anterior})
+            completo = self.client.get(url, {'desde': 1})
+            al_dia = self.client.get(url, {'desde': version})
+            no_modificado = self.client.get(url, HTTP_IF_NONE_MATCH=completo['ETag'])
+
+        self.assertEqual(delta['X-Paquete-Version'], str(version))
+        self.assertEqual(
+            b''.join(delta.streaming_content),
+            self._leer(paquete_offline.ruta_delta(anterior, version, self.directorio))
+        )
+        self.assertEqual(
+            b''.join(completo.streaming_content),
+            self._leer(paquete_offline.ruta_completo(version, self.directorio))
+        )
+        self.assertEqual(al_dia.status_code, 204)
+        self.assertEqual(no_modificado.status_code, 304)
+
+
+class VerificacionLoteTest(TestCase):
+    """Tests de la verificación de placas y números por lote"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.login(username='testuser', password='testpass123')
+        self.client.get(reverse('formulario:dashboard'))  # calienta la sesión: no contar su renovación
+        self.url = reverse('formulario:verificacion_lote')
+        tipo = TipoAutorizacion.objects.create(codigo='TRAN', nombre='Transporte', creado_por=self.user)
+        usuario = UsuarioAutorizacion.objects.create(nombres='Juan Pérez', cedula='0912345678', creado_por=self.user)
+        hoy = timezone.localdate()
+        for placa, numero, vigencia, activo in (
+            ('ABC-1234', 'ACT-EP-001-2025', hoy, True),
+            ('xyz 9876', 'ACT-EP-002-2025', hoy - timedelta(days=1), True),
+            ('PQR5555', 'ACT-EP-003-2025', hoy + timedelta(days=30), False),
+        ):
+            Autorizacion.objects.create(
+                usuario=usuario, tipo_autorizacion=tipo, placa=placa, numero_autorizacion=numero,
+                vigencia=vigencia, activo=activo, creado_por=self.user
+            )
+
+    def _verificar(self, **kwargs):
+        return self.client.post(self.url, json.dumps(kwargs), content_type='application/json')
+
+    def test_estados_con_placas_normalizadas(self):
+        """Test que las placas se comparan normalizadas y cada una trae su estado"""
+        with self.assertNumQueries(3):  # sesión, usuario y una consulta por las placas
+            response = self._verificar(placas=['abc1234', 'XYZ-9876', 'pqr 5555', 'NOE0000', 'ABC 1234'])
+
+        resultados = response.json()['resultados']
+        self.assertEqual([r['placa'] for r in resultados], ['ABC1234', 'XYZ9876', 'PQR5555', 'NOE0000'])
+        self.assertEqual(
+            [[a['estado'] for a in r['autorizaciones']] for r in resultados],
+            [['vigente'], ['caducada'], ['inactiva'], []]
+        )
+        self.assertEqual([r['vigente'] for r in resultados], [True, False, False, False])
+        self.assertEqual(resultados[0]['autorizaciones'][0]['tipo_autorizacion'], 'Transporte')
+        self.assertEqual(resultados[0]['autorizaciones'][0]['vigencia'], timezone.localdate().isoformat())
+
+    def test_numeros_y_ndjson(self):
+        """Test la búsqueda por número y la respuesta NDJSON por línea"""
+        response = self.client.post(
+            self.url, json.dumps({'numeros': [' act-ep-002-2025', 'ACT-EP-999-2025']}),
+            content_type='application/json', HTTP_ACCEPT='application/x-ndjson'
+        )
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lineas = [json.loads(linea) for linea in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([l['numero_autorizacion'] for l in lineas], ['ACT-EP-002-2025', 'ACT-EP-999-2025'])
+        self.assertEqual(lineas[0]['autorizaciones'][0]['placa'], 'xyz 9876')
+        self.assertEqual(lineas[1]['autorizaciones'], [])
+
+    def test_lote_grande_consulta_por_bloques(self):
+        """Test que un lote mayor que VALORES_POR_CONSULTA se resuelve en pocas consultas"""
+        placas = [f'NOE{i:04d}' for i in range(2500)] + ['ABC1234']
+        with self.assertNumQueries(5):  # sesión, usuario y 3 bloques de placas
+            resultados = self._verificar(placas=placas).json()['resultados']
+        self.assertEqual(len(resultados), 2501)
+        self.assertTrue(resultados[-1]['vigente'])
+
+    @override_settings(VERIFICACION_LOTE_MAXIMO=2)
+    def test_rechaza_lotes_invalidos(self):
+        """Test los errores por exceso de valores o JSON inválido"""
+        self.assertEqual(self._verificar(placas=['A', 'B'], numeros=['C']).status_code, 400)
+        self.assertEqual(self._verificar(placas='ABC1234').status_code, 400)
+        response = self.client.post(self.url, '{', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class CaducarAutorizacionesTest(TestCase):
+    """Tests de la columna caducada y del comando diario que la actualiza"""
+
+    def setUp(self):
+        self.user = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='testpass123', names='Administrador'
+        )
+        self.tipo = TipoAutorizacion.objects.create(codigo='TRAN', nombre='Transporte', creado_por=self.user)
+        self.hoy = timezone.localdate()
+        self.autorizaciones = [
+            Autorizacion.objects.create(
+                usuario=UsuarioAutorizacion.objects.create(
+                    nombres=f'Usuario {indice}', cedula=f'091234567{indice}', creado_por=self.user
+                ),
+                tipo_autorizacion=self.tipo,
+                placa=f'ABC123{indice}',
+                numero_autorizacion=f'ACT-EP-00{indice}-2025',
+                vigencia=self.hoy + timedelta(days=30),
+                creado_por=self.user
+            )
+            for indice in range(4)
+        ]
+        # Vencidas "durante la noche": update() no pasa por save()
+        Autorizacion.objects.filter(pk__in=[a.pk for a in self.autorizaciones[:3]]).update(
+            vigencia=self.hoy - timedelta(days=1)
+        )
+
+    def test_marca_por_lotes_con_una_entrada_de_auditoria(self):
+        """Test que el comando marca las vencidas por lotes, invalida la caché y es idempotente"""
+        cache = caches['verificacion']
+        claves = [clave_verificacion(a.placa, a.numero_autorizacion) for a in self.autorizaciones]
+        cache.set_many({clave: 'datos' for clave in claves})
+
+        salida = io.StringIO()
+        call_command('caducar_autorizaciones', lote=2, stdout=salida)
+        call_command('caducar_autorizaciones', lote=2, stdout=salida)
+
+        self.assertEqual(Autorizacion.objects.filter(caducada=True).count(), 3)
+        self.assertEqual(list(cache.get_many(claves)), [claves[3]])
+        acciones = HistorialAcciones.objects.filter(accion='CADUCAR_AUTORIZACIONES')
+        self.assertEqual(acciones.count(), 1)
+        self.assertIsNone(acciones.get().autorizacion)
+        self.assertIn('0 autorizaciones marcadas', salida.getvalue())
+
+    def test_save_recalcula_con_la_fecha_local(self):
+        """Test que save() aplica la regla única: vigente hasta el final del día local"""
+        autorizacion = self.autorizaciones[3]
+        autorizacion.vigencia = self.hoy
+        autorizacion.save(update_fields=['vigencia'])
+        self.assertFalse(Autorizacion.objects.get(pk=autorizacion.pk).caducada)
+
+        autorizacion.vigencia = self.hoy - timedelta(days=1)
+        autorizacion.save(update_fields=['vigencia'])
+        self.assertTrue(Autorizacion.objects.get(pk=autorizacion.pk).caducada)
+        self.assertTrue(autorizacion.esta_caducada)
+
+    def test_filtros_de_estado_usan_la_columna(self):
+        """Test que el listado y el dashboard cuentan caducadas por la columna"""
+        self.client.login(username='admin', password='testpass123')
+        call_command('caducar_autorizaciones', stdout=io.StringIO())
+
+        response = self.client.get(reverse('formulario:autorizacion_list'), {'estado': 'caducadas'})
+        self.assertEqual(len(response.context['autorizaciones']), 3)
+        response = self.client.get(reverse('formulario:dashboard'))
+        self.assertEqual(response.context['autorizaciones_caducadas'], 3)
+
+
+class RecordatoriosVencimientoTest(TestCase):
+    """Tests del envío por lotes e idempotente de los recordatorios de vencimiento"""
+
+    def setUp(self):
+        self.user = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='testpass123', names='Administrador'
+        )
+        self.tipo = TipoAutorizacion.objects.create(codigo='TRAN', nombre='Transporte', creado_por=self.user)
+        self.hoy = timezone.localdate()
+
+    def _crear(self, indice, dias, correo='', activo=True):
+        return Autorizacion.objects.create(
+            usuario=UsuarioAutorizacion.objects.create(
+                nombres=f'Usuario {indice}', cedula=f'09{indice:08d}', correo=correo or None, creado_por=self.user
+            ),
+            tipo_autorizacion=self.tipo,
+            placa=f'ABC{indice:04d}',
+            numero_autorizacion=f'ACT-EP-{indice:03d}-2025',
+            vigencia=self.hoy + timedelta(days=dias),
+            activo=activo,
+            creado_por=self.user
+        )
+
+    def test_envia_un_aviso_por_anticipacion(self):
+        """Test que cada autorización recibe el aviso de su anticipación una sola vez"""
+        en_7 = self._crear(1, 7, 'uno@example.com')
+        en_3 = self._crear(2, 3, 'dos@example.com')
+        self._crear(3, 40, 'tres@example.com')
+        self._crear(4, 5)
+        self._crear(5, 5, 'cinco@example.com', activo=False)
+
+        call_command('enviar_recordatorios', dias='30,7,1', stdout=io.StringIO())
+        call_command('enviar_recordatorios', dias='30,7,1', stdout=io.StringIO())
+
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ['dos@example.com', 'uno@example.com'])
+        self.assertIn(en_7.numero_autorizacion, mail.outbox[0].subject)
+        self.assertIn('ABC0001', mail.outbox[0].body)
+        self.assertEqual(
+            set(RecordatorioVencimiento.objects.values_list('autorizacion_id', 'dias')), {(en_7.pk, 7), (en_3.pk, 7)}
+        )
+
+        # Dos días después a en_3 le queda 1: corresponde el aviso de 1 día
+        mail.outbox = []
+        enviar_recordatorios(hoy=self.hoy + timedelta(days=2), anticipaciones=[30, 7, 1])
+        self.assertEqual([m.to for m in mail.outbox], [['dos@example.com']])
+
+    def test_consultas_por_lote_y_no_por_fila(self):
+        """Test que la cantidad de consultas no depende de la cantidad de avisos"""
+        for indice in range(40):
+            self._crear(indice, indice % 7, f'titular{indice}@example.com')
+
+        with self.assertNumQueries(5):  # 2 lotes y su bulk_create, y la consulta vacía del final
+            resumen = enviar_recordatorios(anticipaciones=[7], tamano_lote=25)
+        self.assertEqual(resumen, {'enviados': 40, 'fallidos': 0})
+        self.assertEqual(len(mail.outbox), 40)
+
+    def test_fallo_de_envio_se_reintenta(self):
+        """Test que un correo que falla no se registra y se envía en la corrida siguiente"""
+        self._crear(1, 1, 'uno@example.com')
+        self._crear(2, 1, 'dos@example.com')
+        enviar = mail.get_connection().__class__.send_messages
+
+        def fallar_para_uno(conexion, mensajes):
+            if mensajes[0].to == ['uno@example.com']:
+                raise smtplib.SMTPRecipientsRefused({})
+            return enviar(conexion, mensajes)
+
+        with patch('django.core.mail.backends.locmem.EmailBackend.send_messages', fallar_para_uno), \
+                self.assertLogs('apps.formulario.recordatorios', 'WARNING'):
+            self.assertEqual(enviar_recordatorios(anticipaciones=[7]), {'enviados': 1, 'fallidos': 1})
+        self.assertEqual(enviar_recordatorios(anticipaciones=[7]), {'enviados': 1, 'fallidos': 0})
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ['dos@example.com', 'uno@example.com'])
+
+
+class ResumenHistorialTest(TestCase):
+    """Tests del resumen incremental del historial y del reporte anual que lo lee"""
+
+    def setUp(self):
+        self.user = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='testpass123', names='Administrador'
+        )
+        self.operador = User.objects.create_user(
+            username='operador', email='operador@example.com', password='testpass123', names='Operador'
+        )
+        self.liviano = TipoAutorizacion.objects.create(codigo='LIV', nombre='Liviano', creado_por=self.user)
+        self.pesado = TipoAutorizacion.objects.create(codigo='PES', nombre='Pesado', creado_por=self.user)
+        self.autorizaciones = []
+        for indice, (tipo, vigencia) in enumerate([
+            (self.liviano, date(2025, 1, 20)), (self.pesado, date(2025, 2, 3)), (self.liviano, date(2025, 2, 28))
+        ]):
+            self.autorizaciones.append(Autorizacion.objects.create(
+                usuario=UsuarioAutorizacion.objects.create(
+                    nombres=f'Usuario {indice}', cedula=f'091234567{indice}', creado_por=self.user
+                ),
+                tipo_autorizacion=tipo,
+                placa=f'ABC123{indice}',
+                numero_autorizacion=f'ACT-EP-00{indice}-2024',
+                vigencia=vigencia,
+                creado_por=self.user
+            ))
+        # Emitidas en 2024: enero (admin), enero (operador) y marzo (admin)
+        for autorizacion, creador, mes in zip(self.autorizaciones, [self.user, self.operador, self.user], [1, 1, 3]):
+            historial = HistorialAutorizacion.objects.create(autorizacion=autorizacion, creado_por=creador)
+            HistorialAutorizacion.objects.filter(pk=historial.pk).update(
+                fecha_creacion=timezone.make_aware(datetime(2024, mes, 15, 12))
+            )
+
+    def test_actualizacion_incremental_desde_la_marca(self):
+        """Test que solo se recalculan los días nuevos y que repetir no cambia nada"""
+        self.assertEqual(actualizar_resumen()['registros'], 3)
+
+        HistorialAutorizacion.objects.create(autorizacion=self.autorizaciones[0], creado_por=self.operador)
+        resultado = actualizar_resumen()
+        self.assertEqual((resultado['registros'], resultado['filas']), (1, 1))
+        self.assertEqual(actualizar_resumen()['registros'], 0)
+        self.assertEqual(ResumenHistorialDiario.objects.aggregate(total=Sum('emitidas'))['total'], 4)
+
+        # Las bajas de días ya resumidos solo se reflejan al reconstruir
+        HistorialAutorizacion.objects.filter(autorizacion=self.autorizaciones[2]).delete()
+        actualizar_resumen(completo=True)
+        self.assertEqual(ResumenHistorialDiario.objects.aggregate(total=Sum('emitidas'))['total'], 3)
+
+    def test_reporte_anual_lee_solo_el_resumen(self):
+        """Test los totales por mes, tipo, operador y mes de vencimiento"""
+        actualizar_resumen()
+        with self.assertNumQueries(3):
+            reporte = reporte_anual(2024)
+
+        self.assertEqual(
+            [(fila['nombre'], fila['meses'][:3], fila['total']) for fila in reporte['por_tipo']['filas']],
+            [('Liviano', [1, 0, 1], 2), ('Pesado', [1, 0, 0], 1)]
+        )
+        self.assertEqual(
+            [(fila['nombre'], fila['total']) for fila in reporte['por_operador']['filas']],
+            [('Administrador', 2), ('Operador', 1)]
+        )
+        self.assertEqual(reporte_anual(2025)['vencimientos']['totales'][:3], [1, 2, 0])
+
+    def test_vista_y_exportacion_excel(self):
+        """Test que la vista y el Excel muestran el reporte del año pedido"""
+        caches['dashboard'].clear()
+        actualizar_resumen()
+        self.client.login(username='admin', password='testpass123')
+
+        response = self.client.get(reverse('formulario:reporte_historial'), {'anio': 2024})
+        self.assertEqual(response.status_code, 200)
+        # La segunda vez el reporte sale de la caché (solo se lee la marca de agua)
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.get(reverse('formulario:reporte_historial'), {'anio': 2024})
+        self.assertFalse(any('GROUP BY' in consulta['sql'] for consulta in consultas.captured_queries))
+        self.assertEqual(response.context['reporte']['por_tipo']['total'], 3)
+        self.assertIn(2024, response.context['anios'])
+
+        response = self.client.get(reverse('formulario:reporte_historial_exportar_excel'), {'anio': 2024})
+        libro = openpyxl.load_workbook(io.BytesIO(response.content))
+        self.assertEqual(libro.sheetnames, ['Emitidas por tipo', 'Emitidas por operador', 'Vencimientos por tipo'])
+        hoja = libro['Emitidas por operador']
+        self.assertEqual([celda.value for celda in hoja[hoja.max_row]][-1], 3)
+
+
+class ExportacionHistorialTest(TestCase):
+    """Tests de las exportaciones CSV y Parquet/Arrow del historial"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='testpass123', names='Administrador'
+        )
+        self.client.force_login(self.user)
+        tipo = TipoAutorizacion.objects.create(codigo='LIV', nombre='Liviano', creado_por=self.user)
+        for indice, dias in enumerate([30, -5]):
+            autorizacion = Autorizacion.objects.create(
+                usuario=UsuarioAutorizacion.objects.create(
+                    nombres=f'Usuario Ñandú {indice}', cedula=f'091234567{indice}', creado_por=self.user
+                ),
+                tipo_autorizacion=tipo,
+                placa=f'ABC123{indice}',
+                numero_autorizacion=f'ACT-EP-00{indice}-2024',
+                vigencia=timezone.localdate() + timedelta(days=dias),
+                creado_por=self.user
+            )
+            historial = HistorialAutorizacion.objects.create(autorizacion=autorizacion, creado_por=self.user)
+            # 22:30 local se guarda como 03:30 UTC del día siguiente
+            HistorialAutorizacion.objects.filter(pk=historial.pk).update(
+                fecha_creacion=timezone.make_aware(datetime(2024, 3, 14, 22, 30 + indice))
+            )
+        self.url = reverse('formulario:historial_autorizaciones_exportar')
+
+    def _csv(self, response):
+        return list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode('utf-8-sig'))))
+
+    def test_csv_en_streaming_con_filtros(self):
+        """Test que el CSV se envía en streaming y aplica los filtros de la lista"""
+        response = self.client.get(self.url, {'formato': 'csv', 'estado': 'vigentes'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn('.csv', response['Content-Disposition'])
+        filas = self._csv(response)
+        self.assertEqual(filas[0][:3], ['Fecha de Emisión', 'Hora', 'Fecha de Vigencia'])
+        self.assertEqual(filas[1:], [[
+            '2024-03-14', '22:30:00', (timezone.localdate() + timedelta(days=30)).isoformat(),
+            'Liviano', 'ABC1230', 'Usuario Ñandú 0', 'ACT-EP-000-2024', 'VIGENTE',
+        ]])
+
+    def test_csv_y_excel_comparten_proyeccion(self):
+        """Test que CSV y Excel exportan las mismas filas en hora local"""
+        filas = self._csv(self.client.get(self.url))
+        ws = openpyxl.load_workbook(io.BytesIO(
+            self.client.get(reverse('formulario:historial_autorizaciones_exportar_excel')).content
+        )).active
+        excel = [[celda.value for celda in fila] for fila in ws.iter_rows(min_row=8, max_row=9)]
+
+        self.assertEqual(len(filas), 3)
+        for fila_csv, fila_excel in zip(filas[1:], excel):
+            self.assertEqual(fila_csv[1], fila_excel[1])
+            self.assertEqual(fila_csv[3:], fila_excel[3:])
+        self.assertEqual([fila[7] for fila in excel], ['CADUCADA', 'VIGENTE'])
+        self.assertEqual(excel[0][0], '14/03/2024')
+
+    def test_formatos_columnares(self):
+        """Test de Parquet con pyarrow, del aviso sin pyarrow y de un formato desconocido"""
+        self.assertEqual(self.client.get(self.url, {'formato': 'pdf'}).status_code, 400)
+
+        with patch.object(exportacion, 'pa', None):
+            response = self.client.get(self.url, {'formato': 'parquet', 'placa': 'ABC'})
+        self.assertRedirects(response, reverse('formulario:historial_autorizaciones_list') + '?placa=ABC')
+
+        if exportacion.pa is None:
+            return
+        response = self.client.get(self.url, {'formato': 'parquet'})
+        tabla = exportacion.pq.read_table(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(tabla.column_names, [nombre for nombre, _ in exportacion.COLUMNAS])
+        self.assertEqual(tabla.column('estado').to_pylist(), ['CADUCADA', 'VIGENTE'])
+
+
+# ============================================================================
+# PRESUPUESTO DE CONSULTAS POR VISTA
+# ============================================================================
+
+# Máximo de consultas SQL por nombre de URL (método, consultas). Toda URL de
+# formulario y security debe figurar aquí: una vista nueva sin presupuesto hace
+# fallar test_todas_las_urls_tienen_presupuesto.
+PRESUPUESTO_CONSULTAS = {
+    'formulario:generar_qr': ('get', 5),
+    'formulario:descargar_qr': ('get', 8),
+    'formulario:generar_pdf': ('get', 8),
+    'formulario:verificar_qr': ('get', 7),
+    'formulario:paquete_offline': ('get', 4),
+    'formulario:verificacion_lote': ('post', 6),
+    'formulario:usuario_list': ('get', 7),
+    'formulario:usuario_detail': ('get', 7),
+    'formulario:usuario_create': ('get', 4),
+    'formulario:usuario_update': ('get', 5),
+    'formulario:usuario_delete': ('get', 6),
+    'formulario:autorizacion_list': ('get', 8),
+    'formulario:autorizacion_detail': ('get', 6),
+    'formulario:autorizacion_update': ('get', 7),
+    'formulario:autorizacion_delete': ('get', 7),
+    'formulario:mostrar_qr': ('get', 8),
+    'formulario:descargar_qr_autorizacion': ('get', 8),
+    'formulario:descargar_pdf_autorizacion': ('get', 10),
+    'formulario:historial_acciones_list': ('get', 11),
+    'formulario:vaciar_historial_acciones': ('post', 6),
+    'formulario:eliminar_historial_acciones_seleccionado': ('post', 5),
+    'formulario:historial_autorizaciones_list': ('get', 10),
+    'formulario:historial_autorizaciones_exportar_excel': ('get', 6),
+    'formulario:historial_autorizaciones_exportar': ('get', 5),
+    'formulario:reporte_historial': ('get', 7),
+    'formulario:reporte_historial_exportar_excel': ('get', 6),
+    'formulario:get_tipos_autorizacion': ('get', 5),
+    'formulario:metricas': ('get', 4),
+    'formulario:dashboard': ('get', 10),
+    'formulario:inicio': ('get', 10),
+    'security:login': ('get', 4),
+    'security:logout': ('post', 6),
+}
+
+
+class PresupuestoConsultasTest(TestCase):
+    """Tests de que cada vista respeta su presupuesto de consultas y no escala con las filas"""
+    
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_superuser(
+            username='admin',
+            email='admin@example.com',
+            password='testpass123',
+            names='Administrador'
+        )
+        self.tipos = [
+            TipoAutorizacion.objects.create(codigo=codigo, nombre=nombre, creado_por=self.user)
+            for codigo, nombre in (('TRAN', 'Transporte'), ('CARG', 'Carga'), ('TURI', 'Turismo'))
+        ]
+        self.usuario = UsuarioAutorizacion.objects.create(
+            nombres='Usuario Principal',
+            cedula='0900000000',
+            creado_por=self.user
+        )
+        self.filas = 0
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        paquetes = override_settings(
+            PAQUETE_OFFLINE_DIR=directorio.name,
+            PAQUETE_OFFLINE_CLAVE_PRIVADA=os.path.join(directorio.name, 'clave.pem'),
+        )
+        paquetes.enable()
+        self.addCleanup(paquetes.disable)
+        paquete_offline.crear_clave()
+    
+    def _poblar(self, cantidad):
+        """Completa hasta `cantidad` filas relacionadas: autorizaciones del usuario
+        principal, usuarios con autorización propia, historial y acciones"""
+        for i in range(self.filas, cantidad):
+            tipo = self.tipos[i % len(self.tipos)]
+            usuario = self.usuario if i == 0 else UsuarioAutorizacion.objects.create(
+                nombres=f'Usuario {i}',
+                cedula=f'09{i:08d}',
+                creado_por=self.user
+            )
+            for titular in {self.usuario, usuario}:
+                autorizacion = Autorizacion.objects.create(
+                    usuario=titular,
+                    tipo_autorizacion=tipo,
+                    placa=f'ABC{i:04d}' if titular == usuario else f'PRI{i:04d}',
+                    numero_autorizacion=f'ACT-EP-{i:04d}-{titular.pk}',
+                    vigencia=timezone.localdate() + timedelta(days=30),
+                    creado_por=self.user
+                )
+                HistorialAutorizacion.objects.create(autorizacion=autorizacion, creado_por=self.user)
+                HistorialAcciones.objects.create(
+                    autorizacion=autorizacion,
+                    creado_por=self.user,
+                    accion='GENERAR_QR',
+                    descripcion=f'QR generado para placa {autorizacion.placa}'
+                )
+        self.filas = cantidad
+        self.autorizacion = Autorizacion.objects.filter(usuario=self.usuario).order_by('pk').first()
+    
+    def _peticion(self, nombre):
+        """Arma (método, url, datos) para el nombre de URL con los objetos del dataset"""
+        metodo = PRESUPUESTO_CONSULTAS[nombre][0]
+        kwargs = {}
+        if nombre in ('formulario:usuario_detail', 'formulario:usuario_update', 'formulario:usuario_delete'):
+            kwargs['pk'] = self.usuario.pk
+        elif nombre.startswith('formulario:autorizacion_') and nombre != 'formulario:autorizacion_list':
+            kwargs['pk'] = self.autorizacion.pk
+        elif nombre in ('formulario:descargar_qr', 'formulario:generar_pdf', 'formulario:mostrar_qr',
+                        'formulario:descargar_qr_autorizacion', 'formulario:descargar_pdf_autorizacion'):
+            kwargs['autorizacion_id'] = self.autorizacion.pk
+        url = reverse(nombre, kwargs=kwargs)
+        
+        datos = {}
+        if nombre == 'formulario:verificar_qr':
+            url = construir_url_qr(self.autorizacion, url)
+        elif nombre == 'formulario:paquete_offline':
+            paquete_offline.generar()
+        elif nombre.startswith('formulario:reporte_historial'):
+            actualizar_resumen(completo=True)
+        elif nombre == 'formulario:verificacion_lote':
+            datos = {
+                'placas': list(Autorizacion.objects.values_list('placa', flat=True)),
+                'numeros': list(Autorizacion.objects.values_list('numero_autorizacion', flat=True)),
+            }
+        elif nombre == 'formulario:eliminar_historial_acciones_seleccionado':
+            datos = {'historial_ids[]': list(HistorialAcciones.objects.values_list('pk', flat=True))}
+        return metodo, url, datos
+    
+    def _asegurar_sesion(self):
+        """Inicia sesión si hace falta y la calienta para no contar su renovación"""
+        if '_auth_user_id' not in self.client.session:
+            self.client.force_login(self.user)
+            self.client.get(reverse('formulario:dashboard'))
+    
+    def _medir(self, nombre):
+        """Ejecuta la vista en una transacción revertida y devuelve las consultas capturadas"""
+        self._asegurar_sesion()
+        metodo, url, datos = self._peticion(nombre)
+        for alias in caches:
+            caches[alias].clear()
+        escaneos.buffer.descartar()
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as consultas:
+                response = getattr(self.client, metodo)(url, datos)
+                if response.streaming:
+                    b''.join(response.streaming_content)  # las lecturas del streaming también cuentan
+            transaction.set_rollback(True)
+        self.assertLess(response.status_code, 400, f'{nombre} respondió {response.status_code}')
+        return [consulta['sql'] for consulta in consultas.captured_queries]
+    
+    def _detalle(self, consultas):
+        return '\n'.join(f'  {i}. {sql}' for i, sql in enumerate(consultas, 1))
+    
+    def test_todas_las_urls_tienen_presupuesto(self):
+        """Test que cada URL de formulario y security declara su presupuesto"""
+        nombres = set()
+        for modulo in (formulario_urls, security_urls):
+            nombres.update(
+                f'{modulo.app_name}:{patron.name}' for patron in modulo.urlpatterns if patron.name
+            )
+        
+        self.assertEqual(nombres - set(PRESUPUESTO_CONSULTAS), set())
+        self.assertEqual(set(PRESUPUESTO_CONSULTAS) - nombres, set())
+    
+    def test_presupuesto_no_escala_con_filas(self):
+        """Test que con 1 y con 100 filas relacionadas cada vista respeta su presupuesto"""
+        mediciones = {}
+        for cantidad in (1, 100):
+            self._poblar(cantidad)
+            for nombre, (_, maximo) in PRESUPUESTO_CONSULTAS.items():
+                consultas = self._medir(nombre)
+                mediciones.setdefault(nombre, []).append(consultas)
+                with self.subTest(vista=nombre, filas=cantidad):
+                    self.assertLessEqual(
+                        len(consultas), maximo,
+                        f'{nombre} con {cantidad} filas hizo {len(consultas)} consultas '
+                        f'(presupuesto {maximo}):\n{self._detalle(consultas)}'
+                    )
+        
+        for nombre, (con_una, con_cien) in mediciones.items():
+            with self.subTest(vista=nombre):
+                self.assertEqual(
+                    len(con_una), len(con_cien),
+                    f'{nombre} pasó de {len(con_una)} a {len(con_cien)} consultas con 100 filas:\n'
+                    f'{self._detalle(con_cien)}'
+                )
+
+
+def tearDownModule():
+    # El buffer de escaneos es global del proceso: no dejar eventos de los
+    # tests para el atexit, que correría con la BD de tests ya destruida
+    escaneos.buffer.descartar()
+
+
 # ============================================================================
 # TEST RUNNER PERSONALIZADO (OPCIONAL)
 # ============================================================================
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path
 from apps.formulario.views import historial_acciones, home, usuario_autorizacion, autorizacion, qr_code, historial_autorizaciones
 
@@ -8,7 +9,9 @@ urlpatterns = [
     path('generar-qr/', qr_code.GenerarQRView.as_view(), name='generar_qr'),
     path('descargar-qr/<int:autorizacion_id>/', qr_code.DescargarQRView.as_view(), name='descargar_qr'),
     path('generar-pdf/<int:autorizacion_id>/', qr_code.GenerarPDFView.as_view(), name='generar_pdf'),
-    path('verificar-qr/', qr_code.VerificarQRView.as_view(), name='verificar_qr'),
+    path('verificar-qr/', (qr_code.VerificarQRAsyncView if settings.VERIFICACION_ASINCRONA else qr_code.VerificarQRView).as_view(), name='verificar_qr'),
+    path('offline/paquete/', qr_code.PaqueteOfflineView.as_view(), name='paquete_offline'),
+    path('api/verificacion-lote/', qr_code.VerificacionLoteView.as_view(), name='verificacion_lote'),
     
     # CRUD de Usuarios
     path('usuarios/', usuario_autorizacion.UsuarioAutorizacionListView.as_view(), name='usuario_list'),
@@ -41,9 +44,22 @@ urlpatterns = [
     path('historial-autorizaciones/exportar-excel/', 
          historial_autorizaciones.ExportarHistorialExcelView.as_view(), 
          name='historial_autorizaciones_exportar_excel'),
+
+    path('historial-autorizaciones/exportar/',
+         historial_autorizaciones.ExportarHistorialView.as_view(),
+         name='historial_autorizaciones_exportar'),
+
+    path('historial-autorizaciones/reporte/',
+         historial_autorizaciones.ReporteHistorialView.as_view(),
+         name='reporte_historial'),
+
+    path('historial-autorizaciones/reporte/exportar-excel/',
+         historial_autorizaciones.ExportarReporteHistorialExcelView.as_view(),
+         name='reporte_historial_exportar_excel'),
          
     # API y utilidades
     path('api/tipos-autorizacion/', home.GetTiposAutorizacionAPIView.as_view(), name='get_tipos_autorizacion'),
+    path('api/metricas/', home.MetricasAPIView.as_view(), name='metricas'),
     
     # Dashboard
     path('dashboard/', home.DashboardView.as_view(), name='dashboard'),
@@ -1,18 +1,25 @@
 import json
 from urllib.parse import urlencode
+from django.db import transaction
 from django.utils import timezone
 from django.urls import reverse
 from .models import UsuarioAutorizacion, Autorizacion
 
+# Caracteres del número de autorización que lleva el QR (la huella offline usa los mismos)
+LARGO_NUMERO_QR = 20
+
 def generar_url_qr(autorizacion, request):
     """Genera la URL para el código QR optimizada"""
     base_url = request.build_absolute_uri(reverse('formulario:verificar_qr'))
-    
+    return construir_url_qr(autorizacion, base_url)
+
+def construir_url_qr(autorizacion, base_url):
+    """Arma la URL del QR a partir de la URL absoluta de verificar_qr (sin request)"""
     # Datos comprimidos
     datos_comprimidos = {
         'p': autorizacion.placa,  # placa
         'n': autorizacion.usuario.nombres[:15],  # nombre (limitado)
-        'a': autorizacion.numero_autorizacion[:20],  # autorización (limitado)
+        'a': autorizacion.numero_autorizacion[:LARGO_NUMERO_QR],  # autorización (limitado)
         'c': autorizacion.vigencia.isoformat(),  # caducidad
         'ta': autorizacion.tipo_autorizacion.codigo[:3],  # tipo autorización (código corto)
         'ci': autorizacion.usuario.cedula,  # cédula
@@ -25,13 +32,14 @@ def generar_url_qr(autorizacion, request):
     
     return url_qr
 
-def validar_autorizacion_caducada(vigencia):
-    """Verifica si una autorización está caducada"""
-    hoy = timezone.now().date()
-    # La autorización caduca al día siguiente de la fecha de vigencia
-    fecha_caducidad = vigencia + timezone.timedelta(days=1)
-    return hoy >= fecha_caducidad
+def validar_autorizacion_caducada(vigencia, hoy=None):
+    """
+    Regla única de caducidad: la autorización vale hasta el final del día de
+    su vigencia en la zona horaria del sistema (TIME_ZONE), no en UTC.
+    """
+    return vigencia < (hoy or timezone.localdate())
 
+@transaction.atomic
 def crear_autorizacion_desde_form(form_data, usuario_creador):
     """Crea una nueva autorización a partir de los datos del formulario"""
     try:
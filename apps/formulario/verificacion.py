@@ -0,0 +1,306 @@
+import hashlib
+from datetime import datetime, time, timedelta
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.http import quote_etag
+from apps.formulario.limites import aregistrar, ip_cliente, registrar
+from apps.formulario.models import Autorizacion, TipoAutorizacion, UsuarioAutorizacion, normalizar_placa
+from apps.formulario.utils import validar_autorizacion_caducada
+
+# ============================================================================
+# VERIFICACIÓN DE QR (compartida por VerificarQRView y VerificarQRAsyncView)
+# ============================================================================
+
+# Resultados de la búsqueda en BD por placa y número (TIMEOUT del espacio 'verificacion')
+cache_verificacion = caches['verificacion']
+# Marca de "no existe" en cache_verificacion (VERIFICACION_CACHE_NEGATIVO segundos):
+# URLs falsas o mal leídas no vuelven a consultar la BD en cada escaneo
+NO_ENCONTRADA = 'no-encontrada'
+
+
+def parametros_qr(params):
+    """Datos que trae la URL del QR (nombres cortos o largos)"""
+    return {
+        'placa': params.get('p') or params.get('placa'),
+        'nombres': params.get('n') or params.get('nombre'),
+        'cedula': params.get('ci') or params.get('cedula'),
+        'ruc': params.get('r') or params.get('ruc'),
+        'numero_autorizacion': params.get('a') or params.get('autorizacion'),
+        'vigencia': params.get('c') or params.get('caducidad'),
+        'tipo_autorizacion': params.get('ta') or params.get('tipoAutorizacion'),
+    }
+
+
+def qr_completo(qr):
+    return all([qr['placa'], qr['nombres'], qr['numero_autorizacion'], qr['vigencia']])
+
+
+def clave_verificacion(placa, numero_autorizacion):
+    # Hash: la placa y el número vienen de la URL y pueden traer espacios
+    return 'verificar:' + hashlib.md5(f'{placa}|{numero_autorizacion}'.encode()).hexdigest()
+
+
+def consulta_verificacion(qr):
+    return Autorizacion.objects.filter(
+        placa=qr['placa'],
+        numero_autorizacion=qr['numero_autorizacion'],
+        activo=True
+    ).select_related('usuario', 'tipo_autorizacion')
+
+
+def datos_autorizacion(autorizacion):
+    """Lo que la verificación muestra de la autorización (es lo que se guarda en caché)"""
+    usuario = autorizacion.usuario
+    return {
+        'id': autorizacion.pk,
+        'tipo_autorizacion_id': autorizacion.tipo_autorizacion_id,
+        'placa': autorizacion.placa,
+        'numero_autorizacion': autorizacion.numero_autorizacion,
+        'tipo_autorizacion': autorizacion.get_tipo_autorizacion_display(),
+        'vigencia': autorizacion.vigencia,
+        # Lo más reciente entre autorización, tipo y usuario (Last-Modified)
+        'modificada': max(
+            objeto.fecha_actualizacion for objeto in (autorizacion, autorizacion.tipo_autorizacion, usuario) if objeto
+        ),
+        'usuario': {
+            'nombres': usuario.nombres,
+            'cedula': usuario.cedula,
+            'ruc': usuario.ruc,
+        } if usuario else None,
+    }
+
+
+def contexto_verificacion(qr, datos=None, error=None):
+    """
+    Contexto de verificar_qr.html: datos de la BD si se encontró la autorización
+    (datos_autorizacion) o, si no, los que trae el QR.
+    """
+    autorizacion_data = None
+    esta_caducada = False
+
+    if error is not None:
+        mensaje = f'❌ Error al verificar autorización: {error}'
+    elif not qr_completo(qr):
+        mensaje = '❌ Datos de autorización incompletos'
+    else:
+        if datos:
+            usuario = datos['usuario']
+            esta_caducada = validar_autorizacion_caducada(datos['vigencia'])
+            autorizacion_data = {
+                'placa': datos['placa'],
+                'nombres': usuario['nombres'] if usuario else qr['nombres'],
+                'cedula': usuario['cedula'] if usuario else qr['cedula'] or 'No disponible',
+                'ruc': usuario['ruc'] if usuario else qr['ruc'] or 'No disponible',
+                'numero_autorizacion': datos['numero_autorizacion'],
+                'tipo_autorizacion': datos['tipo_autorizacion'],
+                'vigencia': datos['vigencia'],
+                'esta_caducada': esta_caducada,
+            }
+        else:
+            # Si no se encuentra en BD, mostrar datos del QR
+            try:
+                vigencia = datetime.strptime(qr['vigencia'], '%Y-%m-%d').date()
+            except ValueError:
+                vigencia = None
+            if vigencia is not None:
+                esta_caducada = validar_autorizacion_caducada(vigencia)
+                autorizacion_data = {
+                    'placa': qr['placa'],
+                    'nombres': qr['nombres'],
+                    'cedula': qr['cedula'] or 'No disponible',
+                    'ruc': qr['ruc'] or 'No disponible',
+                    'numero_autorizacion': qr['numero_autorizacion'],
+                    'tipo_autorizacion': 'No disponible',
+                    'vigencia': vigencia,
+                    'esta_caducada': esta_caducada,
+                }
+
+        if autorizacion_data is None:
+            mensaje = '❌ Error: Formato de fecha inválido'
+        elif esta_caducada:
+            mensaje = '⚠️ AUTORIZACIÓN CADUCADA - Esta autorización ya no es válida'
+        else:
+            mensaje = f'✅ Autorización válida para placa: {qr["placa"]}'
+
+    return {
+        'autorizacion_data': autorizacion_data,
+        'mensaje': mensaje,
+        'esta_caducada': esta_caducada,
+        'current_date': timezone.now().strftime('%d/%m/%Y, %H:%M'),
+    }
+
+
+def validadores_verificacion(request, datos):
+    """
+    (ETag, Last-Modified) de la página de verificación. El resultado cambia con
+    los parámetros del QR, los datos en BD, el día (caducidad) y quién la ve
+    (base.html muestra al usuario autenticado).
+    """
+    ahora = timezone.localtime()
+    modificada = datos.get('modificada') if datos else None
+    partes = [request.get_full_path(), ahora.date().isoformat(), modificada.isoformat() if modificada else '-',
+              str(request.user.pk or '')]
+    etag = quote_etag(hashlib.md5('|'.join(partes).encode()).hexdigest())
+    if modificada is None:
+        return etag, None
+    # Al cambiar el día la página puede pasar a caducada aunque la BD no cambie
+    return etag, max(modificada, ahora.replace(hour=0, minute=0, second=0, microsecond=0))
+
+
+def segundos_hasta_manana():
+    """Segundos hasta la medianoche local, cuando cambia la regla de caducidad"""
+    ahora = timezone.localtime()
+    manana = timezone.make_aware(datetime.combine(ahora.date() + timedelta(days=1), time.min))
+    return int((manana - ahora).total_seconds())
+
+
+def buscar_autorizacion(qr):
+    """datos_autorizacion() de la autorización activa del QR, o None; usa la caché"""
+    clave = clave_verificacion(qr['placa'], qr['numero_autorizacion'])
+    datos = cache_verificacion.get(clave)
+    if datos is None:
+        autorizacion = consulta_verificacion(qr).first()
+        if autorizacion is None:
+            cache_verificacion.set(clave, NO_ENCONTRADA, timeout=settings.VERIFICACION_CACHE_NEGATIVO)
+            return None
+        datos = datos_autorizacion(autorizacion)
+        cache_verificacion.set(clave, datos)
+    return None if datos == NO_ENCONTRADA else datos
+
+
+async def abuscar_autorizacion(qr):
+    """Versión asíncrona de buscar_autorizacion (ORM y caché asíncronos)"""
+    clave = clave_verificacion(qr['placa'], qr['numero_autorizacion'])
+    datos = await cache_verificacion.aget(clave)
+    if datos is None:
+        autorizacion = await consulta_verificacion(qr).afirst()
+        if autorizacion is None:
+            await cache_verificacion.aset(clave, NO_ENCONTRADA, timeout=settings.VERIFICACION_CACHE_NEGATIVO)
+            return None
+        datos = datos_autorizacion(autorizacion)
+        await cache_verificacion.aset(clave, datos)
+    return None if datos == NO_ENCONTRADA else datos
+
+
+def _claves_limite(request, qr):
+    """(clave, límite) por IP del cliente y por QR (placa + número)"""
+    claves = [(f'verificar:ip:{ip_cliente(request)}', settings.VERIFICACION_LIMITE_IP)]
+    if qr_completo(qr):
+        claves.append((clave_verificacion(qr['placa'], qr['numero_autorizacion']), settings.VERIFICACION_LIMITE_QR))
+    return claves
+
+
+def limite_verificacion(request, qr):
+    """Segundos que el cliente debe esperar por exceder algún límite, o 0"""
+    return max(registrar(clave, limite, settings.VERIFICACION_LIMITE_VENTANA)
+               for clave, limite in _claves_limite(request, qr))
+
+
+async def alimite_verificacion(request, qr):
+    """Versión asíncrona de limite_verificacion"""
+    return max([await aregistrar(clave, limite, settings.VERIFICACION_LIMITE_VENTANA)
+                for clave, limite in _claves_limite(request, qr)])
+
+
+# ============================================================================
+# VERIFICACIÓN POR LOTE (VerificacionLoteView)
+# ============================================================================
+
+# Valores por consulta IN: acota el tamaño del SQL y permite enviar resultados
+# mientras se consulta el resto del lote
+VALORES_POR_CONSULTA = 1000
+
+
+def estado_autorizacion(activo, vigencia):
+    if not activo:
+        return 'inactiva'
+    return 'caducada' if validar_autorizacion_caducada(vigencia) else 'vigente'
+
+
+def verificar_lote(placas=(), numeros=()):
+    """
+    Produce un resultado por placa y por número pedidos (en el orden recibido,
+    sin repetidos), con las autorizaciones encontradas. Las placas se comparan
+    normalizadas (normalizar_placa) y los números sin espacios y en mayúsculas.
+    """
+    for campo, valores, normalizar in (
+        ('placa', placas, normalizar_placa),
+        ('numero_autorizacion', numeros, lambda numero: numero.strip().upper()),
+    ):
+        columna = 'placa_normalizada' if campo == 'placa' else campo
+        unicos = list(dict.fromkeys(normalizar(str(valor)) for valor in valores))
+        for inicio in range(0, len(unicos), VALORES_POR_CONSULTA):
+            lote = unicos[inicio:inicio + VALORES_POR_CONSULTA]
+            encontradas = {}
+            filas = Autorizacion.objects.filter(**{f'{columna}__in': lote}).order_by().values_list(
+                columna, 'placa', 'numero_autorizacion', 'activo', 'vigencia', 'tipo_autorizacion__nombre'
+            )
+            for clave, placa, numero, activo, vigencia, tipo in filas:
+                encontradas.setdefault(clave, []).append({
+                    'placa': placa,
+                    'numero_autorizacion': numero,
+                    'estado': estado_autorizacion(activo, vigencia),
+                    'vigencia': vigencia.isoformat(),
+                    'tipo_autorizacion': tipo,
+                })
+            for valor in lote:
+                autorizaciones = encontradas.get(valor, [])
+                yield {
+                    campo: valor,
+                    'vigente': any(a['estado'] == 'vigente' for a in autorizaciones),
+                    'autorizaciones': autorizaciones,
+                }
+
+
+# ============================================================================
+# INVALIDACIÓN
+# ============================================================================
+
+@receiver(pre_save, sender=Autorizacion, dispatch_uid='verificacion_autorizacion_anterior')
+def recordar_clave_anterior(sender, instance, **kwargs):
+    """
+    Placa y número previos para invalidar también la clave vieja si la edición
+    los cambia. Normalmente ya los dejó Autorizacion.from_db; solo se consultan
+    si la instancia no salió de la BD o se leyó sin esos campos.
+    """
+    if instance._state.adding or hasattr(instance, '_placa_numero_leidos'):
+        return
+    instance._placa_numero_leidos = Autorizacion.objects.filter(pk=instance.pk).values_list(
+        'placa', 'numero_autorizacion'
+    ).first()
+
+
+@receiver([post_save, post_delete], sender=Autorizacion, dispatch_uid='verificacion_autorizacion')
+def invalidar_autorizacion(sender, instance, **kwargs):
+    # La clave nueva también: puede tener guardado un NO_ENCONTRADA
+    claves = {clave_verificacion(instance.placa, instance.numero_autorizacion)}
+    anterior = getattr(instance, '_placa_numero_leidos', None)
+    if anterior:
+        claves.add(clave_verificacion(*anterior))
+    cache_verificacion.delete_many(list(claves))
+    # Lo guardado pasa a ser lo leído para el próximo save de esta instancia
+    instance._placa_numero_leidos = (instance.placa, instance.numero_autorizacion)
+
+
+@receiver(post_save, sender=UsuarioAutorizacion, dispatch_uid='verificacion_usuario')
+def invalidar_usuario(sender, instance, created, **kwargs):
+    if created:
+        return
+    cache_verificacion.delete_many([
+        clave_verificacion(placa, numero)
+        for placa, numero in instance.autorizaciones.values_list('placa', 'numero_autorizacion')
+    ])
+
+
+@receiver(post_save, sender=TipoAutorizacion, dispatch_uid='verificacion_tipo')
+def invalidar_tipo(sender, instance, created, **kwargs):
+    # El nombre del tipo forma parte del resultado guardado
+    if created:
+        return
+    cache_verificacion.delete_many([
+        clave_verificacion(placa, numero)
+        for placa, numero in instance.autorizaciones.values_list('placa', 'numero_autorizacion')
+    ])
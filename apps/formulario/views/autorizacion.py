@@ -4,6 +4,7 @@ from apps.formulario.models import Autorizacion, HistorialAcciones
 from apps.formulario.form import BusquedaAutorizacionForm, FiltroAutorizacionForm
 from django.urls import reverse_lazy
 from django.contrib import messages
+from django.db import transaction
 from django.utils import timezone
 import threading
 
@@ -82,7 +83,7 @@ class AutorizacionListView(LoginRequiredMixin, ListView):
             if estado == 'activas':
                 queryset = queryset.filter(activo=True)
             elif estado == 'caducadas':
-                queryset = queryset.filter(vigencia__lt=timezone.now().date())
+                queryset = queryset.filter(caducada=True)
             elif estado == 'inactivas':
                 queryset = queryset.filter(activo=False)
             
@@ -129,6 +130,7 @@ class AutorizacionUpdateView(LoginRequiredMixin, PermissionRequiredMixin, Update
     def get_success_url(self):
         return reverse_lazy('formulario:autorizacion_detail', kwargs={'pk': self.object.pk})
     
+    @transaction.atomic
     def form_valid(self, form):
         # Registrar cambio en historial
         cambios = []
@@ -161,6 +163,11 @@ class AutorizacionDeleteView(LoginRequiredMixin, PermissionRequiredMixin, Delete
         context['current_date'] = timezone.now().strftime('%d/%m/%Y, %H:%M')
         return context
     
+    @transaction.atomic
+    def form_valid(self, form):
+        return super().form_valid(form)
+    
+    @transaction.atomic
     def delete(self, request, *args, **kwargs):
         autorizacion = self.get_object()
         auth_key = ("autorizacion", autorizacion.pk)
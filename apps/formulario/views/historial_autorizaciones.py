@@ -1,99 +1,161 @@
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.views.generic import ListView
+from django.views.generic import ListView, TemplateView
 from django.views import View
-from django.http import HttpResponse
-from apps.formulario.models import HistorialAutorizacion, TipoAutorizacion
+from django.http import FileResponse, HttpResponse, HttpResponseBadRequest, StreamingHttpResponse
+from django.contrib import messages
+from django.shortcuts import redirect
+from django.urls import reverse
+from apps.formulario import exportacion
+from apps.formulario.models import Autorizacion, HistorialAutorizacion, ResumenHistorialDiario, TipoAutorizacion
+from apps.formulario.resumen_historial import reporte_anual_en_cache
+from apps.formulario.utils import validar_autorizacion_caducada
 from django.utils import timezone
-from django.db.models import Q
+from django.db import router
+from django.db.models import Prefetch, prefetch_related_objects
 from django.conf import settings
 from datetime import datetime
 from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 from openpyxl.drawing.image import Image
 import openpyxl
 import os
+import tempfile
 
 # ============================================================================
 # HISTORIAL DE AUTORIZACIONES
 # ============================================================================
 
+def campos_historial():
+    """Campos a filtrar según el modo: columnas snapshot o relaciones de la autorización"""
+    if settings.FORMULARIO_HISTORIAL_SNAPSHOT:
+        return {
+            'placa': 'snapshot_placa',
+            'usuario': 'snapshot_nombres',
+            'vigencia': 'snapshot_vigencia',
+            'tipo': 'snapshot_tipo',
+            'numero': 'snapshot_numero',
+        }
+    return {
+        'placa': 'autorizacion__placa',
+        'usuario': 'autorizacion__usuario__nombres',
+        'vigencia': 'autorizacion__vigencia',
+        'tipo': 'autorizacion__tipo_autorizacion__nombre',
+        'numero': 'autorizacion__numero_autorizacion',
+    }
+
+def historial_base():
+    """Queryset base del reporte: en modo snapshot lee solo la tabla de historial"""
+    if settings.FORMULARIO_HISTORIAL_SNAPSHOT:
+        return HistorialAutorizacion.objects.select_related(None).select_related('creado_por')
+    return HistorialAutorizacion.objects.all()
+
+def filtrar_historial(queryset, params):
+    """Aplica los filtros del reporte (compartidos por la lista y la exportación)"""
+    campos = campos_historial()
+    
+    # Filtro por RANGO de fecha de creación (emisión)
+    fecha_creacion_desde = params.get('fecha_creacion_desde')
+    fecha_creacion_hasta = params.get('fecha_creacion_hasta')
+    
+    if fecha_creacion_desde:
+        try:
+            fecha_desde_obj = datetime.strptime(fecha_creacion_desde, '%Y-%m-%d').date()
+            queryset = queryset.filter(fecha_creacion__date__gte=fecha_desde_obj)
+        except ValueError:
+            pass
+    
+    if fecha_creacion_hasta:
+        try:
+            fecha_hasta_obj = datetime.strptime(fecha_creacion_hasta, '%Y-%m-%d').date()
+            queryset = queryset.filter(fecha_creacion__date__lte=fecha_hasta_obj)
+        except ValueError:
+            pass
+    
+    # Filtro por RANGO de fecha de vigencia (caducidad)
+    fecha_vigencia_desde = params.get('fecha_vigencia_desde')
+    fecha_vigencia_hasta = params.get('fecha_vigencia_hasta')
+    
+    if fecha_vigencia_desde:
+        try:
+            fecha_vigencia_desde_obj = datetime.strptime(fecha_vigencia_desde, '%Y-%m-%d').date()
+            queryset = queryset.filter(**{f"{campos['vigencia']}__gte": fecha_vigencia_desde_obj})
+        except ValueError:
+            pass
+    
+    if fecha_vigencia_hasta:
+        try:
+            fecha_vigencia_hasta_obj = datetime.strptime(fecha_vigencia_hasta, '%Y-%m-%d').date()
+            queryset = queryset.filter(**{f"{campos['vigencia']}__lte": fecha_vigencia_hasta_obj})
+        except ValueError:
+            pass
+    
+    # Filtro por tipo de autorización (el snapshot guarda el nombre del tipo)
+    tipo_autorizacion = params.get('tipo_autorizacion')
+    if tipo_autorizacion:
+        if settings.FORMULARIO_HISTORIAL_SNAPSHOT:
+            queryset = queryset.filter(
+                snapshot_tipo__in=TipoAutorizacion.objects.filter(pk=tipo_autorizacion).values('nombre')
+            )
+        else:
+            queryset = queryset.filter(autorizacion__tipo_autorizacion_id=tipo_autorizacion)
+    
+    # Filtro por placa
+    placa = params.get('placa')
+    if placa:
+        queryset = queryset.filter(**{f"{campos['placa']}__icontains": placa})
+    
+    # Filtro por usuario
+    usuario = params.get('usuario')
+    if usuario:
+        queryset = queryset.filter(**{f"{campos['usuario']}__icontains": usuario})
+    
+    # Filtro por estado
+    estado = params.get('estado')
+    if estado == 'vigentes':
+        queryset = queryset.filter(**{f"{campos['vigencia']}__gte": timezone.localdate()})
+    elif estado == 'caducadas':
+        queryset = queryset.filter(**{f"{campos['vigencia']}__lt": timezone.localdate()})
+    
+    return queryset
+
+def proyectar_historial(queryset, tamano_lote=2000):
+    """
+    Filas de las exportaciones, en el orden de exportacion.COLUMNAS: fecha de
+    emisión en hora local, vigencia, tipo, placa, usuario, número y estado.
+    Lee tuplas por lotes (sin instanciar modelos) y la comparten Excel, CSV y
+    Parquet/Arrow.
+    """
+    campos = campos_historial()
+    hoy = timezone.localdate()
+    zona = timezone.get_current_timezone()
+    filas = queryset.values_list(
+        'fecha_creacion', campos['vigencia'], campos['tipo'], campos['placa'], campos['usuario'], campos['numero']
+    ).iterator(chunk_size=tamano_lote)
+    for fecha, vigencia, tipo, placa, usuario, numero in filas:
+        estado = 'CADUCADA' if validar_autorizacion_caducada(vigencia, hoy) else 'VIGENTE'
+        yield fecha.astimezone(zona), vigencia, tipo, placa, usuario, numero, estado
+
 class HistorialAutorizacionListView(LoginRequiredMixin, ListView):
     """Lista de historial de autorizaciones con filtros para reportes"""
     model = HistorialAutorizacion
     template_name = 'formulario/historial_autorizaciones_list.html'
     context_object_name = 'historial_autorizaciones'
     paginate_by = 50
+    usar_replica = True  # solo lectura (ver routers.ReplicaRouter)
     
     def get_queryset(self):
-        queryset = HistorialAutorizacion.objects.select_related(
-            'autorizacion',
-            'autorizacion__usuario',
-            'autorizacion__tipo_autorizacion',
-            'creado_por'
-        )
-        
-        # Filtro por RANGO de fecha de creación (emisión)
-        fecha_creacion_desde = self.request.GET.get('fecha_creacion_desde')
-        fecha_creacion_hasta = self.request.GET.get('fecha_creacion_hasta')
-        
-        if fecha_creacion_desde:
-            try:
-                fecha_desde_obj = datetime.strptime(fecha_creacion_desde, '%Y-%m-%d').date()
-                queryset = queryset.filter(fecha_creacion__date__gte=fecha_desde_obj)
-            except ValueError:
-                pass
-        
-        if fecha_creacion_hasta:
-            try:
-                fecha_hasta_obj = datetime.strptime(fecha_creacion_hasta, '%Y-%m-%d').date()
-                queryset = queryset.filter(fecha_creacion__date__lte=fecha_hasta_obj)
-            except ValueError:
-                pass
-        
-        # Filtro por RANGO de fecha de vigencia (caducidad)
-        fecha_vigencia_desde = self.request.GET.get('fecha_vigencia_desde')
-        fecha_vigencia_hasta = self.request.GET.get('fecha_vigencia_hasta')
-        
-        if fecha_vigencia_desde:
-            try:
-                fecha_vigencia_desde_obj = datetime.strptime(fecha_vigencia_desde, '%Y-%m-%d').date()
-                queryset = queryset.filter(autorizacion__vigencia__gte=fecha_vigencia_desde_obj)
-            except ValueError:
-                pass
-        
-        if fecha_vigencia_hasta:
-            try:
-                fecha_vigencia_hasta_obj = datetime.strptime(fecha_vigencia_hasta, '%Y-%m-%d').date()
-                queryset = queryset.filter(autorizacion__vigencia__lte=fecha_vigencia_hasta_obj)
-            except ValueError:
-                pass
-        
-        # Filtro por tipo de autorización
-        tipo_autorizacion = self.request.GET.get('tipo_autorizacion')
-        if tipo_autorizacion:
-            queryset = queryset.filter(autorizacion__tipo_autorizacion_id=tipo_autorizacion)
-        
-        # Filtro por placa
-        placa = self.request.GET.get('placa')
-        if placa:
-            queryset = queryset.filter(autorizacion__placa__icontains=placa)
-        
-        # Filtro por usuario
-        usuario = self.request.GET.get('usuario')
-        if usuario:
-            queryset = queryset.filter(autorizacion__usuario__nombres__icontains=usuario)
-        
-        # Filtro por estado
-        estado = self.request.GET.get('estado')
-        if estado == 'vigentes':
-            queryset = queryset.filter(autorizacion__vigencia__gte=timezone.now().date())
-        elif estado == 'caducadas':
-            queryset = queryset.filter(autorizacion__vigencia__lt=timezone.now().date())
-        
-        return queryset.order_by('-fecha_creacion')
+        return filtrar_historial(historial_base(), self.request.GET).order_by('-fecha_creacion')
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
+        if settings.FORMULARIO_HISTORIAL_SNAPSHOT:
+            # Registros de la página aún sin snapshot (ver rellenar_snapshot_historial):
+            # sus autorizaciones en una sola consulta en lugar de tres por fila
+            prefetch_related_objects(
+                [historial for historial in context['object_list'] if not historial.tiene_snapshot],
+                Prefetch('autorizacion', queryset=Autorizacion.objects.select_related('usuario', 'tipo_autorizacion'))
+            )
+        
         # Tipos de autorización para el filtro
         context['tipos_autorizacion'] = TipoAutorizacion.objects.filter(activo=True)
         
@@ -102,11 +164,12 @@ class HistorialAutorizacionListView(LoginRequiredMixin, ListView):
         
         # Estadísticas
         queryset = self.get_queryset()
+        campo_vigencia = campos_historial()['vigencia']
         context['total_vigentes'] = queryset.filter(
-            autorizacion__vigencia__gte=timezone.now().date()
+            **{f'{campo_vigencia}__gte': timezone.localdate()}
         ).count()
         context['total_caducadas'] = queryset.filter(
-            autorizacion__vigencia__lt=timezone.now().date()
+            **{f'{campo_vigencia}__lt': timezone.localdate()}
         ).count()
         
         # Preservar valores de filtros en el contexto
@@ -121,80 +184,24 @@ class HistorialAutorizacionListView(LoginRequiredMixin, ListView):
             'estado': self.request.GET.get('estado', ''),
         }
         
+        context['exportacion_columnar'] = exportacion.pa is not None
         context['current_date'] = timezone.now().strftime('%d/%m/%Y, %H:%M')
         return context
 
 
 class ExportarHistorialExcelView(LoginRequiredMixin, View):
     """Exportar historial de autorizaciones a Excel"""
+    usar_replica = True
     
     def get(self, request, *args, **kwargs):
         # Obtener el queryset con los mismos filtros de la lista
-        queryset = HistorialAutorizacion.objects.select_related(
-            'autorizacion',
-            'autorizacion__usuario',
-            'autorizacion__tipo_autorizacion',
-            'creado_por'
-        )
+        queryset = filtrar_historial(historial_base(), request.GET).order_by('-fecha_creacion')
         
-        # Aplicar filtros (igual que en ListView) - ACTUALIZADO CON RANGOS
-        
-        # Filtro por RANGO de fecha de creación (emisión)
         fecha_creacion_desde = request.GET.get('fecha_creacion_desde')
         fecha_creacion_hasta = request.GET.get('fecha_creacion_hasta')
-        
-        if fecha_creacion_desde:
-            try:
-                fecha_desde_obj = datetime.strptime(fecha_creacion_desde, '%Y-%m-%d').date()
-                queryset = queryset.filter(fecha_creacion__date__gte=fecha_desde_obj)
-            except ValueError:
-                pass
-        
-        if fecha_creacion_hasta:
-            try:
-                fecha_hasta_obj = datetime.strptime(fecha_creacion_hasta, '%Y-%m-%d').date()
-                queryset = queryset.filter(fecha_creacion__date__lte=fecha_hasta_obj)
-            except ValueError:
-                pass
-        
-        # Filtro por RANGO de fecha de vigencia (caducidad)
         fecha_vigencia_desde = request.GET.get('fecha_vigencia_desde')
         fecha_vigencia_hasta = request.GET.get('fecha_vigencia_hasta')
         
-        if fecha_vigencia_desde:
-            try:
-                fecha_vigencia_desde_obj = datetime.strptime(fecha_vigencia_desde, '%Y-%m-%d').date()
-                queryset = queryset.filter(autorizacion__vigencia__gte=fecha_vigencia_desde_obj)
-            except ValueError:
-                pass
-        
-        if fecha_vigencia_hasta:
-            try:
-                fecha_vigencia_hasta_obj = datetime.strptime(fecha_vigencia_hasta, '%Y-%m-%d').date()
-                queryset = queryset.filter(autorizacion__vigencia__lte=fecha_vigencia_hasta_obj)
-            except ValueError:
-                pass
-        
-        tipo_autorizacion = request.GET.get('tipo_autorizacion')
-        if tipo_autorizacion:
-            queryset = queryset.filter(autorizacion__tipo_autorizacion_id=tipo_autorizacion)
-        
-        placa = request.GET.get('placa')
-        if placa:
-            queryset = queryset.filter(autorizacion__placa__icontains=placa)
-        
-        usuario = request.GET.get('usuario')
-        if usuario:
-            queryset = queryset.filter(autorizacion__usuario__nombres__icontains=usuario)
-        
-        estado = request.GET.get('estado')
-        if estado == 'vigentes':
-            queryset = queryset.filter(autorizacion__vigencia__gte=timezone.now().date())
-        elif estado == 'caducadas':
-            queryset = queryset.filter(autorizacion__vigencia__lt=timezone.now().date())
-        
-        queryset = queryset.order_by('-fecha_creacion')
-        
         # Crear workbook
         wb = openpyxl.Workbook()
         ws = wb.active
@@ -317,21 +324,20 @@ class ExportarHistorialExcelView(LoginRequiredMixin, View):
         
         # Datos (ahora empiezan en la fila 8)
         row_num = 8
-        for historial in queryset:
-            ws.cell(row=row_num, column=1, value=historial.fecha_creacion.strftime('%d/%m/%Y'))
-            ws.cell(row=row_num, column=2, value=historial.fecha_creacion.strftime('%H:%M:%S'))
-            ws.cell(row=row_num, column=3, value=historial.autorizacion.vigencia.strftime('%d/%m/%Y'))
-            ws.cell(row=row_num, column=4, value=historial.autorizacion.tipo_autorizacion.nombre)
-            ws.cell(row=row_num, column=5, value=historial.autorizacion.placa)
-            ws.cell(row=row_num, column=6, value=historial.autorizacion.usuario.nombres)
-            ws.cell(row=row_num, column=7, value=historial.autorizacion.numero_autorizacion)
+        for fecha, vigencia, tipo, placa, usuario, numero, estado in proyectar_historial(queryset):
+            ws.cell(row=row_num, column=1, value=fecha.strftime('%d/%m/%Y'))
+            ws.cell(row=row_num, column=2, value=fecha.strftime('%H:%M:%S'))
+            ws.cell(row=row_num, column=3, value=vigencia.strftime('%d/%m/%Y'))
+            ws.cell(row=row_num, column=4, value=tipo)
+            ws.cell(row=row_num, column=5, value=placa)
+            ws.cell(row=row_num, column=6, value=usuario)
+            ws.cell(row=row_num, column=7, value=numero)
             
             # Estado
-            estado_valor = 'VIGENTE' if not historial.autorizacion.esta_caducada else 'CADUCADA'
-            cell_estado = ws.cell(row=row_num, column=8, value=estado_valor)
+            cell_estado = ws.cell(row=row_num, column=8, value=estado)
             
             # Colorear según estado
-            if historial.autorizacion.esta_caducada:
+            if estado == 'CADUCADA':
                 cell_estado.font = Font(color="FF0000", bold=True)
             else:
                 cell_estado.font = Font(color="008000", bold=True)
@@ -375,4 +381,132 @@ class ExportarHistorialExcelView(LoginRequiredMixin, View):
         response['Content-Disposition'] = f'attachment; filename="{filename}"'
         
         wb.save(response)
-        return response
\ No newline at end of file
+        return response
+
+
+class ExportarHistorialView(ExportarHistorialExcelView):
+    """
+    Exportar historial en el formato de ?formato=: csv (por defecto, en
+    streaming), parquet, arrow o xlsx. Mismos filtros y columnas que el Excel.
+    """
+
+    def get(self, request, *args, **kwargs):
+        formato = request.GET.get('formato', 'csv')
+        if formato == 'xlsx':
+            return super().get(request, *args, **kwargs)
+        if formato != 'csv' and formato not in exportacion.FORMATOS_COLUMNARES:
+            return HttpResponseBadRequest(f'Formato no soportado: {formato}')
+        
+        # La base se fija aquí: el CSV se lee después de que ReplicaMiddleware
+        # terminó el request y su router ya no elegiría la réplica
+        queryset = filtrar_historial(historial_base(), request.GET).order_by('-fecha_creacion')
+        queryset = queryset.using(router.db_for_read(HistorialAutorizacion))
+        nombre = f'Historial_Autorizaciones_{timezone.localtime(timezone.now()).strftime("%Y%m%d_%H%M%S")}'
+        
+        if formato == 'csv':
+            response = StreamingHttpResponse(
+                exportacion.csv_por_partes(proyectar_historial(queryset)),
+                content_type='text/csv; charset=utf-8'
+            )
+            response['Content-Disposition'] = f'attachment; filename="{nombre}.csv"'
+            return response
+        
+        if exportacion.pa is None:
+            messages.error(request, 'La exportación Parquet/Arrow requiere pyarrow (pip install pyarrow).')
+            filtros = request.GET.copy()
+            filtros.pop('formato')
+            return redirect(f"{reverse('formulario:historial_autorizaciones_list')}?{filtros.urlencode()}")
+        
+        # Parquet y Arrow escriben el pie al final: se arma en un archivo
+        # temporal por lotes y se envía desde el disco
+        extension, content_type = exportacion.FORMATOS_COLUMNARES[formato]
+        archivo = tempfile.TemporaryFile()
+        exportacion.escribir_columnar(proyectar_historial(queryset), formato, archivo)
+        archivo.seek(0)
+        return FileResponse(archivo, as_attachment=True, filename=f'{nombre}.{extension}', content_type=content_type)
+
+
+# ============================================================================
+# REPORTE ANUAL (lee solo ResumenHistorialDiario, ver resumir_historial)
+# ============================================================================
+
+def anio_reporte(request):
+    try:
+        return int(request.GET.get('anio', ''))
+    except ValueError:
+        return timezone.localdate().year
+
+
+class ReporteHistorialView(LoginRequiredMixin, TemplateView):
+    """Emitidas por mes, tipo y operador, y vencimientos por mes"""
+    template_name = 'formulario/reporte_historial.html'
+    usar_replica = True
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        anio = anio_reporte(self.request)
+        context['reporte'] = reporte_anual_en_cache(anio)
+        anios = {fecha.year for fecha in ResumenHistorialDiario.objects.dates('fecha', 'year')}
+        context['anios'] = sorted(anios | {anio, timezone.localdate().year}, reverse=True)
+        context['current_date'] = timezone.now().strftime('%d/%m/%Y, %H:%M')
+        return context
+
+
+class ExportarReporteHistorialExcelView(LoginRequiredMixin, View):
+    """Exportar el reporte anual a Excel (una hoja por tabla)"""
+    usar_replica = True
+
+    def get(self, request, *args, **kwargs):
+        reporte = reporte_anual_en_cache(anio_reporte(request))
+
+        header_font = Font(bold=True, color="FFFFFF", size=11)
+        header_fill = PatternFill(start_color="004d99", end_color="004d99", fill_type="solid")
+        total_font = Font(bold=True)
+        border_thin = Border(
+            left=Side(style='thin'),
+            right=Side(style='thin'),
+            top=Side(style='thin'),
+            bottom=Side(style='thin')
+        )
+
+        wb = openpyxl.Workbook()
+        wb.remove(wb.active)
+        hojas = [
+            ('Emitidas por tipo', 'Tipo de Autorización', reporte['por_tipo']),
+            ('Emitidas por operador', 'Generado por', reporte['por_operador']),
+            ('Vencimientos por tipo', 'Tipo de Autorización', reporte['vencimientos']),
+        ]
+        for titulo, columna, tabla in hojas:
+            ws = wb.create_sheet(titulo)
+            ws['A1'] = f'{titulo.upper()} - {reporte["anio"]}'
+            ws['A1'].font = Font(bold=True, size=14, color="004d99")
+            ws['A2'] = f'Generado el: {timezone.localtime(timezone.now()).strftime("%d/%m/%Y %H:%M:%S")}'
+            ws['A2'].font = Font(size=10, color="666666")
+
+            encabezados = [columna, *reporte['meses'], 'Total']
+            for col_num, encabezado in enumerate(encabezados, 1):
+                cell = ws.cell(row=4, column=col_num, value=encabezado)
+                cell.font = header_font
+                cell.fill = header_fill
+                cell.alignment = Alignment(horizontal="center", vertical="center")
+                cell.border = border_thin
+
+            filas = [[fila['nombre'], *fila['meses'], fila['total']] for fila in tabla['filas']]
+            filas.append(['Total', *tabla['totales'], tabla['total']])
+            for row_num, valores in enumerate(filas, 5):
+                for col_num, valor in enumerate(valores, 1):
+                    cell = ws.cell(row=row_num, column=col_num, value=valor)
+                    cell.border = border_thin
+            for col_num in range(1, len(encabezados) + 1):
+                ws.cell(row=4 + len(filas), column=col_num).font = total_font
+
+            ws.column_dimensions['A'].width = 32
+            for col_num in range(2, len(encabezados) + 1):
+                ws.column_dimensions[openpyxl.utils.get_column_letter(col_num)].width = 9
+
+        response = HttpResponse(
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
+        response['Content-Disposition'] = f'attachment; filename="Reporte_Autorizaciones_{reporte["anio"]}.xlsx"'
+        wb.save(response)
+        return response
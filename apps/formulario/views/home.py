@@ -1,10 +1,14 @@
-from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.views.generic import TemplateView
 from django.views import View
-from apps.formulario.models import UsuarioAutorizacion, Autorizacion, TipoAutorizacion, HistorialAcciones
+from apps.formulario.models import (
+    UsuarioAutorizacion, Autorizacion, TipoAutorizacion, HistorialAcciones, ResumenEscaneoDiario
+)
 from django.utils import timezone
-from django.db.models import Count
+from datetime import timedelta
+from django.db.models import Count, Q, Sum
 from django.http import JsonResponse
+from apps.formulario.middleware import metricas
 
 # ============================================================================
 # DASHBOARD Y APIS
@@ -20,9 +24,7 @@ class DashboardView(LoginRequiredMixin, TemplateView):
         # Estadísticas básicas
         context['total_autorizaciones'] = Autorizacion.objects.count()
         context['autorizaciones_activas'] = Autorizacion.objects.filter(activo=True).count()
-        context['autorizaciones_caducadas'] = Autorizacion.objects.filter(
-            vigencia__lt=timezone.now().date()
-        ).count()
+        context['autorizaciones_caducadas'] = Autorizacion.objects.filter(caducada=True).count()
         context['total_usuarios'] = UsuarioAutorizacion.objects.count()
         
         # Autorizaciones por tipo
@@ -44,6 +46,22 @@ class DashboardView(LoginRequiredMixin, TemplateView):
             'creado_por', 'autorizacion'
         ).order_by('-fecha_accion')[:10]
         
+        # Escaneos de QR de los últimos 7 días (resúmenes de resumir_escaneos)
+        resumenes = ResumenEscaneoDiario.objects.filter(
+            fecha__gte=timezone.localdate() - timedelta(days=7)
+        ).order_by()
+        context['escaneos_por_tipo'] = resumenes.values('tipo_autorizacion__nombre').annotate(
+            total=Sum('escaneos'),
+            vigentes=Sum('escaneos', filter=Q(resultado='vigente')),
+            caducadas=Sum('escaneos', filter=Q(resultado='caducada')),
+            no_encontradas=Sum('escaneos', filter=Q(resultado='no_encontrada')),
+        ).order_by('-total')
+        context['autorizaciones_mas_escaneadas'] = resumenes.filter(
+            autorizacion__isnull=False
+        ).values(
+            'autorizacion_id', 'autorizacion__placa', 'autorizacion__numero_autorizacion'
+        ).annotate(total=Sum('escaneos')).order_by('-total')[:5]
+        
         context['current_date'] = timezone.now().strftime('%d/%m/%Y, %H:%M')
         return context
 
@@ -52,4 +70,13 @@ class GetTiposAutorizacionAPIView(LoginRequiredMixin, View):
     
     def get(self, request):
         tipos = TipoAutorizacion.objects.filter(activo=True).values('id', 'codigo', 'nombre')
-        return JsonResponse(list(tipos), safe=False)
\ No newline at end of file
+        return JsonResponse(list(tipos), safe=False)
+
+class MetricasAPIView(LoginRequiredMixin, UserPassesTestMixin, View):
+    """API con percentiles recientes por URL del namespace formulario (solo staff, por proceso)"""
+    
+    def test_func(self):
+        return self.request.user.is_staff
+    
+    def get(self, request):
+        return JsonResponse(metricas.resumen())
@@ -1,11 +1,24 @@
+import json
+import os
 from django.contrib.auth.mixins import LoginRequiredMixin
+from apps.formulario import paquete_offline
+from apps.formulario.escaneos import registrar_escaneo
 from apps.formulario.utils import generar_url_qr, validar_autorizacion_caducada, crear_autorizacion_desde_form
+from apps.formulario.verificacion import (
+    abuscar_autorizacion, alimite_verificacion, buscar_autorizacion, contexto_verificacion, limite_verificacion,
+    parametros_qr, qr_completo, segundos_hasta_manana, validadores_verificacion, verificar_lote
+)
 from django.views import View
 from apps.formulario.form import FormularioCompletoQRForm
 from django.shortcuts import render, redirect, get_object_or_404
 from apps.formulario.models import Autorizacion, HistorialAcciones, HistorialAutorizacion
 from django.contrib import messages
+from django.db import transaction
 from django.utils import timezone
+from django.utils.cache import add_never_cache_headers, get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 
 # ============================================================================
 # VISTAS PARA GENERACIÓN DE QR
@@ -26,37 +39,34 @@ class GenerarQRView(LoginRequiredMixin, View):
         
         if form.is_valid():
             try:
-                # Crear la autorización
-                autorizacion, usuario_creado = crear_autorizacion_desde_form(
-                    form.cleaned_data, 
-                    request.user
-                )
-
-                # Asegurar que creado_por esté asignado
-                if not getattr(autorizacion, 'creado_por', None):
-                    autorizacion.creado_por = request.user
-                autorizacion.save()
-                autorizacion.refresh_from_db()
-
-                # Generar URL para QR
-                qr_url = generar_url_qr(autorizacion, request)
-
-                # Actualizar autorización con QR
-                autorizacion.codigo_qr = qr_url
-                autorizacion.qr_generado = True
-                autorizacion.save()
-
-                # Registrar en HistorialAutorizacion
-                try:
+                # Usuario, autorización, QR e historial se guardan todos o ninguno
+                with transaction.atomic():
+                    # Crear la autorización
+                    autorizacion, usuario_creado = crear_autorizacion_desde_form(
+                        form.cleaned_data, 
+                        request.user
+                    )
+
+                    # Asegurar que creado_por esté asignado
+                    if not getattr(autorizacion, 'creado_por', None):
+                        autorizacion.creado_por = request.user
+                    autorizacion.save()
+                    autorizacion.refresh_from_db()
+
+                    # Generar URL para QR
+                    qr_url = generar_url_qr(autorizacion, request)
+
+                    # Actualizar autorización con QR
+                    autorizacion.codigo_qr = qr_url
+                    autorizacion.qr_generado = True
+                    autorizacion.save()
+
+                    # Registrar en HistorialAutorizacion
                     HistorialAutorizacion.objects.create(
                         autorizacion=autorizacion,
                         creado_por=request.user
                     )
-                except Exception as e:
-                    print(f'Error al registrar en historial: {e}')
 
-                # Crear registros en historial (QR y PDF)
-                try:
                     # Registrar generación de QR
                     HistorialAcciones.objects.create(
                         autorizacion=autorizacion,
@@ -72,9 +82,6 @@ class GenerarQRView(LoginRequiredMixin, View):
                         accion='GENERAR_PDF',
                         descripcion=f'PDF de autorización preparado para placa {autorizacion.placa}'
                     )
-                except Exception as e:
-                    print(f'Error al registrar en historial: {e}')
-                    pass
                 
                 # Pasar datos a la plantilla
                 context.update({
@@ -120,20 +127,16 @@ class DescargarQRView(LoginRequiredMixin, View):
             messages.error(request, 'No se puede descargar QR: autorización caducada')
             return redirect('formulario:generar_qr')
         
-        # Registrar descarga en historial (no bloquear si falla)
-        try:
+        # Historial y fecha de descarga se guardan juntos o ninguno
+        with transaction.atomic():
             HistorialAcciones.objects.create(
                 autorizacion=autorizacion,
                 creado_por=request.user,
                 accion='DESCARGAR_QR',
                 descripcion=f'QR descargado para placa {autorizacion.placa}'
             )
-        except Exception:
-            pass
-        
-        # Actualizar fecha de descarga
-        autorizacion.fecha_descarga_qr = timezone.now()
-        autorizacion.save()
+            autorizacion.fecha_descarga_qr = timezone.now()
+            autorizacion.save()
         
         messages.success(request, 'QR listo para descargar')
         # Ideal: redirigir al detalle de autorización o a la misma página mostrando el QR
@@ -149,108 +152,172 @@ class GenerarPDFView(LoginRequiredMixin, View):
             messages.error(request, 'No se puede generar PDF: autorización caducada')
             return redirect('formulario:generar_qr')
         
-        # Registrar descarga de PDF en historial
-        try:
+        # Historial y fecha de descarga se guardan juntos o ninguno
+        with transaction.atomic():
             HistorialAcciones.objects.create(
                 autorizacion=autorizacion,
                 creado_por=request.user,
                 accion='DESCARGAR_PDF',
                 descripcion=f'PDF descargado para placa {autorizacion.placa}'
             )
-        except Exception:
-            pass
-        
-        # Actualizar fecha de descarga PDF
-        autorizacion.fecha_descarga_pdf = timezone.now()
-        autorizacion.save()
+            autorizacion.fecha_descarga_pdf = timezone.now()
+            autorizacion.save()
         
         messages.success(request, 'PDF generado exitosamente')
         return redirect(request.GET.get('next', 'formulario:generar_qr')) 
 
+def responder_verificacion(request, template_name, qr, datos, error):
+    """
+    Página de verificación con ETag y Last-Modified: si el cliente o el proxy ya
+    tienen este resultado responde 304 sin renderizar. Anónimos: cacheable por
+    proxies hasta VERIFICACION_CACHE_MAX_AGE segundos (nunca más allá de la
+    medianoche); autenticados: privada y revalidada en cada escaneo.
+    """
+    registrar_escaneo(request, qr, datos, error)
+    if error is not None:
+        response = render(request, template_name, contexto_verificacion(qr, datos, error))
+        add_never_cache_headers(response)
+        return response
+
+    etag, modificada = validadores_verificacion(request, datos)
+    ultima_modificacion = int(modificada.timestamp()) if modificada else None
+    response = get_conditional_response(request, etag=etag, last_modified=ultima_modificacion)
+    if response is None:
+        response = render(request, template_name, contexto_verificacion(qr, datos, error))
+
+    response['ETag'] = etag
+    if ultima_modificacion is not None:
+        response['Last-Modified'] = http_date(ultima_modificacion)
+    if request.user.is_authenticated:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(
+            response, public=True, max_age=min(settings.VERIFICACION_CACHE_MAX_AGE, segundos_hasta_manana())
+        )
+    return response
+
+
+def demasiadas_verificaciones(espera):
+    """429 para quien excede VERIFICACION_LIMITE_IP o VERIFICACION_LIMITE_QR"""
+    response = HttpResponse(
+        'Demasiadas verificaciones. Intente nuevamente en unos segundos.',
+        status=429, content_type='text/plain; charset=utf-8'
+    )
+    response['Retry-After'] = str(espera)
+    add_never_cache_headers(response)
+    return response
+
+
 class VerificarQRView(View):
     """Vista para verificar QR cuando se escanea"""
     template_name = 'formulario/verificar_qr.html'
+    usar_replica = True  # pública y de solo lectura (ver routers.ReplicaRouter)
     
     def get(self, request):
-        # Parámetros de la URL (optimizados)
-        placa = request.GET.get('p') or request.GET.get('placa')
-        nombres = request.GET.get('n') or request.GET.get('nombre')
-        cedula = request.GET.get('ci') or request.GET.get('cedula')
-        ruc = request.GET.get('r') or request.GET.get('ruc')
-        numero_autorizacion = request.GET.get('a') or request.GET.get('autorizacion')
-        vigencia_str = request.GET.get('c') or request.GET.get('caducidad')
-        tipo_autorizacion_codigo = request.GET.get('ta') or request.GET.get('tipoAutorizacion')
-        
-        autorizacion_data = None
-        esta_caducada = False
-        mensaje = ''
-        
-        if all([placa, nombres, numero_autorizacion, vigencia_str]):
+        qr = parametros_qr(request.GET)
+        espera = limite_verificacion(request, qr)
+        if espera:
+            return demasiadas_verificaciones(espera)
+        datos = error = None
+        if qr_completo(qr):
             try:
-                # Buscar autorización
-                autorizacion = Autorizacion.objects.filter(
-                    placa=placa,
-                    numero_autorizacion=numero_autorizacion,
-                    activo=True
-                ).first()
-                
-                if autorizacion:
-                    # Verificar si está caducada
-                    esta_caducada = autorizacion.esta_caducada
-                    
-                    autorizacion_data = {
-                        'placa': autorizacion.placa,
-                        'nombres': autorizacion.usuario.nombres if autorizacion.usuario else nombres,
-                        'cedula': autorizacion.usuario.cedula if autorizacion.usuario else cedula or 'No disponible',
-                        'ruc': autorizacion.usuario.ruc if autorizacion.usuario else ruc or 'No disponible',
-                        'numero_autorizacion': autorizacion.numero_autorizacion,
-                        'tipo_autorizacion': autorizacion.get_tipo_autorizacion_display() if hasattr(autorizacion, 'get_tipo_autorizacion_display') else 'No disponible',
-                        'vigencia': autorizacion.vigencia,
-                        'esta_caducada': esta_caducada,
-                    }
-                    
-                    if esta_caducada:
-                        mensaje = '⚠️ AUTORIZACIÓN CADUCADA - Esta autorización ya no es válida'
-                    else:
-                        mensaje = f'✅ Autorización válida para placa: {placa}'
-                else:
-                    # Si no encuentra en BD, mostrar datos del QR
-                    from datetime import datetime
-                    try:
-                        vigencia = datetime.strptime(vigencia_str, '%Y-%m-%d').date()
-                        esta_caducada = validar_autorizacion_caducada(vigencia)
-                        
-                        autorizacion_data = {
-                            'placa': placa,
-                            'nombres': nombres,
-                            'cedula': cedula or 'No disponible',
-                            'ruc': ruc or 'No disponible',
-                            'numero_autorizacion': numero_autorizacion,
-                            'tipo_autorizacion': 'No disponible',
-                            'vigencia': vigencia,
-                            'esta_caducada': esta_caducada,
-                        }
-                        
-                        if esta_caducada:
-                            mensaje = '⚠️ AUTORIZACIÓN CADUCADA - Esta autorización ya no es válida'
-                        else:
-                            mensaje = f'✅ Autorización válida para placa: {placa}'
-                            
-                    except ValueError:
-                        mensaje = '❌ Error: Formato de fecha inválido'
+                datos = buscar_autorizacion(qr)
             except Exception as e:
-                mensaje = f'❌ Error al verificar autorización: {str(e)}'
-        else:
-            mensaje = '❌ Datos de autorización incompletos'
+                error = str(e)
         
-        context = {
-            'autorizacion_data': autorizacion_data,
-            'mensaje': mensaje,
-            'esta_caducada': esta_caducada,
-            'current_date': timezone.now().strftime('%d/%m/%Y, %H:%M'),
-        }
+        return responder_verificacion(request, self.template_name, qr, datos, error)
+
+
+class VerificarQRAsyncView(View):
+    """
+    VerificarQRView con ORM y caché asíncronos, para servir con ASGI
+    (VERIFICACION_ASINCRONA=True): la espera a la BD no ocupa un hilo.
+    """
+    template_name = 'formulario/verificar_qr.html'
+    usar_replica = True
+    
+    async def get(self, request):
+        qr = parametros_qr(request.GET)
+        espera = await alimite_verificacion(request, qr)
+        if espera:
+            return demasiadas_verificaciones(espera)
+        datos = error = None
+        if qr_completo(qr):
+            try:
+                datos = await abuscar_autorizacion(qr)
+            except Exception as e:
+                error = str(e)
         
-        return render(request, self.template_name, context)
+        # base.html usa request.user: cargarlo aquí evita la consulta síncrona al renderizar
+        request.user = await request.auser()
+        return responder_verificacion(request, self.template_name, qr, datos, error)
+
+
+class PaqueteOfflineView(LoginRequiredMixin, View):
+    """
+    Paquete firmado para verificar sin conexión (ver paquete_offline). Con
+    ?desde=<versión> envía el delta desde esa versión si todavía se conserva;
+    si no, el paquete completo más reciente.
+    """
+
+    def get(self, request):
+        disponibles = paquete_offline.versiones()
+        if not disponibles:
+            raise Http404('Todavía no se generó ningún paquete (generar_paquete_offline)')
+        version = disponibles[-1]
+        desde = request.GET.get('desde', '')
+
+        if desde == str(version):
+            response = HttpResponse(status=204)
+        else:
+            ruta = paquete_offline.ruta_completo(version)
+            if desde.isdigit() and int(desde) in disponibles:
+                ruta = paquete_offline.ruta_delta(int(desde), version)
+            etag = f'"{os.path.basename(ruta)}"'
+            if request.headers.get('If-None-Match') == etag:
+                response = HttpResponse(status=304)
+            else:
+                response = FileResponse(open(ruta, 'rb'), content_type='application/octet-stream',
+                                        as_attachment=True, filename=os.path.basename(ruta))
+            response['ETag'] = etag
+        response['X-Paquete-Version'] = str(version)
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
+class VerificacionLoteView(LoginRequiredMixin, View):
+    """
+    Verifica muchas placas o números de autorización en un request (hasta
+    VERIFICACION_LOTE_MAXIMO), con una consulta por cada VALORES_POR_CONSULTA
+    valores. Recibe JSON {"placas": [...], "numeros": [...]} o un formulario con
+    placas/numeros repetidos; con Accept: application/x-ndjson responde un
+    resultado por línea a medida que se consultan.
+    """
+
+    def post(self, request):
+        if request.content_type == 'application/json':
+            try:
+                datos = json.loads(request.body)
+                placas, numeros = datos.get('placas') or [], datos.get('numeros') or []
+            except (ValueError, AttributeError):
+                return JsonResponse({'error': 'JSON inválido'}, status=400)
+            if not isinstance(placas, list) or not isinstance(numeros, list):
+                return JsonResponse({'error': 'placas y numeros deben ser listas'}, status=400)
+        else:
+            placas, numeros = request.POST.getlist('placas'), request.POST.getlist('numeros')
+
+        if len(placas) + len(numeros) > settings.VERIFICACION_LOTE_MAXIMO:
+            return JsonResponse(
+                {'error': f'Máximo {settings.VERIFICACION_LOTE_MAXIMO} placas y números por request'}, status=400
+            )
+
+        resultados = verificar_lote(placas, numeros)
+        if 'application/x-ndjson' in request.headers.get('Accept', ''):
+            return StreamingHttpResponse(
+                (json.dumps(resultado, ensure_ascii=False) + '\n' for resultado in resultados),
+                content_type='application/x-ndjson'
+            )
+        return JsonResponse({'resultados': list(resultados)})
 
 # Vista para boton para visualizar y descargar como png el QR de autorizacion generado
 class MostrarQRView(LoginRequiredMixin, View):
@@ -289,20 +356,16 @@ class DescargarQRAutorizacionView(LoginRequiredMixin, View):
     def get(self, request, autorizacion_id):
         autorizacion = get_object_or_404(Autorizacion, id=autorizacion_id)
 
-        # Registrar descarga en historial
-        try:
+        # Historial y fecha de descarga se guardan juntos o ninguno
+        with transaction.atomic():
             HistorialAcciones.objects.create(
                 autorizacion=autorizacion,
                 creado_por=request.user,
                 accion='DESCARGAR_QR',
                 descripcion=f'QR descargado para placa {autorizacion.placa}'
             )
-        except Exception as e:
-            print(f'Error: {e}') # 
-        
-        # Actualizar fecha de descarga
-        autorizacion.fecha_descarga_qr = timezone.now()
-        autorizacion.save()
+            autorizacion.fecha_descarga_qr = timezone.now()
+            autorizacion.save()
         
         messages.success(request, 'QR descargado exitosamente')
         return redirect('formulario:mostrar_qr', autorizacion_id=autorizacion_id)
@@ -313,20 +376,16 @@ class DescargarPDFAutorizacionView(LoginRequiredMixin, View):
     def get(self, request, autorizacion_id):
         autorizacion = get_object_or_404(Autorizacion, id=autorizacion_id)
         
-        # Registrar descarga de PDF en historial
-        try:
+        # Historial y fecha de descarga se guardan juntos o ninguno
+        with transaction.atomic():
             HistorialAcciones.objects.create(
                 autorizacion=autorizacion,
                 creado_por=request.user,
                 accion='DESCARGAR_PDF',
                 descripcion=f'PDF descargado para placa {autorizacion.placa}'
             )
-        except Exception as e:
-            print(f'Error: {e}')
-        
-        # Actualizar fecha de descarga PDF
-        autorizacion.fecha_descarga_pdf = timezone.now()
-        autorizacion.save()
+            autorizacion.fecha_descarga_pdf = timezone.now()
+            autorizacion.save()
         
         # Preparar datos para la plantilla
         context = {
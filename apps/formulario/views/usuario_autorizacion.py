@@ -3,8 +3,9 @@ from django.views.generic import ListView, DetailView, CreateView, UpdateView, D
 from apps.formulario.models import UsuarioAutorizacion, HistorialAcciones
 from apps.formulario.form import UsuarioAutorizacionForm
 from django.urls import reverse_lazy
-from django.db.models import Q
+from django.db.models import Count, Q
 from django.contrib import messages
+from django.db import transaction
 from django.utils import timezone
 import threading
 
@@ -37,7 +38,10 @@ class UsuarioAutorizacionListView(LoginRequiredMixin, ListView):
     paginate_by = 20
     
     def get_queryset(self):
-        queryset = super().get_queryset().select_related('creado_por')
+        # num_autorizaciones evita un COUNT por fila en la plantilla
+        queryset = super().get_queryset().select_related('creado_por').annotate(
+            num_autorizaciones=Count('autorizaciones')
+        )
         
         # Búsqueda
         search = self.request.GET.get('search')
@@ -106,6 +110,7 @@ class UsuarioAutorizacionUpdateView(LoginRequiredMixin, PermissionRequiredMixin,
     def get_success_url(self):
         return reverse_lazy('formulario:usuario_detail', kwargs={'pk': self.object.pk})
     
+    @transaction.atomic
     def form_valid(self, form):
         messages.success(self.request, 'Usuario actualizado exitosamente')
 
@@ -146,6 +151,11 @@ class UsuarioAutorizacionDeleteView(LoginRequiredMixin, PermissionRequiredMixin,
         context['autorizaciones_count'] = self.object.autorizaciones.count()
         return context
     
+    @transaction.atomic
+    def form_valid(self, form):
+        return super().form_valid(form)
+    
+    @transaction.atomic
     def delete(self, request, *args, **kwargs):
         usuario = self.get_object()
         usuario_key = ("usuario", usuario.pk)
@@ -0,0 +1,60 @@
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+# Clave interna de la sesión con el timestamp de la última renovación
+CLAVE_RENOVACION = '_renovada_en'
+
+
+class SesionDeslizanteMiddleware:
+    """
+    Expiración deslizante sin escribir la sesión en cada request.
+
+    Reemplaza a SESSION_SAVE_EVERY_REQUEST: la sesión (y su cookie) solo se
+    vuelve a guardar cuando pasaron SESSION_RENOVAR_CADA segundos desde la
+    última renovación, por lo que la expiración avanza de a saltos y la
+    inactividad máxima queda entre SESSION_COOKIE_AGE - SESSION_RENOVAR_CADA
+    y SESSION_COOKIE_AGE. Debe ir después de SessionMiddleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.asincrono = iscoroutinefunction(get_response)
+        if self.asincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.asincrono:
+            return self.__acall__(request)
+        response = self.get_response(request)
+
+        session = getattr(request, 'session', None)
+        if session is None or session.is_empty():
+            return response
+
+        ahora = int(time.time())
+        if session.modified:
+            # Ya se va a guardar (p. ej. login): registrar la renovación no cuesta una escritura extra
+            session[CLAVE_RENOVACION] = ahora
+        elif session.keys() and ahora - session.get(CLAVE_RENOVACION, 0) >= settings.SESSION_RENOVAR_CADA:
+            session[CLAVE_RENOVACION] = ahora
+
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+
+        session = getattr(request, 'session', None)
+        if session is None or session.is_empty():
+            return response
+
+        # Misma lógica que __call__ con la API asíncrona de la sesión (puede no estar cargada)
+        ahora = int(time.time())
+        if session.modified:
+            await session.aset(CLAVE_RENOVACION, ahora)
+        elif await session.akeys() and ahora - await session.aget(CLAVE_RENOVACION, 0) >= settings.SESSION_RENOVAR_CADA:
+            await session.aset(CLAVE_RENOVACION, ahora)
+
+        return response
@@ -1,3 +1,73 @@
-from django.test import TestCase
+"""
+Tests para la aplicación de seguridad
+"""
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
 
-# Create your tests here.
+from apps.security.middleware import CLAVE_RENOVACION
+
+User = get_user_model()
+
+
+# ============================================================================
+# TESTS DE SESIÓN
+# ============================================================================
+
+@override_settings(
+    SESSION_ENGINE='django.contrib.sessions.backends.db',
+    SESSION_RENOVAR_CADA=300
+)
+class SesionDeslizanteMiddlewareTest(TestCase):
+    """Tests de la expiración deslizante sin escritura en cada request"""
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username='testuser',
+            email='test@example.com',
+            password='testpass123',
+            names='Usuario de Prueba'
+        )
+        self.client.login(username='testuser', password='testpass123')
+        self.url = reverse('formulario:dashboard')
+
+    def _expiracion(self):
+        return Session.objects.get(session_key=self.client.session.session_key).expire_date
+
+    def _get(self, ahora):
+        with mock.patch('apps.security.middleware.time.time', return_value=ahora):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_no_guarda_sesion_en_cada_request(self):
+        """Test que requests seguidos no vuelven a escribir la sesión"""
+        self._get(1_000_000)
+        expiracion = self._expiracion()
+
+        for segundos in (10, 60, 299):
+            response = self._get(1_000_000 + segundos)
+            self.assertNotIn('sessionid', response.cookies)
+
+        self.assertEqual(self._expiracion(), expiracion)
+
+    def test_renueva_sesion_pasado_el_umbral(self):
+        """Test que la sesión se renueva cuando la expiración avanza lo suficiente"""
+        self._get(1_000_000)
+
+        response = self._get(1_000_000 + 300)
+
+        self.assertIn('sessionid', response.cookies)
+        self.assertEqual(response.cookies['sessionid']['max-age'], 3600)
+        self.assertEqual(self.client.session[CLAVE_RENOVACION], 1_000_000 + 300)
+
+    def test_anonimo_no_crea_sesion(self):
+        """Test que un visitante anónimo no genera sesión"""
+        anonimo = Client()
+        response = anonimo.get(reverse('security:login'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('sessionid', response.cookies)
@@ -9,7 +9,10 @@ https://docs.djangoproject.com/en/5.2/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
+import importlib.util
 import os
+from urllib.parse import urlsplit
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 from pathlib import Path
 
@@ -62,17 +65,70 @@ CRISPY_ALLOWED_TEMPLATE_PACKS = 'bootstrap5'
 CRISPY_TEMPLATE_PACK = 'bootstrap5'
 
 MIDDLEWARE = [
+    'apps.formulario.middleware.InstrumentacionMiddleware',
+    'apps.formulario.consultas_lentas.ConsultasLentasMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'apps.security.middleware.SesionDeslizanteMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'apps.formulario.routers.ReplicaMiddleware',
+    'apps.formulario.middleware.PerfilamientoMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
 
+# Instrumentación por request (consultas, tiempo de BD, render y total)
+# INSTRUMENTACION_MUESTREO: fracción de requests medidos (1.0 = todos)
+INSTRUMENTACION_ACTIVA = os.environ.get('INSTRUMENTACION_ACTIVA', 'True') == 'True'
+INSTRUMENTACION_MUESTREO = float(os.environ.get('INSTRUMENTACION_MUESTREO', '1.0'))
+INSTRUMENTACION_VENTANA = 500  # mediciones recientes por URL para los percentiles
+# Cabecera Server-Timing para todos los clientes; por defecto solo para staff
+INSTRUMENTACION_SERVER_TIMING = os.environ.get('INSTRUMENTACION_SERVER_TIMING', 'False') == 'True'
+
+# Registro de consultas lentas (0 = desactivado). Con CONSULTAS_LENTAS_EXPLAIN se
+# guarda además el plan (EXPLAIN (ANALYZE, BUFFERS) en PostgreSQL): ANALYZE vuelve
+# a ejecutar la consulta, activarlo solo mientras se investiga.
+# Resumen: python manage.py resumen_consultas_lentas
+CONSULTAS_LENTAS_UMBRAL_MS = float(os.environ.get('CONSULTAS_LENTAS_UMBRAL_MS', '200'))
+CONSULTAS_LENTAS_EXPLAIN = os.environ.get('CONSULTAS_LENTAS_EXPLAIN', 'False') == 'True'
+CONSULTAS_LENTAS_ARCHIVO = os.environ.get('CONSULTAS_LENTAS_ARCHIVO', os.path.join(BASE_DIR, 'logs', 'consultas_lentas.jsonl'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'mensaje': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+        'consultas_lentas': {
+            'class': 'apps.formulario.consultas_lentas.ArchivoConsultasLentas',
+            'filename': CONSULTAS_LENTAS_ARCHIVO,
+            'formatter': 'mensaje',
+            'delay': True,
+        },
+    },
+    'loggers': {
+        'apps.formulario.instrumentacion': {
+            'handlers': ['console'],
+            # En desarrollo (DEBUG) no se imprime una línea por request salvo que se pida
+            'level': os.environ.get('INSTRUMENTACION_LOG_LEVEL', 'WARNING' if DEBUG else 'INFO'),
+            'propagate': False,
+        },
+        'apps.formulario.consultas_lentas': {
+            'handlers': ['consultas_lentas'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -102,11 +158,177 @@ DATABASES = {
         'PASSWORD': os.environ.get("DB_PASSWORD", ""),
         'HOST': os.environ.get("DB_HOST", ""),
         'PORT': os.environ.get("DB_PORT", "5432"),
-        'ATOMIC_REQUESTS': True
+        # Sin transacción por request: las unidades de varias escrituras usan
+        # transaction.atomic explícito (generar QR, eliminaciones en cascada, cargas)
+        'ATOMIC_REQUESTS': False,
+        # Conexiones persistentes: segundos que se reutiliza una conexión (0 = cerrar en cada request)
+        'CONN_MAX_AGE': int(os.environ.get("DB_CONN_MAX_AGE", "60")),
+        # Verifica que la conexión reutilizada siga viva antes del primer query del request
+        'CONN_HEALTH_CHECKS': os.environ.get("DB_CONN_HEALTH_CHECKS", "True") == "True",
+        'OPTIONS': {},
+    }
+}
+
+# Pool de conexiones de psycopg 3 (requiere: pip install "psycopg[binary,pool]").
+# Es incompatible con CONN_MAX_AGE: el pool ya mantiene las conexiones abiertas.
+if os.environ.get("DB_POOL", "False") == "True" and 'postgresql' in DATABASES['default']['ENGINE']:
+    # requirements.txt instala psycopg2, que no tiene pool: fallar aquí con la causa
+    if not (importlib.util.find_spec('psycopg') and importlib.util.find_spec('psycopg_pool')):
+        raise ImproperlyConfigured('DB_POOL=True requiere psycopg 3 con pool: pip install "psycopg[binary,pool]"')
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(os.environ.get("DB_POOL_MIN_SIZE", "2")),
+        'max_size': int(os.environ.get("DB_POOL_MAX_SIZE", "10")),
+        'timeout': int(os.environ.get("DB_POOL_TIMEOUT", "10")),
+    }
+
+# Réplicas de lectura: DB_REPLICAS="host1:5432,host2:5432" (mismas credenciales que default).
+# Las vistas con usar_replica = True (reportes y verificación de QR) leen de una réplica
+# cuyo retraso no supere DB_REPLICA_RETRASO_MAXIMO segundos; si no hay, de default.
+# Después de escribir, el navegador queda fijado a default DB_REPLICA_FIJAR_PRIMARIA segundos.
+DB_REPLICAS = []
+for _numero, _servidor in enumerate(filter(None, os.environ.get("DB_REPLICAS", "").split(',')), 1):
+    _host, _, _puerto = _servidor.strip().partition(':')
+    DATABASES[f'replica_{_numero}'] = {
+        **DATABASES['default'],
+        'HOST': _host,
+        'PORT': _puerto or DATABASES['default']['PORT'],
+        'OPTIONS': dict(DATABASES['default']['OPTIONS']),
+        'TEST': {'MIRROR': 'default'},
     }
+    DB_REPLICAS.append(f'replica_{_numero}')
+
+DATABASE_ROUTERS = ['apps.formulario.routers.ReplicaRouter'] if DB_REPLICAS else []
+DB_REPLICA_RETRASO_MAXIMO = float(os.environ.get("DB_REPLICA_RETRASO_MAXIMO", "5"))
+DB_REPLICA_INTERVALO_CHEQUEO = float(os.environ.get("DB_REPLICA_INTERVALO_CHEQUEO", "10"))
+DB_REPLICA_FIJAR_PRIMARIA = int(os.environ.get("DB_REPLICA_FIJAR_PRIMARIA", "10"))
+
+
+# Caché
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+#
+# CACHE_BACKEND selecciona el almacenamiento:
+#   locmem -> memoria local de cada proceso (por defecto, desarrollo)
+#   file   -> archivos en CACHE_DIR, compartido por los workers de un mismo servidor
+#   redis  -> servidor Redis (o compatible) en CACHE_REDIS_URL; requiere el paquete redis.
+#             Si no está instalado se usa file.
+# Cada alias es un espacio de nombres con su propio tiempo de vida y límite de entradas.
+# En locmem/file el límite se aplica con MAX_ENTRIES/CULL_FREQUENCY (locmem descarta por LRU);
+# en Redis la expulsión la decide el servidor (maxmemory-policy) y cada alias usa su propia
+# base de datos a partir de la de CACHE_REDIS_URL (1..7 con la URL por defecto): clear()
+# ejecuta FLUSHDB, y con una base compartida borraría también sesiones y límites.
+
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+CACHE_DIR = os.environ.get('CACHE_DIR', os.path.join(BASE_DIR, 'cache'))
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', 'redis://127.0.0.1:6379/1')
+
+if CACHE_BACKEND == 'redis':
+    try:
+        import redis  # noqa: F401
+    except ImportError:
+        CACHE_BACKEND = 'file'
+
+# alias: (TIMEOUT en segundos, MAX_ENTRIES)
+CACHE_ESPACIOS = {
+    'default': (300, 1000),
+    'verificacion': (300, 10000),   # resultados de verificación de QR
+    'dashboard': (60, 100),         # estadísticas del dashboard
+    'qr': (86400, 2000),            # imágenes QR renderizadas
+    'fragmentos': (600, 1000),      # fragmentos de plantillas ({% cache %})
+    'limites': (120, 50000),        # contadores de límites de frecuencia
+    'sesiones': (3600, 10000),      # SESSION_BACKEND cache o cached_db
 }
 
 
+def _configurar_cache(alias, timeout, max_entries, indice):
+    if CACHE_BACKEND == 'redis':
+        url = urlsplit(CACHE_REDIS_URL)
+        base = int(url.path.strip('/') or 0)
+        return {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': url._replace(path=f'/{base + indice}').geturl(),
+            'TIMEOUT': timeout,
+            'KEY_PREFIX': alias,
+        }
+    if CACHE_BACKEND == 'file':
+        return {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(CACHE_DIR, alias),
+            'TIMEOUT': timeout,
+            'OPTIONS': {'MAX_ENTRIES': max_entries, 'CULL_FREQUENCY': 4},
+        }
+    return {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': alias,
+        'TIMEOUT': timeout,
+        'OPTIONS': {'MAX_ENTRIES': max_entries, 'CULL_FREQUENCY': 4},
+    }
+
+
+CACHES = {
+    alias: _configurar_cache(alias, timeout, max_entries, indice)
+    for indice, (alias, (timeout, max_entries)) in enumerate(CACHE_ESPACIOS.items())
+}
+
+# verificar_qr con VerificarQRAsyncView (ORM y caché asíncronos). Solo conviene
+# servido con ASGI (config.asgi); con WSGI cada request crea su propio event loop.
+VERIFICACION_ASINCRONA = os.environ.get('VERIFICACION_ASINCRONA', 'False') == 'True'
+
+# Segundos que un proxy o CDN puede servir la página de verificación de un
+# anónimo sin revalidar (ETag/Last-Modified; nunca pasa de la medianoche)
+VERIFICACION_CACHE_MAX_AGE = int(os.environ.get('VERIFICACION_CACHE_MAX_AGE', '300'))
+
+# Límites de verificar_qr: requests por VERIFICACION_LIMITE_VENTANA segundos por IP
+# del cliente y por QR (0 = sin límite, el valor por defecto). Detrás de un proxy
+# configurar PROXIES_CONFIABLES antes de activar el límite por IP: si no, todos
+# los clientes comparten la IP del proxy. Los no encontrados se recuerdan
+# VERIFICACION_CACHE_NEGATIVO segundos sin volver a consultar la BD.
+VERIFICACION_LIMITE_IP = int(os.environ.get('VERIFICACION_LIMITE_IP', '0'))
+VERIFICACION_LIMITE_QR = int(os.environ.get('VERIFICACION_LIMITE_QR', '0'))
+VERIFICACION_LIMITE_VENTANA = int(os.environ.get('VERIFICACION_LIMITE_VENTANA', '60'))
+VERIFICACION_CACHE_NEGATIVO = int(os.environ.get('VERIFICACION_CACHE_NEGATIVO', '60'))
+# Proxies propios delante de Django (X-Forwarded-For); 0 = usar REMOTE_ADDR
+PROXIES_CONFIABLES = int(os.environ.get('PROXIES_CONFIABLES', '0'))
+
+# Escaneos de verificar_qr: buffer en memoria por proceso (eventos), lote que
+# dispara la escritura, segundos máximos entre escrituras y días que se
+# conservan los eventos después de resumirlos (resumir_escaneos)
+ESCANEOS_ACTIVO = os.environ.get('ESCANEOS_ACTIVO', 'True') == 'True'
+ESCANEOS_BUFFER = int(os.environ.get('ESCANEOS_BUFFER', '10000'))
+ESCANEOS_LOTE = int(os.environ.get('ESCANEOS_LOTE', '500'))
+ESCANEOS_INTERVALO = float(os.environ.get('ESCANEOS_INTERVALO', '5'))
+ESCANEOS_RETENCION_DIAS = int(os.environ.get('ESCANEOS_RETENCION_DIAS', '90'))
+
+# Máximo de placas y números por request en la verificación por lote
+VERIFICACION_LOTE_MAXIMO = int(os.environ.get('VERIFICACION_LOTE_MAXIMO', '5000'))
+
+# Paquetes de verificación sin conexión (generar_paquete_offline): directorio,
+# versiones conservadas para ofrecer deltas y clave privada Ed25519 (PEM) con la
+# que se firman; se crea con clave_paquete_offline y no sale del servidor
+PAQUETE_OFFLINE_DIR = os.environ.get('PAQUETE_OFFLINE_DIR', os.path.join(BASE_DIR, 'paquetes_offline'))
+PAQUETE_OFFLINE_CONSERVAR = int(os.environ.get('PAQUETE_OFFLINE_CONSERVAR', '14'))
+PAQUETE_OFFLINE_CLAVE_PRIVADA = os.environ.get(
+    'PAQUETE_OFFLINE_CLAVE_PRIVADA', os.path.join(BASE_DIR, 'claves', 'paquete_offline.pem')
+)
+
+# Correo. Por defecto cada corrida se escribe en un archivo de EMAIL_FILE_PATH
+# (sustituto local del SMTP); en producción usar el backend smtp
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.filebased.EmailBackend')
+EMAIL_FILE_PATH = os.environ.get('EMAIL_FILE_PATH', os.path.join(BASE_DIR, 'correos'))
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', '25'))
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', 'False') == 'True'
+EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
+EMAIL_TIMEOUT = int(os.environ.get('EMAIL_TIMEOUT', '30'))
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'webmaster@localhost')
+
+# Recordatorios de vencimiento (enviar_recordatorios): días de anticipación con
+# que se avisa a los titulares y autorizaciones leídas por consulta
+RECORDATORIOS_DIAS = [int(dias) for dias in os.environ.get('RECORDATORIOS_DIAS', '30,7,1').split(',')]
+RECORDATORIOS_LOTE = int(os.environ.get('RECORDATORIOS_LOTE', '500'))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -147,6 +369,13 @@ STATICFILES_DIRS = (os.path.join(BASE_DIR, 'static'),)
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# Perfilamiento bajo demanda: un usuario staff agrega ?_perfil=1 (o la cabecera
+# X-Perfil: 1) y el request se perfila con pyinstrument (o cProfile si no está
+# instalado). Los perfiles se listan en /admin/perfiles/
+PERFILAMIENTO_ACTIVO = os.environ.get('PERFILAMIENTO_ACTIVO', 'False') == 'True'
+PERFILAMIENTO_DIR = os.path.join(MEDIA_ROOT, 'profiles')
+PERFILAMIENTO_MAXIMO = 200  # perfiles conservados; se borran los más antiguos
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -163,5 +392,33 @@ AUTHENTICATION_BACKENDS = [
 ]
 
 # Configuración de sesión
+# SESSION_BACKEND: db (por defecto), cached_db, cache o signed_cookies
+SESSION_ENGINE = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}[os.environ.get('SESSION_BACKEND', 'db')]
+SESSION_CACHE_ALIAS = 'sesiones'  # backends cache y cached_db
+# Con locmem cada worker tiene su propia memoria: las sesiones solo en caché se
+# perderían al pasar de un worker a otro
+if SESSION_ENGINE == 'django.contrib.sessions.backends.cache' and CACHE_BACKEND == 'locmem':
+    raise ImproperlyConfigured(
+        'SESSION_BACKEND=cache requiere CACHE_BACKEND=redis o file; con locmem usar db o cached_db'
+    )
 SESSION_COOKIE_AGE = 3600  # 1 hora en segundos
-SESSION_SAVE_EVERY_REQUEST = True
\ No newline at end of file
+# La expiración deslizante la maneja SesionDeslizanteMiddleware: solo guarda la
+# sesión cuando pasaron SESSION_RENOVAR_CADA segundos desde la última renovación
+SESSION_SAVE_EVERY_REQUEST = False
+SESSION_RENOVAR_CADA = int(os.environ.get('SESSION_RENOVAR_CADA', '300'))
+
+# Historial de autorizaciones: guardar snapshot (placa, nombres, tipo, número, vigencia)
+# al emitir y leer los reportes solo de esa tabla. Paso obligatorio antes de activarlo
+# en una base existente (y si estuvo desactivado un tiempo), después de migrate:
+# python manage.py rellenar_snapshot_historial. Los filtros y exportaciones solo
+# ven las columnas snapshot; la lista muestra los registros sin rellenar con una
+# consulta extra por página.
+FORMULARIO_HISTORIAL_SNAPSHOT = os.environ.get('HISTORIAL_SNAPSHOT', 'False') == 'True'
+
+# Los índices con INCLUDE solo aplican en PostgreSQL; en SQLite (tests) se crean sin esas columnas
+SILENCED_SYSTEM_CHECKS = ['models.W040']
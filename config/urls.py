@@ -18,8 +18,12 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from apps.formulario.admin import perfiles_index, perfil_archivo
 
 urlpatterns = [
+    # Antes de admin.site.urls: el admin tiene una vista comodín para rutas desconocidas
+    path('admin/perfiles/', admin.site.admin_view(perfiles_index), name='perfiles_index'),
+    path('admin/perfiles/<str:nombre>', admin.site.admin_view(perfil_archivo), name='perfil_archivo'),
     path('admin/', admin.site.urls),
     path('', include('apps.formulario.urls', namespace='formulario')),
     path('security/', include('apps.security.urls', namespace='security')),